@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+"""
+Compare the decompression backends of snptk.compress.open_compressed() (see --decompress) reading gzip and bz2
+files, both raw (decompression only) and parsed by load_dbsnp_by_snp_id (decompression overlapping parsing):
+
+    python benchmarks/bench_decompress.py --size 10M
+
+Inputs are the SNPChrPosOnRef file of a synthetic dataset (see synthetic.py) and a bz2 copy of it, results are
+appended to the history file of bench_mapping.py.
+"""
+
+import argparse
+import bz2
+import gzip
+import json
+import os
+import platform
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import snptk.compress
+import snptk.core
+
+import bench_mapping
+import synthetic
+
+def bz2_copy(fname):
+    """
+    Return the path of a bz2 copy of the gzip file fname, created the first time.
+    """
+
+    output_fname = os.path.splitext(fname)[0] + ".bz2"
+
+    if not os.path.exists(output_fname):
+        with gzip.open(fname, "rb") as f_in, bz2.open(output_fname + ".tmp", "wb", compresslevel=1) as f_out:
+            shutil.copyfileobj(f_in, f_out, snptk.compress.READ_SIZE)
+
+        os.replace(output_fname + ".tmp", output_fname)
+
+    return output_fname
+
+
+def read_raw(fname):
+    size = 0
+
+    with snptk.compress.open_compressed(fname, "rb") as f:
+        for data in snptk.compress.read_blocks(f):
+            size += len(data)
+
+    return size
+
+
+def parse(fname, snp_ids):
+    return len(snptk.core.load_dbsnp_by_snp_id(fname, snp_ids, 1))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog=os.path.basename(__file__), description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--size", default="1M", help="SNPChrPosOnRef rows: 1M, 10M, 100M or a number (default: 1M)")
+    parser.add_argument("--backends", nargs="+", choices=snptk.compress.BACKENDS, default=snptk.compress.BACKENDS)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "snptk-bench"), help="Where datasets are generated and kept for later runs")
+    parser.add_argument("--history", default=os.path.join(os.path.dirname(__file__), "history.jsonl"), help="JSONL file results are appended to")
+    parser.add_argument("--repeat", type=int, default=3, help="Report the best of this many runs")
+
+    args = parser.parse_args(argv)
+
+    rows = synthetic.parse_size(args.size)
+    dataset = synthetic.generate(os.path.join(args.data_dir, f"{args.size}-default"), rows)
+    snp_ids = set(snptk.core.load_bim(dataset.bim).snp_keys())
+
+    commit = bench_mapping.git_commit()
+
+    print(f"{'input':<10} {'mode':<6} {'backend':<10} {'tool':<14} {'wall (s)':>10} {'cpu (s)':>10} {'MiB/s':>10}")
+
+    for fname in (dataset.dbsnp, bz2_copy(dataset.dbsnp)):
+        codec = snptk.compress.codec(fname)
+        size = read_raw(fname)
+
+        for mode, func, func_args in (("raw", read_raw, (fname,)), ("parse", parse, (fname, snp_ids))):
+            for backend in args.backends:
+                snptk.compress.set_backend(backend)
+
+                command = snptk.compress.external_tool(codec, parallel_only=backend == "auto") if backend in ("auto", "external") else None
+                tool = command[0] if command else "-"
+
+                best = None
+
+                for _ in range(args.repeat):
+                    started, cpu_started = time.perf_counter(), time.process_time()
+                    children_started = os.times()
+
+                    func(*func_args)
+
+                    children = os.times()
+                    wall = time.perf_counter() - started
+                    cpu = time.process_time() - cpu_started + (children.children_user + children.children_system) - (children_started.children_user + children_started.children_system)
+
+                    if best is None or wall < best[0]:
+                        best = wall, cpu
+
+                wall, cpu = best
+
+                print(f"{codec:<10} {mode:<6} {backend:<10} {tool:<14} {wall:>10.3f} {cpu:>10.3f} {size / wall / 2**20:>10.1f}", flush=True)
+
+                record = {
+                    "timestamp": time.strftime("%FT%TZ", time.gmtime()),
+                    "commit": commit,
+                    "host": socket.gethostname(),
+                    "python": platform.python_version(),
+                    "cpus": os.cpu_count(),
+                    "case": f"decompress-{mode}",
+                    "rows": rows,
+                    "layout": codec,
+                    "jobs": 1,
+                    "backend": backend,
+                    "tool": tool,
+                    "wall_s": round(wall, 3),
+                    "cpu_s": round(cpu, 3),
+                    "mb_per_s": round(size / wall / 2**20, 1)}
+
+                with open(args.history, "a") as f:
+                    print(json.dumps(record), file=f)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
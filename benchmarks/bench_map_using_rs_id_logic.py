@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+"""
+Compare snptk.app.map_using_rs_id_logic() with the original quadratic implementation on strings:
+
+- identical output (as written to the map files) on the cases of tests/test_snptk_app.py
+- identical output and run time on synthetic snp maps of increasing size
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import snptk.app
+import snptk.keys
+
+# (snp_map, dbsnp, unmappable_snps) from TestSnpTkAppUpdateLogicUpdateSnpIdAndPosition
+CASES = [
+    ([("rs123", "6:123", "rs456")], {"rs456": "6:123"}, set()),
+    ([("rs123", "6:123", "rs456")], {"rs456": "7:123"}, set()),
+    ([("rs123", "6:123", "rs123")], {}, set()),
+    ([("rs123", "6:123", "rs123")], {"rs123": "7:456"}, set()),
+    ([("rs123", "6:123", "rs456"), ("rs456", "6:123", "rs456")], {"rs123": "7:456", "rs456": "6:123"}, set()),
+    ([("rs123", "6:123", "rs456"), ("rs456", "6:123", "rs456")], {"rs123": "7:456", "rs456": "6:1000"}, set()),
+    ([("rs456", "6:123", "rs456")], {"rs123": "7:456"}, {"rs456"}),
+    ([("rs456", "6:123", "rs789")], {"rs123": "7:456"}, {"rs789"}),
+    ([("rs123", "6:222", "rs789"), ("rs456", "6:123", "rs789")], {"rs123": "6:222", "rs456": "6:123", "rs789": "6:333"}, set()),
+]
+
+
+def map_using_rs_id_logic_reference(snp_map, dbsnp, unmappable_snps):
+    """
+    The baseline implementation of map_using_rs_id_logic() (O(n^2) in the number of merged snps).
+    """
+
+    snps_to_delete = []
+    snps_to_update = []
+    coords_to_update = []
+    chromosomes_to_update = []
+
+    snps_already_updated = set()
+
+    for snp_id, original_coord, snp_id_new in snp_map:
+        if snp_id_new != snp_id:
+            if snp_id_new in [snp[0] for snp in snp_map]:
+                snps_to_delete.append(snp_id)
+
+            elif snp_id_new in dbsnp:
+                if snp_id_new in snps_already_updated:
+                    snps_to_delete.append(snp_id)
+                    continue
+
+                snps_to_update.append((snp_id, snp_id_new))
+                snps_already_updated.add(snp_id_new)
+
+                new_chromosome, new_position = dbsnp[snp_id_new].split(":")
+                original_chromosome, original_position = original_coord.split(":")
+
+                if new_position != original_position:
+                    coords_to_update.append((snp_id_new, new_position))
+
+                if new_chromosome != original_chromosome:
+                    chromosomes_to_update.append((snp_id_new, new_chromosome))
+
+            elif snp_id_new in unmappable_snps:
+                if snp_id_new in snps_already_updated:
+                    snps_to_delete.append(snp_id)
+                    continue
+
+                snps_to_update.append((snp_id, snp_id_new))
+                snps_already_updated.add(snp_id_new)
+
+            else:
+                snps_to_delete.append(snp_id)
+
+        else:
+            if snp_id in dbsnp:
+                new_chromosome, new_position = dbsnp[snp_id].split(":")
+                original_chromosome, original_position = original_coord.split(":")
+
+                if new_position != original_position:
+                    coords_to_update.append((snp_id, new_position))
+
+                if new_chromosome != original_chromosome:
+                    chromosomes_to_update.append((snp_id, new_chromosome))
+
+            elif snp_id in unmappable_snps:
+                pass
+
+            else:
+                snps_to_delete.append(snp_id)
+
+    return snps_to_delete, snps_to_update, coords_to_update, chromosomes_to_update
+
+
+def key_case(snp_map, dbsnp, unmappable_snps):
+    """
+    Return a case of strings with keys (see snptk.keys) as passed by snptk.app.map_using_rs_id().
+    """
+
+    rsid_key, parse_coordinate = snptk.keys.rsid_key, snptk.keys.parse_coordinate
+
+    return (
+        [(rsid_key(snp_id), parse_coordinate(coord), rsid_key(snp_id_new)) for snp_id, coord, snp_id_new in snp_map],
+        {rsid_key(snp_id): parse_coordinate(coord) for snp_id, coord in dbsnp.items()},
+        set(map(rsid_key, unmappable_snps)))
+
+
+def same_output(current, reference):
+    """
+    Return True if the map entries of the current implementation (keys) format to those of the reference.
+    """
+
+    return [snptk.app.format_map(entries, formats) for entries, formats in zip(current, snptk.app.RS_ID_MAP_FORMATS)] == [snptk.app.format_map(entries) for entries in reference]
+
+
+def synthetic_case(n, merged_fraction=0.2, seed=1):
+    """
+    Build a snp map of n variants where merged_fraction of them are merged into another rsid, some of which
+    collide with original ids or with each other, plus a dbsnp/unmappable subset.
+    """
+
+    rng = random.Random(seed)
+
+    snp_map = []
+    dbsnp = {}
+    unmappable_snps = set()
+
+    for i in range(n):
+        snp_id = f"rs{i + 1}"
+        coord = f"{rng.randint(1, 22)}:{rng.randint(1, 10**8)}"
+
+        if rng.random() < merged_fraction:
+            snp_id_new = f"rs{rng.randint(1, 2 * n)}"
+        else:
+            snp_id_new = snp_id
+
+        snp_map.append((snp_id, coord, snp_id_new))
+
+        r = rng.random()
+
+        if r < 0.8:
+            dbsnp[snp_id_new] = coord if rng.random() < 0.7 else f"{rng.randint(1, 22)}:{rng.randint(1, 10**8)}"
+        elif r < 0.85:
+            unmappable_snps.add(snp_id_new)
+
+    return snp_map, dbsnp, unmappable_snps
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog=os.path.basename(__file__), description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--reference-max-size", type=int, default=50000, help="Do not run the reference implementation above this size")
+
+    args = parser.parse_args(argv)
+
+    for n, case in enumerate(CASES):
+        if not same_output(snptk.app.map_using_rs_id_logic(*key_case(*case)), map_using_rs_id_logic_reference(*case)):
+            print(f"unit test case {n}: output differs", file=sys.stderr)
+            sys.exit(1)
+
+    print(f"unit test cases: {len(CASES)} identical")
+
+    print(f"{'variants':>10} {'reference (s)':>14} {'current (s)':>12} {'speedup':>8}")
+
+    for size in args.sizes:
+        case = synthetic_case(size)
+        keys = key_case(*case)
+
+        t = time.perf_counter()
+        current = snptk.app.map_using_rs_id_logic(*keys)
+        current_time = time.perf_counter() - t
+
+        if size > args.reference_max_size:
+            print(f"{size:>10} {'-':>14} {current_time:>12.3f} {'-':>8}")
+            continue
+
+        t = time.perf_counter()
+        reference = map_using_rs_id_logic_reference(*case)
+        reference_time = time.perf_counter() - t
+
+        if not same_output(current, reference):
+            print(f"synthetic case of {size} variants: output differs", file=sys.stderr)
+            sys.exit(1)
+
+        print(f"{size:>10} {reference_time:>14.3f} {current_time:>12.3f} {reference_time / current_time:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+"""
+Time the loaders, execute_load, map-using-rs-id and map-using-coord end to end on synthetic datasets
+(see synthetic.py) and append throughput and peak memory to a JSONL history file:
+
+    python benchmarks/bench_mapping.py --sizes 1M 10M --layouts file split bgzf
+
+Every case runs in a fresh process so its peak RSS is its own. Each history record carries the git commit,
+so runs of the same case/size/layout/jobs can be compared between commits (--compare).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import snptk.app
+import snptk.core
+import snptk.metrics
+
+import synthetic
+
+CASES = ["load_dbsnp_by_snp_id", "load_dbsnp_by_coordinate", "load_refsnp_merged", "execute_load", "map-using-rs-id", "map-using-coord"]
+
+LAYOUTS = ["file", "split", "bgzf"]
+
+# Loaders read a single file, the layout does not apply
+SINGLE_FILE_CASES = {"load_dbsnp_by_snp_id", "load_dbsnp_by_coordinate", "load_refsnp_merged"}
+
+# Slowdown (wall time ratio) reported as a regression by --compare
+REGRESSION_THRESHOLD = 1.1
+
+def run_case(case, dataset, layout, jobs, output_dir):
+    """
+    Run a benchmark case, return the rows it processed (None if not applicable).
+    """
+
+    dbsnp, refsnp_merged = dataset.layout(layout)
+
+    if case in ("load_dbsnp_by_snp_id", "load_dbsnp_by_coordinate", "execute_load"):
+        bim = snptk.core.load_bim(dataset.bim)
+
+        if case == "load_dbsnp_by_coordinate":
+            snptk.core.load_dbsnp_by_coordinate(dataset.dbsnp, set(bim.coordinate_keys()), 1)
+        elif case == "load_dbsnp_by_snp_id":
+            snptk.core.load_dbsnp_by_snp_id(dataset.dbsnp, set(bim.snp_keys()), 1)
+        else:
+            with snptk.core.WorkerPool(jobs) as pool:
+                snptk.core.execute_load(snptk.core.load_dbsnp_by_snp_id, dbsnp, set(bim.snp_keys()), 1, merge_method="update", pool=pool)
+
+        return dataset.manifest["rows"]
+
+    if case == "load_refsnp_merged":
+        return len(snptk.core.load_refsnp_merged(dataset.refsnp_merged))
+
+    args = {
+        "jobs": jobs, "bim_offset": 0, "dbsnp": dbsnp, "dbsnp_offset": 1, "input_bim": dataset.bim,
+        "output_map_dir": output_dir}
+
+    if case == "map-using-rs-id":
+        args.update(include_file=None, refsnp_merged=refsnp_merged)
+        snptk.app.map_using_rs_id(args)
+
+    elif case == "map-using-coord":
+        args.update(keep_multi=False, keep_unmapped_rs_ids=False, skip_rs_ids=False)
+        snptk.app.map_using_coord(args)
+
+    return dataset.manifest["rows"]
+
+
+def measure(conn, case, data_dir, layout, jobs):
+    """
+    Child process side of benchmark(): run the case with snptk.metrics recording and send the result.
+    """
+
+    dataset = synthetic.Dataset(data_dir)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_dir = os.path.join(tmp_dir, "output")
+        metrics_json = os.path.join(tmp_dir, "metrics.json")
+        os.mkdir(output_dir)
+
+        started = time.perf_counter()
+
+        with snptk.metrics.recording(case, metrics_json=metrics_json):
+            with snptk.metrics.stage(case):
+                rows = run_case(case, dataset, layout, jobs, output_dir)
+
+        wall = time.perf_counter() - started
+
+        with open(metrics_json) as f:
+            metrics = json.load(f)
+
+    # map-using-* record their own stages, nested in the case stage
+    conn.send({
+        "rows": rows,
+        "wall_s": round(wall, 3),
+        "cpu_s": round(metrics["cpu_s"] + metrics["children_cpu_s"] + sum(w["cpu_s"] for s in metrics["stages"] for w in s.get("workers", [])), 3),
+        "rows_per_s": round(rows / wall, 1) if rows else None,
+        "peak_rss_mb": metrics["peak_rss_mb"],
+        "workers_peak_rss_mb": metrics["children_peak_rss_mb"],
+        "workers": len([w for s in metrics["stages"] for w in s.get("workers", [])])})
+
+
+def benchmark(case, data_dir, layout, jobs):
+    parent_conn, child_conn = multiprocessing.Pipe()
+
+    process = multiprocessing.Process(target=measure, args=(child_conn, case, data_dir, layout, jobs))
+    process.start()
+
+    result = parent_conn.recv()
+    process.join()
+
+    return result
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return commit + ("-dirty" if dirty else "")
+
+
+def load_history(fname):
+    if not os.path.exists(fname):
+        return []
+
+    with open(fname) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_run(history, record):
+    """
+    Return the latest history record of the same case/size/layout/jobs from another commit.
+    """
+
+    key = ("case", "rows", "layout", "jobs")
+
+    for old in reversed(history):
+        if all(old.get(k) == record[k] for k in key) and old.get("commit") != record["commit"]:
+            return old
+
+    return None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog=os.path.basename(__file__), description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument("--sizes", nargs="+", default=["1M"], help="SNPChrPosOnRef rows: 1M, 10M, 100M or a number (default: 1M)")
+    parser.add_argument("--bim-rows", type=int, help="Variants in the BIM (default: rows / 10)")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES)
+    parser.add_argument("--layouts", nargs="+", choices=LAYOUTS, default=["file", "split"])
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count())
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "snptk-bench"), help="Where datasets are generated and kept for later runs")
+    parser.add_argument("--history", default=os.path.join(os.path.dirname(__file__), "history.jsonl"), help="JSONL file results are appended to")
+    parser.add_argument("--compare", action="store_true", help="Compare with the latest run of another commit in the history")
+
+    args = parser.parse_args(argv)
+
+    history = load_history(args.history)
+    commit = git_commit()
+    regressions = 0
+
+    print(f"{'case':<26} {'size':>6} {'layout':>7} {'wall (s)':>10} {'rows/s':>12} {'peak rss (MiB)':>15} {'workers (MiB)':>14}" +
+          (f" {'vs previous':>12}" if args.compare else ""))
+
+    for size in args.sizes:
+        rows = synthetic.parse_size(size)
+        data_dir = os.path.join(args.data_dir, f"{size}-{args.bim_rows or 'default'}")
+
+        started = time.perf_counter()
+        dataset = synthetic.generate(data_dir, rows, args.bim_rows)
+
+        if time.perf_counter() - started > 1:
+            print(f"generated {size} dataset in {data_dir} ({time.perf_counter() - started:.0f}s)", file=sys.stderr)
+
+        for case in args.cases:
+            for layout in (["file"] if case in SINGLE_FILE_CASES else args.layouts):
+                record = {
+                    "timestamp": time.strftime("%FT%TZ", time.gmtime()),
+                    "commit": commit,
+                    "host": socket.gethostname(),
+                    "python": platform.python_version(),
+                    "cpus": os.cpu_count(),
+                    "case": case,
+                    "rows": rows,
+                    "bim_rows": dataset.manifest["bim_rows"],
+                    "layout": layout,
+                    "jobs": args.jobs}
+
+                record.update(benchmark(case, data_dir, layout, args.jobs))
+
+                comparison = ""
+
+                if args.compare:
+                    previous = previous_run(history, record)
+
+                    if previous:
+                        ratio = record["wall_s"] / previous["wall_s"] if previous["wall_s"] else 1.0
+                        regressions += ratio > REGRESSION_THRESHOLD
+                        comparison = f" {ratio:>8.2f}x {previous['commit']}{' !' if ratio > REGRESSION_THRESHOLD else ''}"
+                    else:
+                        comparison = f" {'-':>12}"
+
+                rows_per_s = f"{record['rows_per_s']:.0f}" if record["rows_per_s"] else "-"
+
+                print(f"{case:<26} {size:>6} {layout:>7} {record['wall_s']:>10.3f} {rows_per_s:>12} " +
+                      f"{record['peak_rss_mb']:>15.1f} {record['workers_peak_rss_mb']:>14.1f}{comparison}", flush=True)
+
+                with open(args.history, "a") as f:
+                    print(json.dumps(record), file=f)
+
+                history.append(record)
+
+    if regressions:
+        print(f"{regressions} case(s) more than {REGRESSION_THRESHOLD - 1:.0%} slower than the previous commit", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
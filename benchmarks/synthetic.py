@@ -0,0 +1,225 @@
+"""
+Generators of synthetic but realistically shaped inputs for the benchmarks:
+
+- SNPChrPosOnRef with chromosomes 1-22/X/Y/MT, AltOnly rows (no position) and multi-mapping positions
+  (several RS Ids at one coordinate)
+- refsnp-merged with merge chains (old id -> older id -> ... -> current id)
+- a BIM mixing current, merged, unknown and non-rs variant ids with matching, moved and unknown coordinates
+
+Both are written as directories of split-files; single files are the concatenated gzip members and BGZF
+copies are derived on demand (see Dataset).
+"""
+
+import gzip
+import json
+import os
+import random
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import snptk.compress
+
+# Bump when the generated data changes so cached datasets are rebuilt
+VERSION = 1
+
+SIZES = {"1M": 10**6, "10M": 10**7, "100M": 10**8}
+
+CHROMOSOMES = [str(n) for n in range(1, 23)] + ["X", "Y", "MT"]
+CHROMOSOME_WEIGHTS = [250 - 8 * n for n in range(1, 23)] + [155, 57, 1]
+
+# Share of SNPChrPosOnRef rows
+ALT_ONLY_RATE = 0.01
+MULTI_MAPPING_RATE = 0.02
+
+# Share of current RS Ids with merged (retired) ids and of those with a chain of several merges
+MERGED_RATE = 0.05
+MERGE_CHAIN_RATE = 0.3
+
+def parse_size(size):
+    """
+    Return the number of rows of a size given as 1M/10M/100M or an integer.
+    """
+
+    if size.upper() in SIZES:
+        return SIZES[size.upper()]
+
+    return int(size)
+
+
+class Dataset:
+    """
+    Paths of a generated dataset in data_dir (see generate()).
+    """
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+
+        with open(os.path.join(data_dir, "manifest.json")) as f:
+            self.manifest = json.load(f)
+
+        self.bim = os.path.join(data_dir, "input.bim")
+        self.dbsnp_dir = os.path.join(data_dir, "dbsnp")
+        self.refsnp_merged_dir = os.path.join(data_dir, "refsnp-merged")
+        self.dbsnp = os.path.join(data_dir, "dbsnp.gz")
+        self.refsnp_merged = os.path.join(data_dir, "refsnp-merged.gz")
+
+    def dbsnp_bgzf(self):
+        """
+        Return the path of a BGZF copy of the SNPChrPosOnRef file, created the first time.
+        """
+
+        fname = os.path.join(self.data_dir, "dbsnp.bgz")
+
+        if not os.path.exists(fname):
+            with gzip.open(self.dbsnp, "rb") as f_in, open(fname + ".tmp", "wb") as f_out:
+                snptk.compress.write_bgzf(f_in, f_out, level=1)
+
+            os.replace(fname + ".tmp", fname)
+
+        return fname
+
+    def layout(self, layout):
+        """
+        Return (dbsnp, refsnp_merged) paths for the layout file (single gzip), split (directories of
+        split-files) or bgzf (single BGZF file, split into chunks by execute_load).
+        """
+
+        if layout == "file":
+            return self.dbsnp, self.refsnp_merged
+
+        if layout == "split":
+            return self.dbsnp_dir, self.refsnp_merged_dir
+
+        if layout == "bgzf":
+            return self.dbsnp_bgzf(), self.refsnp_merged
+
+        raise ValueError(f"Unknown layout '{layout}'")
+
+
+def generate(data_dir, rows, bim_rows=None, split_files=16, seed=1):
+    """
+    Write a dataset of rows SNPChrPosOnRef rows (and a BIM of bim_rows variants, default rows / 10) to data_dir
+    unless data_dir already holds one generated with the same parameters. Return the Dataset.
+    """
+
+    if bim_rows is None:
+        bim_rows = max(1, rows // 10)
+
+    manifest = {"version": VERSION, "rows": rows, "bim_rows": bim_rows, "split_files": split_files, "seed": seed}
+
+    try:
+        if Dataset(data_dir).manifest == manifest:
+            return Dataset(data_dir)
+    except FileNotFoundError:
+        pass
+
+    if os.path.exists(data_dir):
+        shutil.rmtree(data_dir)
+
+    os.makedirs(os.path.join(data_dir, "dbsnp"))
+    os.makedirs(os.path.join(data_dir, "refsnp-merged"))
+
+    rng = random.Random(seed)
+
+    bim_rate = bim_rows / rows
+    rsid = 0
+    retired_rsids = []
+    previous = None
+
+    dbsnp_out = refsnp_merged_out = None
+    split_file = None
+
+    with open(os.path.join(data_dir, "input.bim"), "w") as bim_out:
+        for i in range(rows):
+            n = i * split_files // rows
+
+            if n != split_file:
+                split_file = n
+
+                for f in (dbsnp_out, refsnp_merged_out):
+                    if f:
+                        f.close()
+
+                dbsnp_out = gzip.open(os.path.join(data_dir, "dbsnp", f"{n:02d}.gz"), "wt", compresslevel=1)
+                refsnp_merged_out = gzip.open(os.path.join(data_dir, "refsnp-merged", f"{n:02d}.gz"), "wt", compresslevel=1)
+
+            # Gaps in the RS Id space are retired (merged) ids
+            rsid += 1
+
+            if rng.random() < 0.1:
+                retired_rsids.append(rsid)
+                rsid += 1
+
+            r = rng.random()
+
+            if r < ALT_ONLY_RATE:
+                dbsnp_out.write(f"{rsid}\tAltOnly\t\t\n")
+                continue
+
+            if r < ALT_ONLY_RATE + MULTI_MAPPING_RATE and previous:
+                chromosome, position = previous
+            else:
+                chromosome = rng.choices(CHROMOSOMES, CHROMOSOME_WEIGHTS)[0]
+                position = rng.randint(1, 2 * 10**8)
+
+            previous = chromosome, position
+
+            dbsnp_out.write(f"{rsid}\t{chromosome}\t{position}\t{rng.randint(0, 1)}\n")
+
+            merged = []
+
+            if retired_rsids and rng.random() < MERGED_RATE:
+                merged.append(retired_rsids.pop())
+
+                while retired_rsids and rng.random() < MERGE_CHAIN_RATE:
+                    merged.append(retired_rsids.pop())
+
+                # retired ids merge into the next newer one, the newest into the current rsid
+                for old, new in zip(merged, merged[1:] + [rsid]):
+                    refsnp_merged_out.write(f"{old}\t{new}\n")
+
+            if rng.random() < bim_rate:
+                write_bim_row(bim_out, rng, rsid, chromosome, position, merged)
+
+    for f in (dbsnp_out, refsnp_merged_out):
+        f.close()
+
+    for name in ("dbsnp", "refsnp-merged"):
+        with open(os.path.join(data_dir, f"{name}.gz"), "wb") as f_out:
+            for fname in sorted(os.listdir(os.path.join(data_dir, name))):
+                with open(os.path.join(data_dir, name, fname), "rb") as f_in:
+                    shutil.copyfileobj(f_in, f_out)
+
+    with open(os.path.join(data_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    return Dataset(data_dir)
+
+
+def write_bim_row(f, rng, rsid, chromosome, position, merged):
+    """
+    Write a BIM variant derived from a SNPChrPosOnRef row (BIM positions are dbSNP positions + 1).
+    """
+
+    plink_chromosome = {"X": "23", "Y": "24", "MT": "26"}.get(chromosome, chromosome)
+
+    r = rng.random()
+
+    if r < 0.70:
+        snp_id, position = f"rs{rsid}", position + 1
+    elif r < 0.80:
+        snp_id, position = f"rs{rsid}", position + rng.randint(2, 1000)
+    elif r < 0.85 and merged:
+        snp_id, position = f"rs{rng.choice(merged)}", position + 1
+    elif r < 0.90:
+        snp_id, position = f"rs{rsid}{rng.randint(0, 9)}000000000", position + 1
+    elif r < 0.95:
+        snp_id, position = f"{plink_chromosome}:{position + 1}", position + 1
+    else:
+        snp_id, position = f"exm{rsid}", rng.randint(1, 2 * 10**8)
+
+    alleles = rng.sample("ACGT", 2)
+
+    print(plink_chromosome, snp_id, 0, position, alleles[0], alleles[1], sep="\t", file=f)
@@ -1,12 +1,23 @@
 #!/usr/bin/env python3
 
 import argparse
-import bz2
+import collections
 import gzip
-import json
+import multiprocessing
 import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import snptk.compress
+import snptk.refsnp
+
+# bzip2 blocks per worker task, a block decompresses to at most about 900 KB
+TASK_BLOCKS = 4
+
+# Tasks submitted ahead of the one being written per worker, bounds the results held in memory
+TASKS_AHEAD = 2
+
 
 def ensure_dir(path, name="directory"):
     if os.path.exists(path):
@@ -21,32 +32,162 @@ def ensure_dir(path, name="directory"):
         os.makedirs(path)
 
 
-def extract_refsnp_merged(args):
+def merged_lines(data):
+    """
+    Return the "refsnp_id<TAB>merged_into" lines of the refsnp-merged JSON lines in data (bytes).
+    """
+
+    lines = []
+
+    for line in data.split(b"\n"):
+        if line.strip():
+            refsnp_id, merged_into = snptk.refsnp.merged_fields(line.decode("utf-8"))
+
+            if merged_into is not None:
+                lines.append(refsnp_id + "\t" + merged_into + "\n")
+
+    return lines
+
+
+def serial_batches(refsnp_merged):
+    """
+    Yield lists of output lines of refsnp_merged, decompressed and parsed in this process.
+    """
+
+    with snptk.compress.open_compressed(refsnp_merged, "rb") as f_in:
+        for data in snptk.compress.read_blocks(f_in):
+            yield merged_lines(data)
+
+
+def extract_blocks(task):
+    """
+    Decompress bzip2 blocks of a task (fname, blocks) and return (partial first line, output lines of the
+    complete lines, partial last line), or (data, None, None) if the blocks hold no line break.
+    """
+
+    fname, blocks = task
+
+    head = None
+    lines = []
+    partial = b""
+
+    # Block by block, only a line spanning blocks is joined
+    for data in snptk.compress.read_bz2_blocks(fname, blocks):
+        if head is None:
+            first = data.find(b"\n")
+
+            if first < 0:
+                partial += data
+                continue
+
+            head, partial, data = partial + data[:first], b"", data[first + 1:]
+
+        last = data.rfind(b"\n")
+
+        if last < 0:
+            partial += data
+            continue
+
+        lines += merged_lines(partial + data[:last])
+        partial = data[last + 1:]
+
+    if head is None:
+        return partial, None, None
+
+    return head, lines, partial
+
+
+def parallel_batches(refsnp_merged, jobs):
+    """
+    Yield lists of output lines of refsnp_merged in input order, its bzip2 blocks are decompressed and parsed by
+    jobs worker processes. Lines spanning tasks are joined and parsed here.
+
+    At most TASKS_AHEAD tasks per worker are submitted ahead of the one being written, so memory stays constant
+    when writing is slower than decompressing.
+    """
+
+    blocks = snptk.compress.bz2_blocks(refsnp_merged)
+
+    with multiprocessing.Pool(jobs) as pool:
+        def results():
+            pending = collections.deque()
+
+            for n in range(0, len(blocks), TASK_BLOCKS):
+                pending.append(pool.apply_async(extract_blocks, ((refsnp_merged, blocks[n:n + TASK_BLOCKS]),)))
+
+                if len(pending) > TASKS_AHEAD * jobs:
+                    yield pending.popleft().get()
+
+            while pending:
+                yield pending.popleft().get()
+
+        partial = b""
+
+        for head, lines, tail in results():
+            if lines is None:
+                partial += head
+                continue
+
+            yield merged_lines(partial + head)
+            yield lines
+
+            partial = tail
+
+        yield merged_lines(partial)
+
+
+def write_batches(batches, split, f_outs):
+    """
+    Write the output lines round robin to the split-files f_outs (all to f_outs[0] unless split > 1).
+    """
+
     entry = 0
-    split, refsnp_merged, output_path = args.split, args.refsnp_merged, args.output_path
 
+    for lines in batches:
+        if split > 1:
+            # Line n of the batch is entry + n + 1 of the output
+            for n in range(split):
+                f_outs[(entry + n + 1) % split].write("".join(lines[n::split]).encode())
+        else:
+            f_outs[0].write("".join(lines).encode())
+
+        entry += len(lines)
+
+
+def open_outputs(split, output_path):
     if split > 1:
         ensure_dir(output_path, "output_path")
-        f_outs = [
+        return [
             gzip.open(os.path.join(output_path, f"{n:02}.gz"), "wb")
             for n in range(1, split + 1)
         ]
-    else:
-        f_outs = [gzip.open(output_path, "wb")]
+
+    return [gzip.open(output_path, "wb")]
+
+
+def extract_refsnp_merged(args):
+    split, refsnp_merged, output_path, jobs = args.split, args.refsnp_merged, args.output_path, args.jobs
+
+    parallel = jobs > 1 and snptk.compress.codec(refsnp_merged) == "bz2" and os.path.getsize(refsnp_merged) > 0
+
+    f_outs = open_outputs(split, output_path)
 
     try:
-        with bz2.open(refsnp_merged, "rt", encoding="utf-8") as f_in:
-            for line in f_in:
-                rsmerge_obj = json.loads(line)
-                refsnp_id = rsmerge_obj["refsnp_id"]
-                merged_into = rsmerge_obj.get("merged_snapshot_data", {}).get("merged_into", [])
-
-                if merged_into:
-                    entry += 1
-                    f_out = f_outs[entry % split]
-                    f_out.write(
-                        ("\t".join([refsnp_id, merged_into[0]]) + "\n").encode()
-                    )
+        if parallel:
+            try:
+                write_batches(parallel_batches(refsnp_merged, jobs), split, f_outs)
+            except (OSError, ValueError) as e:
+                # e.g. a block boundary found in compressed data by chance
+                print(f"Warning: parallel decompression of '{refsnp_merged}' failed ({e}), decompressing serially...", file=sys.stderr)
+
+                for f_out in f_outs:
+                    f_out.close()
+
+                f_outs = open_outputs(split, output_path)
+                parallel = False
+
+        if not parallel:
+            write_batches(serial_batches(refsnp_merged), split, f_outs)
     finally:
         for f_out in f_outs:
             f_out.close()
@@ -59,6 +200,13 @@ def main(argv):
     )
 
     parser.add_argument("--split", type=int, default=1)
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=os.cpu_count(),
+        help="Worker processes decompressing and parsing bzip2 blocks (default: number of CPUs)",
+    )
     parser.add_argument("refsnp_merged")
     parser.add_argument("output_path")
 
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import snptk.compress
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog=os.path.basename(__file__),
+        description="Recompress a gzipped file (e.g. NCBI SNPChrPosOnRef) as BGZF so snptk can parse it in parallel chunks",
+    )
+
+    parser.add_argument("--level", type=int, default=6, help="Compression level (default: 6)")
+    parser.add_argument("input_gz")
+    parser.add_argument("output_gz")
+
+    args = parser.parse_args(argv)
+
+    with snptk.compress.open_compressed(args.input_gz, "rb") as f_in, open(args.output_gz, "wb") as f_out:
+        snptk.compress.write_bgzf(f_in, f_out, args.level)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -5,7 +5,11 @@ import argparse
 import re
 import os
 import gzip
+from itertools import groupby
+from operator import itemgetter
 from os.path import join, basename, dirname, abspath, splitext
+import snptk.compress
+import snptk.extsort
 from snptk.util import debug
 
 sys.path.append('../snptk')
@@ -16,7 +20,7 @@ def parse_grch38_dbsnp(fname):
 
     db ={}
 
-    with gzip.open(fname, 'rt') as f:
+    with snptk.compress.open_compressed(fname, 'rt') as f:
         for line in f:
             fields = line.strip().split()
             rsid, chromosome, strand = fields[0], fields[1], fields[3]
@@ -34,7 +38,7 @@ def map_chromosomes(grch37, grch38_db):
     db = {}
     multi_entries = set()
 
-    with gzip.open(grch37, 'rt') as f:
+    with snptk.compress.open_compressed(grch37, 'rt') as f:
         for line in f:
             fields = line.strip().split()
             rsid, chromosome, position = fields[:]
@@ -52,7 +56,7 @@ def map_chromosomes(grch37, grch38_db):
                 chromosome = grch38_db[rsid][0]
                 strand = grch38_db[rsid][1]
             else:
-                debug(f'{rsid} was not found in GRCh38, therefore no change in chromosome', level=2)
+                debug('%s was not found in GRCh38, therefore no change in chromosome', rsid, level=2)
                 continue
 
             db[rsid] = chromosome + " " + position + " " + strand
@@ -75,6 +79,86 @@ def output(db, multi_entries, outfile):
         for rsid, value in db.items():
             print(rsid + " " + value, file=out)
 
+def grch38_records(fname):
+    """
+    Yield (rsid, chromosome, strand) of the GRCh38 dbSNP file.
+    """
+
+    with snptk.compress.open_compressed(fname, 'rt') as f:
+        for line in f:
+            fields = line.strip().split()
+            yield fields[0], fields[1], fields[3]
+
+def grch37_records(fname):
+    """
+    Yield (rsid, line number, position) of the GRCh37 dbSNP entries on NC_* chromosomes.
+    """
+
+    with snptk.compress.open_compressed(fname, 'rt') as f:
+        for n, line in enumerate(f):
+            fields = line.strip().split()
+            rsid, chromosome, position = fields[:]
+
+            if not chromosome.startswith("NC"):
+                continue
+
+            yield rsid[2:], n, position
+
+def merge_join(grch37_sorted, grch38_sorted, multi_out):
+    """
+    Join GRCh37 and GRCh38 records sorted by rsid in one pass, yielding (GRCh37 line number, output line) of the
+    rsids found in GRCh38 once in GRCh37 and writing those found more than once to multi_out. As with
+    map_chromosomes() the last GRCh38 entry of an rsid wins.
+    """
+
+    grch38_groups = groupby(grch38_sorted, key=itemgetter(0))
+    grch38_rsid, grch38_entry = None, None
+
+    for rsid, group in groupby(grch37_sorted, key=itemgetter(0)):
+        while grch38_rsid is None or grch38_rsid < rsid:
+            try:
+                grch38_rsid, entries = next(grch38_groups)
+            except StopIteration:
+                grch38_rsid = None
+                break
+
+            for grch38_entry in entries:
+                pass
+
+        if grch38_rsid != rsid:
+            debug('%s was not found in GRCh38, therefore no change in chromosome', rsid, level=2)
+            continue
+
+        entries = list(group)
+
+        if len(entries) > 1:
+            print(rsid, file=multi_out)
+            continue
+
+        _, n, position = entries[0]
+        _, chromosome, strand = grch38_entry
+
+        yield n, rsid + " " + chromosome + " " + position + " " + strand
+
+def map_chromosomes_sorted(grch37, grch38, outfile, buffer_records, tmp_dir):
+    """
+    Same output as map_chromosomes() and output() with bounded memory: both inputs are sorted by rsid in runs of
+    buffer_records spilled to tmp_dir and merge-joined, the joined lines are sorted back to GRCh37 order.
+    """
+
+    debug(f'Began mapping GRCh37 chromosomes by external sort')
+
+    grch38_sorted = snptk.extsort.sort(grch38_records(grch38), key=itemgetter(0), buffer_records=buffer_records, tmp_dir=tmp_dir)
+    grch37_sorted = snptk.extsort.sort(grch37_records(grch37), key=itemgetter(0), buffer_records=buffer_records, tmp_dir=tmp_dir)
+
+    with gzip.open(outfile + '_multi_entries.gz', 'wt') as multi_out, gzip.open(outfile + '.gz', 'wt') as out:
+        joined = merge_join(grch37_sorted, grch38_sorted, multi_out)
+
+        for n, line in snptk.extsort.sort(joined, key=itemgetter(0), buffer_records=buffer_records, tmp_dir=tmp_dir):
+            print(line, file=out)
+
+    debug(f'Finished mapping GRCh37 chromosomes by external sort')
+
 def main(argv):
 
     parser = argparse.ArgumentParser(description='Maps GRCh37 chromosomes to GRCh38 to set correct chromosome')
@@ -83,9 +167,16 @@ def main(argv):
     parser.add_argument('--grch38_dbsnp')
     parser.add_argument('--grch37_dbsnp')
     parser.add_argument('--outfile')
+    parser.add_argument('--external-sort', action='store_true', help='Sort both files by rsid with bounded memory and merge-join them instead of loading GRCh38 into memory')
+    parser.add_argument('--buffer-records', type=int, default=snptk.extsort.DEFAULT_BUFFER_RECORDS, help='Number of entries to sort in memory before spilling to TMP_DIR (with --external-sort)')
+    parser.add_argument('--tmp-dir', help='Directory for temporary sort files (default: system temp directory)')
 
     args = parser.parse_args(argv)
 
+    if args.external_sort:
+        map_chromosomes_sorted(args.grch37_dbsnp, args.grch38_dbsnp, args.outfile, args.buffer_records, args.tmp_dir)
+        return
+
     grch38_db = parse_grch38_dbsnp(args.grch38_dbsnp)
 
     grch37_db, multi_entries = map_chromosomes(args.grch37_dbsnp, grch38_db)
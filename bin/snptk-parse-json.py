@@ -5,66 +5,91 @@ import argparse
 import re
 import os
 import gzip
-import bz2
-import json
+import shutil
+import tempfile
 from os.path import join, basename, dirname, abspath, splitext
 from multiprocessing import Pool
+import snptk.compress
+import snptk.refsnp
 from snptk.util import debug
 
 sys.path.append('../snptk')
 
+ORIENTATIONS = {'plus': '0', 'minus': '1'}
 
-def process_dbsnp(fnames, outfile):
+def convert_dbsnp(task):
+    """
+    Convert the RefSNP JSON file of a chromosome to a gzipped shard of "snpid chromosome position orientation" lines,
+    task is (JSON file, shard file).
+    """
 
-    with gzip.open(outfile + '.gz', 'at') as out:
-        for fname in fnames:
-
-            chromosome = re.search('chr(.*).json', fname).group(1)
-
-            debug(f'Began parsing chr{chromosome} dbsnp file')
-            with bz2.open(fname, "rb") as f2:
-                for line in f2:
-                    d = json.loads(line.decode('utf-8'))
-                    snpid = d['refsnp_id']
-                    orientation = '-'
-
-                    if d['present_obs_movements']:
-                        position = str(d['present_obs_movements'][0]['allele_in_cur_release']['position'])
-                    else:
-                        debug(f'rs{snpid} on chr{chromosome} does not have a position available')
-                        continue
-
-                    if len(d['primary_snapshot_data']['allele_annotations'][0]['assembly_annotation']) > 0:
-                        if len(d['primary_snapshot_data']['allele_annotations'][0]['assembly_annotation'][0]['genes']) > 0:
-                            orientation = d['primary_snapshot_data']['allele_annotations'][0]['assembly_annotation'][0]['genes'][0]['orientation']
-                            if orientation == 'plus':
-                                orientation = '0'
-                            elif orientation == 'minus':
-                                orientation = '1'
-                            else:
-                                orientation = '-'
-                    else:
-                        debug(f'rs{snpid} on chr{chromosome} does not have a orientation information', level=2)
-
-                    print(snpid + " " + chromosome + " " + position + " " + orientation, file=out)
-
-                debug(f'Finished parsing chr{chromosome} dbsnp file')
+    fname, shard = task
+
+    chromosome = re.search('chr(.*).json', fname).group(1)
+
+    debug(f'Began parsing chr{chromosome} dbsnp file')
+
+    with gzip.open(shard, 'wt', compresslevel=6) as out, snptk.compress.open_compressed(fname, 'rb') as f2:
+        for line in f2:
+            snpid, position, annotation = snptk.refsnp.dbsnp_fields(line.decode('utf-8'))
+
+            if position is None:
+                debug('rs%s on chr%s does not have a position available', snpid, chromosome)
+                continue
+
+            orientation = '-'
+
+            if annotation is not None:
+                if len(annotation['genes']) > 0:
+                    orientation = ORIENTATIONS.get(annotation['genes'][0]['orientation'], '-')
+            else:
+                debug('rs%s on chr%s does not have a orientation information', snpid, chromosome, level=2)
+
+            print(snpid + " " + chromosome + " " + position + " " + orientation, file=out)
+
+    debug(f'Finished parsing chr{chromosome} dbsnp file')
+
+    return shard
+
+def process_dbsnp(fnames, outfile, jobs=1):
+    """
+    Convert the per chromosome files in parallel, each to its own shard, and append the shards to outfile.gz in
+    the order of fnames.
+    """
+
+    shard_dir = tempfile.mkdtemp(prefix=basename(outfile) + '.', dir=dirname(abspath(outfile)))
+    tasks = [(fname, join(shard_dir, f'{n:04d}.gz')) for n, fname in enumerate(fnames)]
+
+    pool = Pool(min(jobs, len(tasks))) if jobs > 1 and len(tasks) > 1 else None
+
+    try:
+        with open(outfile + '.gz', 'ab') as out:
+            # Shards are gzip members, each is appended as soon as it and the ones before it are complete
+            for shard in pool.imap(convert_dbsnp, tasks) if pool else map(convert_dbsnp, tasks):
+                with open(shard, 'rb') as f:
+                    shutil.copyfileobj(f, out, 1024 * 1024)
+
+                os.unlink(shard)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+        shutil.rmtree(shard_dir)
 
 def process_rsmerge(fname, outfile):
 
     with gzip.open(outfile + '.gz', 'at') as out:
 
         debug(f'Began parsing Rsmerge file')
-        with bz2.open(fname, "rb") as f2:
+        with snptk.compress.open_compressed(fname, "rb") as f2:
             for line in f2:
-                d = json.loads(line.decode('utf-8'))
-                if len(d['merged_snapshot_data']['merged_into']) > 0:
-                    snpid = d['refsnp_id']
-                    merged_snpid = d['merged_snapshot_data']['merged_into'][0]
+                snpid, merged_snpid = snptk.refsnp.merged_fields(line.decode('utf-8'))
+
+                if merged_snpid is not None:
                     print(snpid + " " + merged_snpid, file=out)
                 else:
-                    snpid = d['refsnp_id']
-                    debug(f'rs{snpid} has no merge info!')
+                    debug('rs%s has no merge info!', snpid)
 
         debug(f'Finished parsing Rsmerge file')
 
@@ -75,12 +100,13 @@ def main(argv):
     parser.add_argument('--version', action='version', version='%(prog)s 0.1')
     parser.add_argument('--method')
     parser.add_argument('--outfile')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(), help='Chromosome files converted in parallel (default: number of CPUs)')
     parser.add_argument('filenames', nargs='*')
 
     args = parser.parse_args(argv)
 
     if args.method == 'dbsnp':
-        process_dbsnp(args.filenames, args.outfile)
+        process_dbsnp(args.filenames, args.outfile, args.jobs)
     elif args.method == 'rsmerge':
         process_rsmerge(args.filenames[0], args.outfile)
     else:
@@ -89,4 +115,3 @@ def main(argv):
 
 if __name__ == '__main__':
     main(sys.argv[1:])
-
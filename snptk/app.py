@@ -3,11 +3,19 @@ import sys
 
 from os.path import join, basename, splitext
 
+import snptk.bim
+import snptk.cache
 import snptk.core
+import snptk.index
+import snptk.keys
+import snptk.metrics
+import snptk.outofcore
+import snptk.plink
 import snptk.util
 import subprocess
 
-from snptk.util import debug
+from snptk.keys import coordinate_str, rsid_str, unpack_coordinate
+from snptk.util import debug_enabled, debug_tallies, tally
 
 def map_using_rs_id(args):
     bim_offset = args["bim_offset"]
@@ -21,36 +29,69 @@ def map_using_rs_id(args):
 
     snptk.core.ensure_dir(output_map_dir, "output_map_dir")
 
-    unmappable_snps = snptk.core.load_include_file(include_file)
+    with snptk.metrics.stage("load_include_file"):
+        unmappable_snps = snptk.core.load_include_file(include_file)
 
-    refsnp_merged = snptk.core.execute_load(snptk.core.load_refsnp_merged, refsnp_merged_fname, merge_method="update")
+    if args.get("max_memory"):
+        snptk.outofcore.map_using_rs_id(bim_fname, bim_offset, dbsnp_fname, dbsnp_offset, refsnp_merged_fname, unmappable_snps, output_map_dir, args["max_memory"], tmp_dir=args.get("tmp_dir"))
+        return
 
-    # Build a list of tuples with the original snp_id and updated_snp_id
-    snp_map = []
+    with snptk.metrics.stage("load_bim"):
+        bim = snptk.core.load_bim(bim_fname, offset=bim_offset)
 
-    for entry in snptk.core.load_bim(bim_fname, offset=bim_offset):
-        snp_id = entry["snp_id"]
-        snp_id_new = snptk.core.update_snp_id(snp_id, refsnp_merged)
-        snp_map.append((snp_id, entry["chromosome"] + ":" + entry["position"], snp_id_new))
+        bim_snp_ids = list(bim.snp_keys())
 
-    # Load dbsnp by snp_id
-    dbsnp = snptk.core.execute_load(
-        snptk.core.load_dbsnp_by_snp_id,
-        dbsnp_fname,
-        set([snp for pair in snp_map for snp in pair]),
-        dbsnp_offset,
-        merge_method="update")
+    # One pool of workers for both refsnp_merged and dbsnp
+    with snptk.core.WorkerPool(args["jobs"]) as pool:
+        with snptk.metrics.stage("update_snp_ids"):
+            if snptk.index.is_refsnp_merged_index(refsnp_merged_fname):
+                with snptk.index.RefSnpMergedIndex(refsnp_merged_fname) as refsnp_merged:
+                    snp_ids_new = refsnp_merged.update_snp_ids(bim_snp_ids)
+            else:
+                refsnp_merged = snptk.core.execute_load(snptk.cache.cached(snptk.core.load_refsnp_merged), refsnp_merged_fname, merge_method="update", pool=pool)
+                snp_ids_new = [snptk.core.update_snp_id(snp_id, refsnp_merged) for snp_id in bim_snp_ids]
+                del refsnp_merged
+
+        # Build a list of tuples with the original snp_id and updated_snp_id
+        snp_map = []
+
+        for snp_id, coordinate, snp_id_new in zip(bim_snp_ids, bim.coordinate_keys(), snp_ids_new):
+            snp_map.append((snp_id, coordinate, snp_id_new))
+
+        snp_ids = set(bim_snp_ids)
+        snp_ids.update(snp_ids_new)
+
+        # Load dbsnp by snp_id
+        with snptk.metrics.stage("load_dbsnp"):
+            if snptk.index.is_rs_id_index(dbsnp_fname):
+                dbsnp = snptk.index.load_dbsnp_by_snp_id(dbsnp_fname, snp_ids, dbsnp_offset)
+            else:
+                dbsnp = snptk.core.execute_load(
+                    snptk.cache.cached(snptk.core.load_dbsnp_by_snp_id),
+                    dbsnp_fname,
+                    snp_ids,
+                    dbsnp_offset,
+                    merge_method="update",
+                    pool=pool)
 
     # Generate edit instructions
-    snps_to_delete, snps_to_update, coords_to_update, chromosomes_to_update = map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps)
+    with snptk.metrics.stage("map_using_rs_id_logic"):
+        snps_to_delete, snps_to_update, coords_to_update, chromosomes_to_update = map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps)
 
-    write_map(output_map_dir, "deleted_snps.txt", snps_to_delete)
-    write_map(output_map_dir, "updated_snps.txt", snps_to_update)
-    write_map(output_map_dir, "coord_update.txt", coords_to_update)
-    write_map(output_map_dir, "chr_update.txt", chromosomes_to_update)
+    with snptk.metrics.stage("write_map"):
+        write_map(output_map_dir, "deleted_snps.txt", snps_to_delete, DELETED_FORMATS)
+        write_map(output_map_dir, "updated_snps.txt", snps_to_update, UPDATED_FORMATS)
+        write_map(output_map_dir, "coord_update.txt", coords_to_update, VALUE_FORMATS)
+        write_map(output_map_dir, "chr_update.txt", chromosomes_to_update, VALUE_FORMATS)
 
 
 def map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps):
+    """
+    Return the (snps_to_delete, snps_to_update, coords_to_update, chromosomes_to_update) entries of the map files
+    for snp_map [(snp_id, coordinate, snp_id_new)], dbsnp {snp_id_new: coordinate} and the unmappable_snps, all
+    keys (see snptk.keys) which write_map() converts to strings.
+    """
+
     snps_to_delete = []
     snps_to_update = []
     coords_to_update = []
@@ -58,12 +99,21 @@ def map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps):
 
     snps_already_updated = set()
 
+    # Original snp_ids are checked for every merged snp so index them once
+    original_snp_ids = set(snp[0] for snp in snp_map)
+
+    # Per variant messages are sampled and counted by reason, only when debugging
+    debugging = debug_enabled()
+
     for snp_id, original_coord, snp_id_new in snp_map:
         # If the snp has been updated (merged)
         if snp_id_new != snp_id:
 
             # If the merged snp was already in the original
-            if snp_id_new in [snp[0] for snp in snp_map]:
+            if snp_id_new in original_snp_ids:
+                if debugging:
+                    tally("MERGED_INTO_ORIGINAL", "%s was merged into %s which is already present", rsid_str(snp_id), rsid_str(snp_id_new))
+
                 snps_to_delete.append(snp_id)
 
             elif snp_id_new in dbsnp:
@@ -76,10 +126,11 @@ def map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps):
                 snps_to_update.append((snp_id, snp_id_new))
                 snps_already_updated.add(snp_id_new)
 
-                debug(f"original_coord={original_coord} updated_coord={dbsnp[snp_id_new]}", level=2)
+                if debugging:
+                    tally("MERGED", "%s original_coord=%s updated_coord=%s", rsid_str(snp_id_new), coordinate_str(original_coord), coordinate_str(dbsnp[snp_id_new]), level=2)
 
-                new_chromosome, new_position = dbsnp[snp_id_new].split(":")
-                original_chromosome, original_position = original_coord.split(":")
+                new_chromosome, new_position = unpack_coordinate(dbsnp[snp_id_new])
+                original_chromosome, original_position = unpack_coordinate(original_coord)
 
                 if new_position != original_position:
                     coords_to_update.append((snp_id_new, new_position))
@@ -98,18 +149,23 @@ def map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps):
                 snps_to_update.append((snp_id, snp_id_new))
                 snps_already_updated.add(snp_id_new)
 
-                debug(f"{snp_id} was updated to {snp_id_new} but cannot be updated by chr:position due to having multiple positions inside of GRCh37 VCF file")
+                if debugging:
+                    tally("MERGED_MULTI_POSITION", "%s was updated to %s but cannot be updated by chr:position due to having multiple positions inside of GRCh37 VCF file", rsid_str(snp_id), rsid_str(snp_id_new))
 
             else:
+                if debugging:
+                    tally("MERGED_NOT_IN_DBSNP", "%s was merged into %s which is not in dbSNP", rsid_str(snp_id), rsid_str(snp_id_new))
+
                 snps_to_delete.append(snp_id)
 
         # If snp_id was not merged and is the same as snp_id_new (no change)
         else:
             if snp_id in dbsnp:
-                debug(f"original_coord={original_coord} updated_coord={dbsnp[snp_id]}", level=2)
+                if debugging:
+                    tally("MAPPED", "%s original_coord=%s updated_coord=%s", rsid_str(snp_id), coordinate_str(original_coord), coordinate_str(dbsnp[snp_id]), level=2)
 
-                new_chromosome, new_position = dbsnp[snp_id].split(":")
-                original_chromosome, original_position = original_coord.split(":")
+                new_chromosome, new_position = unpack_coordinate(dbsnp[snp_id])
+                original_chromosome, original_position = unpack_coordinate(original_coord)
 
                 if new_position != original_position:
                     coords_to_update.append((snp_id, new_position))
@@ -118,12 +174,18 @@ def map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps):
                     chromosomes_to_update.append((snp_id, new_chromosome))
 
             elif snp_id in unmappable_snps:
-                debug(f"{snp_id} cannot be updated due to having multiple positions inside of GRCh37 VCF file")
+                if debugging:
+                    tally("MULTI_POSITION", "%s cannot be updated due to having multiple positions inside of GRCh37 VCF file", rsid_str(snp_id))
 
             # If snp_id is not in dbsnp it has been deleted
             else:
+                if debugging:
+                    tally("NOT_IN_DBSNP", "%s", rsid_str(snp_id))
+
                 snps_to_delete.append(snp_id)
 
+    debug_tallies("map_using_rs_id_logic")
+
     return snps_to_delete, snps_to_update, coords_to_update, chromosomes_to_update
 
 
@@ -140,41 +202,57 @@ def map_using_coord(args):
 
     snptk.core.ensure_dir(output_map_dir, "output_map_dir")
 
-    coordinates = set()
-    snps = set()
+    with snptk.metrics.stage("load_bim"):
+        bim_entries = snptk.core.load_bim(bim_fname, offset=bim_offset)
 
-    bim_entries = snptk.core.load_bim(bim_fname, offset=bim_offset)
+        snps = set(bim_entries.snp_keys())
+        coordinates = set(bim_entries.coordinate_keys())
 
-    for entry in bim_entries:
-        snps.add(entry["snp_id"])
-        coordinates.add(entry["chromosome"] + ":" + entry["position"])
-
-    dbsnp = snptk.core.execute_load(snptk.core.load_dbsnp_by_coordinate, dbsnp_fname, coordinates, dbsnp_offset, merge_method="extend")
+    with snptk.metrics.stage("load_dbsnp"):
+        if snptk.index.is_coordinate_index(dbsnp_fname):
+            dbsnp = snptk.index.load_dbsnp_by_coordinate(dbsnp_fname, coordinates, dbsnp_offset)
+        else:
+            with snptk.core.WorkerPool(args["jobs"]) as pool:
+                dbsnp = snptk.core.execute_load(snptk.cache.cached(snptk.core.load_dbsnp_by_coordinate), dbsnp_fname, coordinates, dbsnp_offset, merge_method="extend", pool=pool)
 
-    snps_to_delete, snps_to_update, multi_snps = map_using_coord_logic(bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids, skip_rs_ids)
+    with snptk.metrics.stage("map_using_coord_logic"):
+        snps_to_delete, snps_to_update, multi_snps = map_using_coord_logic(bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids, skip_rs_ids)
 
-    write_map(output_map_dir, "deleted_snps.txt", snps_to_delete)
-    write_map(output_map_dir, "updated_snps.txt", snps_to_update)
+    with snptk.metrics.stage("write_map"):
+        write_map(output_map_dir, "deleted_snps.txt", snps_to_delete, DELETED_FORMATS)
+        write_map(output_map_dir, "updated_snps.txt", snps_to_update, UPDATED_FORMATS)
 
-    if multi_snps:
-        write_map(output_map_dir, "multi.txt", [(chr_pos, ",".join(mappings)) for chr_pos, mappings in multi_snps])
+        if multi_snps:
+            write_map(output_map_dir, "multi.txt", multi_snps, MULTI_FORMATS)
 
 
 def map_using_coord_logic(bim_entries, snps, dbsnp, keep_multi=False, keep_unmapped_rsids=False, skip_rs_ids=False):
+    """
+    Return the (snps_to_delete, snps_to_update, multi_snps) entries of the map files for the BIM entries, the set
+    of their SNP Ids and dbsnp {coordinate: [snp_id, ...]}, all keys (see snptk.keys) which write_map() converts
+    to strings.
+    """
+
     snps_to_update = []
     snps_to_delete = []
     multi_snps = []
 
-    for entry in bim_entries:
-        k = entry["chromosome"] + ":" + entry["position"]
-        snp = entry["snp_id"]
+    if not isinstance(bim_entries, snptk.bim.Bim):
+        bim_entries = snptk.bim.Bim.from_entries(bim_entries)
+
+    # Per variant messages are sampled and counted by reason, only when debugging
+    debugging = debug_enabled()
 
-        if snp.startswith("rs") and skip_rs_ids:
+    for i, (snp, k) in enumerate(zip(bim_entries.snp_keys(), bim_entries.coordinate_keys())):
+
+        if skip_rs_ids and snptk.keys.is_rsid(snp):
             continue
 
         if k in dbsnp:
             if len(dbsnp[k]) > 1:
-                debug(f"Has more than one snp_id dbsnp[{k}] = {str(dbsnp[k])}")
+                if debugging:
+                    tally("MULTI", "Has more than one snp_id dbsnp[%s] = %s", coordinate_str(k), [rsid_str(snp_id) for snp_id in dbsnp[k]])
+
                 if keep_multi:
                     multi_snps.append((k, dbsnp[k]))
 
@@ -185,20 +263,27 @@ def map_using_coord_logic(bim_entries, snps, dbsnp, keep_multi=False, keep_unmap
                     else:
                         continue
                 else:
-                    if keep_unmapped_rsids and snp.startswith("rs"):
+                    if keep_unmapped_rsids and snptk.keys.is_rsid(snp):
                         continue
                     snps_to_delete.append(snp)
             else:
                 if dbsnp[k][0] != snp:
-                    debug(f"Rewrote snp_id {snp} to {dbsnp[k][0]} for position {k}")
+                    if debugging:
+                        tally("REWROTE", "Rewrote snp_id %s to %s for position %s", rsid_str(snp), rsid_str(dbsnp[k][0]), coordinate_str(k))
+
                     snps_to_update.append((snp, dbsnp[k][0]))
                     snp = dbsnp[k][0]
         else:
-            if keep_unmapped_rsids and snp.startswith("rs"):
+            if keep_unmapped_rsids and snptk.keys.is_rsid(snp):
                 continue
-            debug("NO_MATCH: " + "\t".join(entry.values()))
+
+            if debugging:
+                tally("NO_MATCH", "%s", "\t".join(bim_entries[i].values()))
+
             snps_to_delete.append(snp)
 
+    debug_tallies("map_using_coord_logic")
+
     return snps_to_delete, snps_to_update, multi_snps
 
 
@@ -212,6 +297,13 @@ def remove_duplicates(args):
 
     file_name = splitext(basename(input_prefix))[0]
 
+    # --use-maf only applies to --keep-best-called and implies it
+    keep_best_called = args["keep_best_called"] or args["use_maf"]
+
+    if args["native"] or keep_best_called:
+        remove_duplicates_native(input_prefix, output_prefix, file_name, dryrun, keep_best_called, args["use_maf"])
+        return
+
     commands = {
         "bed_to_vcf" : f"{plink} --bfile {input_prefix} --recode vcf --out {output_prefix}/{file_name}",
         "remove_dups" : f"{bcftools} norm --rm-dup all -o {output_prefix}/{file_name}_no_dups.vcf -O vcf {output_prefix}/{file_name}.vcf",
@@ -225,8 +317,39 @@ def remove_duplicates(args):
     snptk.core.cmd(commands, dryrun)
 
 
+def remove_duplicates_native(input_prefix, output_prefix, file_name, dry_run, keep_best_called=False, use_maf=False):
+    """
+    Remove duplicate variants found in the BIM with a single pass of snptk.plink.remove_duplicates() and write the
+    removed variants (BIM rows) to {output_prefix}/{file_name}_duplicates.txt.
+
+    With keep_best_called the duplicate with the highest call rate (ties by MAF if use_maf) is kept instead of the first.
+    """
+
+    print("#" + "-" * 102, file=sys.stderr)
+    print("# Remove Duplicate SNPs", file=sys.stderr)
+    print("#" + "-" * 102, file=sys.stderr)
+    print(f"{input_prefix} -> {output_prefix}/{file_name}", file=sys.stderr)
+    print(file=sys.stderr)
+
+    if dry_run:
+        return
+
+    snptk.core.ensure_dir(output_prefix, "output directory")
+
+    keep = None
+
+    if keep_best_called:
+        keep = lambda bed, group: snptk.plink.best_called(bed, group, use_maf)
+
+    with snptk.metrics.stage("remove_duplicates"):
+        removed = snptk.plink.remove_duplicates(input_prefix, join(output_prefix, file_name), keep)
+
+        write_map(output_prefix, f"{file_name}_duplicates.txt", [tuple(row.values()) for row in removed])
+
+
 def update_from_map(args):
     plink, map_dir, input_prefix, output_prefix, dry_run = args["plink"], args["map_dir"], args["input_prefix"], args["output_prefix"], args["dry_run"]
+    native = args["native"]
 
     map_using_rs_id = set(["deleted_snps.txt", "updated_snps.txt", "coord_update.txt", "chr_update.txt"])
     map_using_coord = set(["deleted_snps.txt", "updated_snps.txt"])
@@ -234,6 +357,20 @@ def update_from_map(args):
     map_files = set(os.listdir(map_dir))
 
     if map_using_rs_id.issubset(map_files):
+        rs_id_map = True
+    elif map_using_coord.issubset(map_files):
+        rs_id_map = False
+    else:
+        print(f"--map-dir '{map_dir}' does not contain the expected set of either " +
+               "(" + ", ".join(map_using_rs_id) + ") or (" + ", ".join(map_using_coord) + ")", file=sys.stderr)
+
+        sys.exit(1)
+
+    if native:
+        update_from_map_native(map_dir, input_prefix, output_prefix, rs_id_map, dry_run)
+        return
+
+    if rs_id_map:
         commands = {
             "Exclude Deleted SNPs":
                 f"{plink} --bfile {input_prefix} --exclude {map_dir}/deleted_snps.txt --make-bed --out {output_prefix}_deleted",
@@ -245,7 +382,7 @@ def update_from_map(args):
                 f"{plink} --bfile {output_prefix}_coord_update --update-chr {map_dir}/chr_update.txt --make-bed --out {output_prefix}"
         }
 
-    elif map_using_coord.issubset(map_files):
+    else:
         commands = {
             "Exclude Deleted SNPs":
                 f"{plink} --bfile {input_prefix} --exclude {map_dir}/deleted_snps.txt --make-bed --out {output_prefix}_deleted",
@@ -253,18 +390,93 @@ def update_from_map(args):
                 f"{plink} --bfile {output_prefix}_deleted --update-name {map_dir}/updated_snps.txt --make-bed --out {output_prefix}"
         }
 
-    else:
-        print(f"--map-dir '{map_dir}' does not contain the expected set of either " +
-               "(" + ", ".join(map_using_rs_id) + ") or (" + ", ".join(map_using_coord) + ")", file=sys.stderr)
+    snptk.core.cmd(commands, dry_run)
 
-        sys.exit(1)
 
-    snptk.core.cmd(commands, dry_run)
+def update_from_map_native(map_dir, input_prefix, output_prefix, rs_id_map, dry_run):
+    """
+    Apply the same updates as the plink commands of update_from_map() with a single pass of snptk.plink.rewrite().
+    """
+
+    updates = ["exclude", "update-name"] + (["update-map", "update-chr"] if rs_id_map else [])
+
+    print("#" + "-" * 102, file=sys.stderr)
+    print(f"# Rewrite Plink Fileset ({', '.join(updates)})", file=sys.stderr)
+    print("#" + "-" * 102, file=sys.stderr)
+    print(f"{input_prefix} -> {output_prefix} using {map_dir}", file=sys.stderr)
+    print(file=sys.stderr)
+
+    if dry_run:
+        return
+
+    kwargs = {
+        "exclude": snptk.plink.load_ids(join(map_dir, "deleted_snps.txt")),
+        "names": snptk.plink.load_updates(join(map_dir, "updated_snps.txt"))}
+
+    if rs_id_map:
+        kwargs["positions"] = snptk.plink.load_updates(join(map_dir, "coord_update.txt"))
+        kwargs["chromosomes"] = snptk.plink.load_updates(join(map_dir, "chr_update.txt"))
+
+    with snptk.metrics.stage("rewrite"):
+        snptk.plink.rewrite(input_prefix, output_prefix, **kwargs)
+
+
+def build_index(args):
+    input_fname = args["input"]
+    output_index = args["output_index"]
+    index_type = args["type"]
+
+    with snptk.metrics.stage(f"build_{index_type}_index"):
+        if index_type == "rs-id":
+            snptk.index.build_rs_id_index(input_fname, output_index, buffer_records=args["buffer_records"], tmp_dir=args["tmp_dir"])
+
+        elif index_type == "coord":
+            snptk.index.build_coordinate_index(input_fname, output_index, buffer_records=args["buffer_records"], tmp_dir=args["tmp_dir"])
+
+        elif index_type == "refsnp-merged":
+            with snptk.core.WorkerPool(args["jobs"]) as pool:
+                snptk.index.build_refsnp_merged_index(input_fname, output_index, tmp_dir=args["tmp_dir"], pool=pool)
+
+
+def rsids_str(snp_ids):
+    return ",".join(map(rsid_str, snp_ids))
+
+
+# Conversion of the columns of map file entries (keys, see snptk.keys) to strings per map file
+DELETED_FORMATS = (rsid_str,)
+
+UPDATED_FORMATS = (rsid_str, rsid_str)
+
+# coord_update.txt and chr_update.txt: a SNP Id and its new position or chromosome code
+VALUE_FORMATS = (rsid_str, str)
+
+MULTI_FORMATS = (coordinate_str, rsids_str)
+
+# Formats of the results of map_using_rs_id_logic() and map_using_coord_logic() in order
+RS_ID_MAP_FORMATS = (DELETED_FORMATS, UPDATED_FORMATS, VALUE_FORMATS, VALUE_FORMATS)
+
+COORD_MAP_FORMATS = (DELETED_FORMATS, UPDATED_FORMATS, MULTI_FORMATS)
+
+def format_map(entries, formats=None):
+    """
+    Return the lines of a map file for entries (keys or tuples of keys) converting column n with formats[n], or
+    for entries of strings if formats is None.
+    """
+
+    lines = []
+
+    for entry in entries:
+        if formats is None:
+            lines.append("\t".join(entry) if isinstance(entry, tuple) else entry)
+        elif isinstance(entry, tuple):
+            lines.append("\t".join(format(k) for format, k in zip(formats, entry)))
+        else:
+            lines.append(formats[0](entry))
+
+    return lines
 
 
-def write_map(dir, fname, entries):
+def write_map(dir, fname, entries, formats=None):
     with open(os.path.join(dir, fname), "w") as f:
-        for entry in entries:
-            if isinstance(entry, tuple):
-                entry = "\t".join(entry)
-            print(entry, file=f)
+        for line in format_map(entries, formats):
+            print(line, file=f)
@@ -0,0 +1,214 @@
+import sys
+
+from array import array
+from collections.abc import Mapping, Sequence
+
+import snptk.keys
+import snptk.metrics
+
+FIELDS = ("chromosome", "snp_id", "distance", "position", "allele_1", "allele_2")
+
+class Strings:
+    """
+    Intern table for a low-cardinality string column: each distinct value is stored once and rows hold codes.
+    """
+
+    def __init__(self, typecode="I"):
+        self.codes = array(typecode)
+        self.values = []
+        self._index = {}
+
+    def append(self, value):
+        code = self._index.get(value)
+
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+
+        self.codes.append(code)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def __iter__(self):
+        values = self.values
+        return (values[code] for code in self.codes)
+
+
+class Bim(Sequence):
+    """
+    Columnar Plink BIM (https://www.cog-genomics.org/plink2/formats#bim).
+
+    Chromosomes, distances and alleles are interned, positions are int64 (offset already applied) and SNP Ids
+    are packed into a single buffer. Indexing/iterating returns BimRow views which behave like the row dicts
+    returned by earlier versions of snptk.core.load_bim().
+    """
+
+    def __init__(self):
+        self.chromosomes = Strings("H")
+        self.distances = Strings()
+        self.positions = array("q")
+        self.alleles_1 = Strings()
+        self.alleles_2 = Strings()
+
+        self._snp_ids = bytearray()
+        self._snp_id_ends = array("Q")
+
+    @classmethod
+    def from_entries(cls, entries):
+        """
+        Build from row dicts with the keys of FIELDS (e.g. test fixtures).
+        """
+
+        bim = cls()
+
+        for entry in entries:
+            bim.append(entry["chromosome"], entry["snp_id"], entry["distance"], int(entry["position"]), entry["allele_1"], entry["allele_2"])
+
+        return bim
+
+    def append(self, chromosome, snp_id, distance, position, allele_1, allele_2):
+        self.chromosomes.append(chromosome)
+        self.distances.append(distance)
+        self.positions.append(position)
+        self.alleles_1.append(allele_1)
+        self.alleles_2.append(allele_2)
+
+        self._snp_ids += snp_id.encode()
+        self._snp_id_ends.append(len(self._snp_ids))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [BimRow(self, n) for n in range(*i.indices(len(self)))]
+
+        if i < 0:
+            i += len(self)
+
+        if not 0 <= i < len(self):
+            raise IndexError("Bim index out of range")
+
+        return BimRow(self, i)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+
+        return len(self) == len(other) and all(row == entry for row, entry in zip(self, other))
+
+    def __repr__(self):
+        return f"<Bim with {len(self)} entries>"
+
+    def snp_id(self, i):
+        start = self._snp_id_ends[i - 1] if i > 0 else 0
+        return self._snp_ids[start:self._snp_id_ends[i]].decode()
+
+    def snp_ids(self):
+        """
+        Iterate over the SNP Ids of all entries.
+        """
+
+        start = 0
+        snp_ids = self._snp_ids
+
+        for end in self._snp_id_ends:
+            yield snp_ids[start:end].decode()
+            start = end
+
+    def coordinates(self):
+        """
+        Iterate over "chromosome:position" of all entries.
+        """
+
+        for chromosome, position in zip(self.chromosomes, self.positions):
+            yield chromosome + ":" + str(position)
+
+    def snp_keys(self):
+        """
+        Iterate over the SNP Id keys (see snptk.keys) of all entries.
+        """
+
+        return map(snptk.keys.rsid_key, self.snp_ids())
+
+    def coordinate_keys(self):
+        """
+        Iterate over the coordinate keys (see snptk.keys) of all entries.
+        """
+
+        codes = [snptk.keys.chromosome_code(chromosome) for chromosome in self.chromosomes.values]
+
+        for code, position in zip(self.chromosomes.codes, self.positions):
+            yield snptk.keys.coordinate_key(codes[code], position)
+
+
+class BimRow(Mapping):
+    """
+    Lazy read-only row dict view of a Bim entry, values are strings as in the BIM file.
+    """
+
+    __slots__ = ("_bim", "_i")
+
+    def __init__(self, bim, i):
+        self._bim = bim
+        self._i = i
+
+    def __getitem__(self, field):
+        bim, i = self._bim, self._i
+
+        if field == "chromosome":
+            return bim.chromosomes[i]
+        if field == "snp_id":
+            return bim.snp_id(i)
+        if field == "distance":
+            return bim.distances[i]
+        if field == "position":
+            return str(bim.positions[i])
+        if field == "allele_1":
+            return bim.alleles_1[i]
+        if field == "allele_2":
+            return bim.alleles_2[i]
+
+        raise KeyError(field)
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def read_bim(fname, offset=0):
+    """
+    Yield (chromosome, snp_id, distance, position, allele_1, allele_2) of each entry of a Plink BIM file, the
+    position as int with offset added.
+    """
+
+    with open(fname) as f:
+        for line in f:
+            fields = line.split()
+
+            if len(fields) != 6:
+                print(f"Invalid BIM format - len(fields)={len(fields)} but expected 6 fields={fields}", file=sys.stderr)
+                sys.exit(1)
+
+            yield fields[0], fields[1], fields[2], int(fields[3]) + offset, fields[4], fields[5]
+
+
+def load_bim(fname, offset=0):
+    """
+    Read in file with Plink BIM format and return a columnar Bim.
+    """
+
+    bim = Bim()
+
+    for fields in read_bim(fname, offset):
+        bim.append(*fields)
+
+    snptk.metrics.count("lines", len(bim))
+
+    return bim
@@ -0,0 +1,340 @@
+import contextlib
+import errno
+import fcntl
+import glob
+import hashlib
+import marshal
+import os
+import socket
+import struct
+
+import snptk.compress
+import snptk.core
+import snptk.index
+import snptk.metrics
+
+from snptk.util import debug
+
+DEFAULT_CACHE_SIZE = 32 * 2**30
+
+# Bump when the layout of a cache entry changes, older entries are no longer found and age out
+CACHE_VERSION = 2
+
+# Errors of reading a truncated or otherwise corrupt cache entry
+CORRUPT_ERRORS = (ValueError, EOFError, TypeError, struct.error)
+
+def configure(cache_dir=None, cache_size=None):
+    """
+    Cache loader results under cache_dir (None disables the cache) for this process and its worker processes,
+    evicting the least recently used entries beyond cache_size bytes.
+    """
+
+    if cache_dir:
+        os.environ["SNPTK_CACHE_DIR"] = os.path.abspath(cache_dir)
+    else:
+        os.environ.pop("SNPTK_CACHE_DIR", None)
+
+    if cache_size:
+        os.environ["SNPTK_CACHE_SIZE"] = str(cache_size)
+    else:
+        os.environ.pop("SNPTK_CACHE_SIZE", None)
+
+
+def get_cache_dir():
+    return os.environ.get("SNPTK_CACHE_DIR") or None
+
+
+def get_cache_size():
+    return int(os.environ.get("SNPTK_CACHE_SIZE") or DEFAULT_CACHE_SIZE)
+
+
+def source_identity(source):
+    """
+    Return what identifies the content of a file or Chunk: its path, size and mtime (and byte range).
+    """
+
+    fname = source.fname if isinstance(source, snptk.compress.Chunk) else source
+    st = os.stat(fname)
+
+    identity = (os.path.realpath(fname), st.st_size, st.st_mtime_ns)
+
+    if isinstance(source, snptk.compress.Chunk):
+        identity += (source.start, source.end)
+
+    return identity
+
+
+def entry_fname(cache_dir, load_func, source):
+    key = hashlib.sha256(repr((CACHE_VERSION, load_func.__name__, source_identity(source))).encode()).hexdigest()
+
+    return os.path.join(cache_dir, key[:2], key)
+
+
+def build_dbsnp_by_snp_id(source, fname):
+    snptk.index.build_rs_id_index(source, fname)
+
+
+def query_dbsnp_by_snp_id(fname, snp_ids, offset=0):
+    with snptk.index.RsIdIndex(fname) as index:
+        return index.lookup(snp_ids, offset)
+
+
+def build_dbsnp_by_coordinate(source, fname):
+    snptk.index.build_coordinate_index(source, fname)
+
+
+def query_dbsnp_by_coordinate(fname, coordinates, offset=0):
+    with snptk.index.CoordinateIndex(fname) as index:
+        return index.lookup(coordinates, offset)
+
+
+def build_refsnp_merged(source, fname):
+    refsnp_merged = snptk.core.load_refsnp_merged(source)
+
+    with open(fname, "wb") as f:
+        marshal.dump(refsnp_merged, f)
+
+
+def query_refsnp_merged(fname):
+    with open(fname, "rb") as f:
+        return marshal.load(f)
+
+
+# The cached form of each loader does not depend on the filter set or offset passed to it, so one entry per
+# source serves every cohort: {loader name: (build(source, fname), query(fname, *args))}
+FORMS = {
+    "load_dbsnp_by_snp_id": (build_dbsnp_by_snp_id, query_dbsnp_by_snp_id),
+    "load_dbsnp_by_coordinate": (build_dbsnp_by_coordinate, query_dbsnp_by_coordinate),
+    "load_refsnp_merged": (build_refsnp_merged, query_refsnp_merged)}
+
+
+def cached(load_func):
+    """
+    Return load_func answered from the cache (a CachedLoader) if the cache is enabled and knows load_func,
+    otherwise load_func itself. Pass the result to snptk.core.execute_load() in place of load_func.
+    """
+
+    cache_dir = get_cache_dir()
+
+    if cache_dir is None or load_func.__name__ not in FORMS:
+        return load_func
+
+    return CachedLoader(load_func, cache_dir, get_cache_size())
+
+
+@contextlib.contextmanager
+def locked(fname, exclusive=True, blocking=True):
+    """
+    Hold a POSIX record lock (lockf, which unlike flock also works across hosts on NFS) of the cache entry fname
+    through its lock file fname.lock. Raise BlockingIOError if blocking is False and the lock is held elsewhere.
+
+    Readers of an entry share the lock, its builder and the eviction take it exclusively. The eviction removes the
+    lock file with the entry, a process which got the lock of a removed lock file locks the new one instead so that
+    all processes always lock the same file.
+    """
+
+    lock_fname = fname + ".lock"
+    operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+
+    while True:
+        fd = os.open(lock_fname, os.O_RDWR | os.O_CREAT, 0o666)
+
+        try:
+            try:
+                fcntl.lockf(fd, operation | fcntl.LOCK_NB)
+            except OSError as e:
+                if e.errno not in (errno.EACCES, errno.EAGAIN):
+                    raise
+
+                if not blocking:
+                    raise BlockingIOError(e.errno, f"cache entry '{fname}' is locked") from e
+
+                debug(f"Waiting for the lock of cache entry '{fname}'...")
+                fcntl.lockf(fd, operation)
+
+            if os.fstat(fd).st_ino == os.stat(lock_fname).st_ino:
+                break
+
+        except FileNotFoundError:
+            pass
+
+        except BaseException:
+            os.close(fd)
+            raise
+
+        os.close(fd)
+
+    try:
+        yield
+
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
+
+
+def publish(fname, build, corrupt=None):
+    """
+    Build the cache entry fname with build(temporary fname) and atomically rename it into place, unless another
+    process published it in the meantime. corrupt is the inode of an entry found to be corrupt, which is
+    replaced. Call with the exclusive lock of fname held. Return True if the entry was built.
+    """
+
+    try:
+        if os.stat(fname).st_ino != corrupt:
+            return False
+
+        os.unlink(fname)
+    except FileNotFoundError:
+        pass
+
+    # Temporary files of builders which died while holding the lock
+    for tmp_fname in glob.glob(glob.escape(fname) + ".*.tmp"):
+        debug(f"Removing partial cache entry '{tmp_fname}'")
+        os.unlink(tmp_fname)
+
+    tmp_fname = f"{fname}.{socket.gethostname()}.{os.getpid()}.tmp"
+
+    try:
+        build(tmp_fname)
+
+        with open(tmp_fname, "rb") as f:
+            os.fsync(f.fileno())
+
+        os.replace(tmp_fname, fname)
+
+    except BaseException:
+        if os.path.exists(tmp_fname):
+            os.unlink(tmp_fname)
+        raise
+
+    return True
+
+
+class CachedLoader:
+    """
+    Picklable stand-in of a snptk.core.load_* function. The first call for a file/Chunk parses it whole into a
+    binary cache entry (an index for dbSNP, a marshalled dict for refsnp-merged), every call then answers from
+    the entry without decompressing the source.
+
+    The cache directory may be shared by many processes and hosts (e.g. cluster array jobs): the first of them
+    builds an entry under its exclusive lock and publishes it by renaming, the others wait for the lock and then
+    read the finished entry. Entries found truncated or corrupt are rebuilt.
+    """
+
+    def __init__(self, load_func, cache_dir, cache_size):
+        self.load_func = load_func
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+
+    @property
+    def __name__(self):
+        return self.load_func.__name__
+
+    def __call__(self, source, *args):
+        build, query = FORMS[self.load_func.__name__]
+
+        fname = entry_fname(self.cache_dir, self.load_func, source)
+
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+
+        built = None
+
+        while True:
+            corrupt = None
+
+            with locked(fname, exclusive=False):
+                try:
+                    result = query(fname, *args)
+
+                except FileNotFoundError:
+                    pass
+
+                except CORRUPT_ERRORS as e:
+                    try:
+                        corrupt = os.stat(fname).st_ino
+                    except FileNotFoundError:
+                        # Evicted meanwhile, built again below
+                        corrupt = None
+
+                    if corrupt is not None and corrupt == built:
+                        raise
+
+                    debug(f"Rebuilding corrupt cache entry '{fname}': {e}")
+
+                else:
+                    if built is None:
+                        debug(f"Cache hit of {self.load_func.__name__} for '{source}'")
+                        snptk.metrics.count("cache_hits")
+
+                    # The modification time of an entry is its last use for the LRU eviction
+                    os.utime(fname)
+
+                    return result
+
+            with locked(fname):
+                if publish(fname, lambda tmp_fname: build(source, tmp_fname), corrupt):
+                    debug(f"Cache miss of {self.load_func.__name__} for '{source}', wrote '{fname}'")
+                    snptk.metrics.count("cache_misses")
+
+                    try:
+                        built = os.stat(fname).st_ino
+                    except FileNotFoundError:
+                        pass
+
+            if built is not None:
+                evict(self.cache_dir, self.cache_size, keep=fname)
+
+
+def entries(cache_dir):
+    """
+    Yield os.DirEntry of each published cache entry under cache_dir.
+    """
+
+    if not os.path.isdir(cache_dir):
+        return
+
+    for subdir in os.scandir(cache_dir):
+        if subdir.is_dir() and len(subdir.name) == 2:
+            yield from (entry for entry in os.scandir(subdir.path) if entry.is_file() and "." not in entry.name)
+
+
+def evict(cache_dir, cache_size, keep=None):
+    """
+    Remove the least recently used entries until those under cache_dir take at most cache_size bytes. Never
+    remove keep (the entry being used) or entries locked by a reader or builder. Return the number of entries
+    removed.
+    """
+
+    stats = []
+
+    for entry in entries(cache_dir):
+        try:
+            stats.append((entry.stat(), entry.path))
+        except FileNotFoundError:
+            pass
+
+    stats.sort(key=lambda stat_path: stat_path[0].st_mtime_ns)
+
+    total = sum(st.st_size for st, _ in stats)
+    removed = 0
+
+    for st, path in stats:
+        if total <= cache_size:
+            break
+
+        if path == keep:
+            continue
+
+        try:
+            with locked(path, blocking=False):
+                os.unlink(path)
+                os.unlink(path + ".lock")
+        except (BlockingIOError, FileNotFoundError):
+            continue
+
+        debug(f"Evicted cache entry '{path}' ({st.st_size} bytes)")
+
+        total -= st.st_size
+        removed += 1
+
+    return removed
@@ -1,8 +1,15 @@
 import argparse
+import os
 import sys
 
 import snptk.app
+import snptk.cache
+import snptk.compress
+import snptk.core
+import snptk.extsort
+import snptk.metrics
 import snptk.release
+import snptk.util
 
 def main():
     help_fmt = lambda prog: argparse.HelpFormatter(prog, max_help_position=42, width=132)
@@ -24,15 +31,20 @@ def main():
     map_using_coord.set_defaults(func=snptk.app.map_using_coord)
 
     map_using_coord.add_argument("--help", "-h", action="help", help="Show this help message and exit")
+    map_using_coord.add_argument("--jobs", "-j", type=int, default=os.cpu_count(), help="Maximum number of worker processes to load split-files/chunks (default: number of CPUs)")
 
     map_using_coord.add_argument("--bim-offset", type=int, default=0, help="Add BIM_OFFSET to each BIM entry coordinate")
     map_using_coord.add_argument("--keep-multi", action="store_true", help="If coordinate maps to multiple RS Ids, write out Chrom Coord RSId,RSId,... into multi.txt")
     map_using_coord.add_argument("--keep-unmapped-rs-ids", action="store_true", help="If entry starts with rs and is not in dbsnp, keep it anyways")
     map_using_coord.add_argument("--skip-rs-ids", action="store_true", help="Do not update/delete any entry which starts with rs")
 
-    map_using_coord.add_argument("--dbsnp", "-d", required=True, help="NCBI dbSNP SNPChrPosOnRef file or directory with split-files")
+    map_using_coord.add_argument("--dbsnp", "-d", required=True, help="NCBI dbSNP SNPChrPosOnRef file, directory with split-files or index from build-index --type coord")
     map_using_coord.add_argument("--dbsnp-offset", type=int, default=1, help="Add DBSNP_OFFSET to each DBSNP coordinate (default: 1)")
 
+    map_using_coord.add_argument("--cache-dir", metavar="DIR", help="Cache parsed dbSNP/refsnp-merged files across runs in DIR (default: SNPTK_CACHE_DIR, no cache if unset); the first run over a file builds its sorted index and is much slower than without the cache")
+    map_using_coord.add_argument("--cache-size", type=snptk.util.parse_memory, metavar="SIZE", help="Evict least recently used cache entries beyond SIZE (default: 32G)")
+    map_using_coord.add_argument("--no-cache", action="store_true", help="Do not use the cache even if SNPTK_CACHE_DIR is set")
+
     map_using_coord.add_argument("input_bim")
     map_using_coord.add_argument("output_map_dir")
 
@@ -47,13 +59,21 @@ def main():
     map_using_rs_id.set_defaults(func=snptk.app.map_using_rs_id)
 
     map_using_rs_id.add_argument("--help", "-h", action="help", help="Show this help message and exit")
+    map_using_rs_id.add_argument("--jobs", "-j", type=int, default=os.cpu_count(), help="Maximum number of worker processes to load split-files/chunks (default: number of CPUs)")
 
     map_using_rs_id.add_argument("--bim-offset", type=int, default=0, help="Add BIM_OFFSET to each BIM entry coordinate")
     map_using_rs_id.add_argument("--include-file", help="Do not remove variant ids listed in this file")
 
-    map_using_rs_id.add_argument("--dbsnp", "-d", required=True,metavar="FILE|DIR",  help="NCBI dbSNP SNPChrPosOnRef file or directory w/ split-files")
+    map_using_rs_id.add_argument("--dbsnp", "-d", required=True, metavar="FILE|DIR", help="NCBI dbSNP SNPChrPosOnRef file, directory w/ split-files or index from build-index")
     map_using_rs_id.add_argument("--dbsnp-offset", type=int, default=1, help="Add DBSNP_OFFSET to each DBSNP coordinate (default: 1)")
-    map_using_rs_id.add_argument("--refsnp-merged", "-r", required=True, metavar="FILE|DIR", help="Tab-separated gzipped file (or directory w/ split-files) generated from NCBI refsnp-merged.json.bz2")
+    map_using_rs_id.add_argument("--refsnp-merged", "-r", required=True, metavar="FILE|DIR", help="Tab-separated gzipped file (or directory w/ split-files) generated from NCBI refsnp-merged.json.bz2 or index from build-index --type refsnp-merged")
+
+    map_using_rs_id.add_argument("--max-memory", type=snptk.util.parse_memory, metavar="SIZE", help="Sort-merge out of core within about SIZE of memory (e.g. 512M, 4G) instead of loading dbSNP/refsnp-merged into memory")
+    map_using_rs_id.add_argument("--tmp-dir", help="Directory for temporary sort files of --max-memory (default: system temp directory)")
+
+    map_using_rs_id.add_argument("--cache-dir", metavar="DIR", help="Cache parsed dbSNP/refsnp-merged files across runs in DIR (default: SNPTK_CACHE_DIR, no cache if unset); the first run over a file builds its sorted index and is much slower than without the cache")
+    map_using_rs_id.add_argument("--cache-size", type=snptk.util.parse_memory, metavar="SIZE", help="Evict least recently used cache entries beyond SIZE (default: 32G)")
+    map_using_rs_id.add_argument("--no-cache", action="store_true", help="Do not use the cache even if SNPTK_CACHE_DIR is set")
 
     map_using_rs_id.add_argument("input_bim")
     map_using_rs_id.add_argument("output_map_dir")
@@ -73,6 +93,9 @@ def main():
     remove_duplicates.add_argument("--plink", default="plink", help="Path to plink command")
     remove_duplicates.add_argument("--bcftools", default="bcftools", help="Path to bcftools command")
     remove_duplicates.add_argument("--dry-run", "-n", action="store_true", help="Print the commands that would be executed, but do not execute them")
+    remove_duplicates.add_argument("--native", action="store_true", help="Find duplicates in the BIM and filter the BED in a single pass instead of the plink/bcftools VCF round trip")
+    remove_duplicates.add_argument("--keep-best-called", action="store_true", help="Keep the duplicate with the highest call rate instead of the first (implies --native)")
+    remove_duplicates.add_argument("--use-maf", action="store_true", help="Break call rate ties of --keep-best-called by the higher minor allele frequency (implies --keep-best-called)")
 
     remove_duplicates.add_argument("input_prefix", help="Input path prefix shared by Plink BIM,BED,FAM files")
     remove_duplicates.add_argument("output_prefix", help="Output path prefix to write out Plink BIM,BED,FAM files")
@@ -91,6 +114,7 @@ def main():
 
     update_from_map.add_argument("--dry-run", "-n", action="store_true", help="Print the commands that would be executed, but do not execute them")
     update_from_map.add_argument("--plink", default="plink", help="Path to plink command")
+    update_from_map.add_argument("--native", action="store_true", help="Rewrite the fileset in a single pass over the BED instead of running plink")
 
     update_from_map.add_argument("map_dir", help="Directory containing update files from map-using-coord/map-using-rs-id")
     update_from_map.add_argument("input_prefix", help="Input path prefix shared by Plink BIM,BED,FAM files")
@@ -98,9 +122,56 @@ def main():
 
     #-----------------------------------------------------------------------------------------------------
 
+    build_index = subparsers.add_parser(
+        "build-index",
+        help="Convert NCBI dbSNP SNPChrPosOnRef (or refsnp-merged) into a binary index usable by map-using-rs-id/map-using-coord",
+        formatter_class=help_fmt,
+        add_help=False)
+
+    build_index.set_defaults(func=snptk.app.build_index)
+
+    build_index.add_argument("--help", "-h", action="help", help="Show this help message and exit")
+    build_index.add_argument("--jobs", "-j", type=int, default=os.cpu_count(), help="Maximum number of worker processes to load split-files/chunks (default: number of CPUs)")
+
+    build_index.add_argument("--type", "-t", choices=["rs-id", "coord", "refsnp-merged"], default="rs-id",
+        help="Index SNPChrPosOnRef by RS Id (--dbsnp of map-using-rs-id), by chromosome/coordinate (--dbsnp of map-using-coord) or " +
+             "compile refsnp-merged (--refsnp-merged of map-using-rs-id) (default: rs-id)")
+    build_index.add_argument("--buffer-records", type=int, default=snptk.extsort.DEFAULT_BUFFER_RECORDS, help="Number of entries to sort in memory before spilling to TMP_DIR")
+    build_index.add_argument("--tmp-dir", help="Directory for temporary sort files (default: system temp directory)")
+
+    build_index.add_argument("input", metavar="FILE|DIR", help="NCBI dbSNP SNPChrPosOnRef (or refsnp-merged tsv) file or directory w/ split-files")
+    build_index.add_argument("output_index", help="Path of the index file to write")
+
+    #-----------------------------------------------------------------------------------------------------
+
+    for subparser in subparsers.choices.values():
+        subparser.add_argument("--profile", action="store_true", help="Print wall/CPU time, peak RSS and lines/sec per stage to stderr when done")
+        subparser.add_argument("--metrics-json", metavar="PATH", help="Write per-stage (and per-worker) metrics as JSON to PATH")
+        subparser.add_argument("--profile-dir", metavar="DIR", help="Save cProfile output of each stage to DIR/<n>-<stage>.prof")
+        subparser.add_argument("--log-file", metavar="PATH", help="Write DEBUG messages to a rotating log file PATH instead of stderr")
+        subparser.add_argument("--decompress", choices=snptk.compress.BACKENDS, help="Decompression backend of gzip/bz2 inputs (default: SNPTK_DECOMPRESS or auto)")
+        subparser.add_argument("--spool-dir", metavar="DIR", help="Directory for the results of parallel load workers (default: SNPTK_SPOOL_DIR, /dev/shm if it has room, otherwise system temp directory)")
+
     if len(sys.argv) > 1:
         args = parser.parse_args(sys.argv[1:])
-        args.func(vars(args))
+
+        if args.log_file:
+            snptk.util.configure(log_file=args.log_file)
+
+        if args.decompress:
+            snptk.compress.set_backend(args.decompress)
+
+        if args.spool_dir:
+            snptk.core.set_spool_dir(args.spool_dir)
+
+        if "no_cache" in args:
+            if args.no_cache:
+                snptk.cache.configure(None)
+            else:
+                snptk.cache.configure(args.cache_dir or snptk.cache.get_cache_dir(), args.cache_size or snptk.cache.get_cache_size())
+
+        with snptk.metrics.recording(sys.argv[1], args.profile, args.metrics_json, args.profile_dir):
+            args.func(vars(args))
     else:
         parser.print_help()
         sys.exit(1)
@@ -0,0 +1,542 @@
+import bz2
+import contextlib
+import gzip
+import io
+import mmap
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import zlib
+
+from collections import namedtuple
+
+# Compressed bytes per chunk when splitting a BGZF file for parallel parsing
+DEFAULT_CHUNK_SIZE = 32 * 1024 * 1024
+
+BGZF_HEADER = struct.Struct("<4sI2sH2sHH")
+
+# Uncompressed bytes per BGZF block (as htslib bgzip)
+BGZF_BLOCK_SIZE = 0xff00
+
+# Uncompressed bytes read at once by open_blocks()
+READ_SIZE = 1024 * 1024
+
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+# 48-bit magic numbers starting each bzip2 block and ending each bzip2 stream, neither is byte aligned
+BZ2_BLOCK_MAGIC = 0x314159265359
+BZ2_EOS_MAGIC = 0x177245385090
+
+# Decompression backends of open_compressed(), chosen by --decompress or SNPTK_DECOMPRESS:
+#
+#   external  decompress in a pipe from the first tool of EXTERNAL_TOOLS on the PATH
+#   threaded  decompress with gzip/bz2 in a thread reading ahead of the parser (zlib/bz2 release the GIL)
+#   stdlib    decompress with gzip/bz2 in the reading thread
+#   auto      external if pigz/lbzip2/pbzip2 is installed, otherwise threaded (stdlib on a single CPU)
+BACKENDS = ["auto", "external", "threaded", "stdlib"]
+
+DEFAULT_BACKEND = "auto"
+
+# External decompressors by codec, the fastest first
+EXTERNAL_TOOLS = {
+    "gzip": [["pigz", "-dc"], ["gzip", "-dc"]],
+    "bz2": [["lbzip2", "-dc"], ["pbzip2", "-dc"], ["bzip2", "-dc"]]}
+
+# Parallel decompressors, preferred by auto over the threaded backend
+PARALLEL_TOOLS = {"pigz", "lbzip2", "pbzip2"}
+
+# Decompressed blocks the threaded backend may read ahead
+READ_AHEAD = 8
+
+class Chunk(namedtuple("Chunk", ["fname", "start", "end"])):
+    """
+    Byte range [start, end) of BGZF blocks of fname. Reading a chunk yields the lines whose preceding newline
+    lies in the range (plus the first line of the file for the chunk at offset 0), so the chunks of a file
+    together yield every line exactly once.
+    """
+
+    def __str__(self):
+        return f"{self.fname}[{self.start}:{self.end}]"
+
+
+def is_bgzf(fname):
+    """
+    Return True if fname starts with a BGZF block (gzip member with a 'BC' extra subfield holding its size).
+    """
+
+    with open(fname, "rb") as f:
+        header = f.read(BGZF_HEADER.size)
+
+    if len(header) < BGZF_HEADER.size:
+        return False
+
+    magic, _, _, xlen, subfield, slen, _ = BGZF_HEADER.unpack(header)
+
+    return magic == b"\x1f\x8b\x08\x04" and xlen == 6 and subfield == b"BC" and slen == 2
+
+
+def bgzf_blocks(fname):
+    """
+    Return the offsets of all BGZF blocks of fname by walking the block headers (no decompression).
+    """
+
+    offsets = []
+    offset = 0
+    size = os.path.getsize(fname)
+
+    with open(fname, "rb") as f:
+        while offset < size:
+            f.seek(offset)
+            magic, _, _, xlen, subfield, slen, bsize = BGZF_HEADER.unpack(f.read(BGZF_HEADER.size))
+
+            if magic[:3] != b"\x1f\x8b\x08" or subfield != b"BC":
+                raise ValueError(f"'{fname}' has an invalid BGZF block at offset {offset}")
+
+            offsets.append(offset)
+            offset += bsize + 1
+
+    return offsets
+
+
+def split(fname, chunk_size=None):
+    """
+    Split a BGZF file into Chunks of roughly chunk_size compressed bytes aligned to block boundaries.
+
+    Plain gzip can not be decoded from an arbitrary offset, so any other file is returned unsplit as [fname].
+    It can be converted once with bin/snptk-bgzip.py (or htslib bgzip) to allow splitting.
+    """
+
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+
+    if os.path.getsize(fname) <= chunk_size or not is_bgzf(fname):
+        return [fname]
+
+    size = os.path.getsize(fname)
+    starts = [0]
+
+    for offset in bgzf_blocks(fname):
+        if offset - starts[-1] >= chunk_size:
+            starts.append(offset)
+
+    return [Chunk(fname, start, end) for start, end in zip(starts, starts[1:] + [size])]
+
+
+def _bgzf_data(f, offset):
+    """
+    Return (uncompressed data, offset of the next block) of the BGZF block at offset.
+    """
+
+    f.seek(offset)
+    header = f.read(BGZF_HEADER.size)
+
+    if len(header) < BGZF_HEADER.size:
+        return b"", offset
+
+    bsize = BGZF_HEADER.unpack(header)[-1]
+    block = header + f.read(bsize + 1 - BGZF_HEADER.size)
+
+    return zlib.decompress(block, 31), offset + bsize + 1
+
+
+def read_chunk(chunk):
+    """
+    Yield the lines (bytes) of a Chunk, see Chunk.
+    """
+
+    for data in read_chunk_blocks(chunk):
+        yield from data.splitlines(True)
+
+
+def read_chunk_blocks(chunk):
+    """
+    Yield the lines of a Chunk (see Chunk) as blocks of bytes holding complete lines.
+    """
+
+    with open(chunk.fname, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        started = chunk.start == 0
+        offset = chunk.start
+        partial = b""
+
+        while offset < chunk.end:
+            data, offset = _bgzf_data(f, offset)
+
+            if not started:
+                newline = data.find(b"\n")
+
+                if newline < 0:
+                    continue
+
+                started = True
+                data = data[newline + 1:]
+
+            data = partial + data
+            end = data.rfind(b"\n") + 1
+            partial = data[end:]
+
+            if end:
+                yield data[:end]
+
+        if not started:
+            return
+
+        # Complete the line started in this chunk from the following blocks
+        while offset < size:
+            data, offset = _bgzf_data(f, offset)
+            newline = data.find(b"\n")
+
+            if newline >= 0:
+                yield partial + data[:newline + 1]
+                return
+
+            partial += data
+
+        if partial:
+            yield partial
+
+
+def read_blocks(f, size=READ_SIZE):
+    """
+    Yield the lines of the binary stream f as blocks of bytes holding complete lines, reading size bytes at a time.
+    """
+
+    partial = b""
+
+    while True:
+        data = f.read(size)
+
+        if not data:
+            break
+
+        data = partial + data
+        end = data.rfind(b"\n") + 1
+        partial = data[end:]
+
+        if end:
+            yield data[:end]
+
+    if partial:
+        yield partial
+
+
+def _bit_offsets(data, magic):
+    """
+    Yield the bit offsets of the 48-bit magic in data (e.g. an mmap), in ascending order per bit alignment.
+    """
+
+    for shift in range(8):
+        # Bytes 1-5 of a 7 byte window holding the magic at bit offset shift of its first byte are fully known
+        window = (magic << (8 - shift)).to_bytes(7, "big")
+        needle = window[1:6]
+
+        i = data.find(needle, 1)
+
+        while i >= 0:
+            start = i - 1
+
+            # The magic ends in the 6th byte of the window at shift 0, in the 7th otherwise
+            if start + (6 if shift == 0 else 7) <= len(data):
+                x = int.from_bytes(data[start:start + 7].ljust(7, b"\x00"), "big")
+
+                if (x >> (8 - shift)) & 0xffffffffffff == magic:
+                    yield 8 * start + shift
+
+            i = data.find(needle, i + 1)
+
+
+def bz2_blocks(fname):
+    """
+    Return the blocks of a bzip2 file (any number of concatenated streams) as [(start, end)) bit ranges, from a
+    block magic number up to the next block or end of stream magic number, by scanning for the magic numbers
+    (no decompression). Compressed data can contain a magic number by chance (about once per 2^48 bits), such a
+    block fails to decompress in read_bz2_blocks().
+    """
+
+    with open(fname, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            starts = sorted(_bit_offsets(data, BZ2_BLOCK_MAGIC))
+            ends = sorted(set(starts[1:]) | set(_bit_offsets(data, BZ2_EOS_MAGIC)))
+
+    blocks = []
+    n = 0
+
+    for start in starts:
+        while n < len(ends) and ends[n] <= start:
+            n += 1
+
+        if n == len(ends):
+            raise ValueError(f"'{fname}' has a bzip2 block at bit {start} without end")
+
+        blocks.append((start, ends[n]))
+
+    return blocks
+
+
+def read_bz2_blocks(fname, blocks):
+    """
+    Yield the decompressed data of bzip2 blocks [(start, end)) of fname (see bz2_blocks()), each decoded on its
+    own as a single block stream.
+    """
+
+    with open(fname, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for start, end in blocks:
+            size = end - start
+            first, last = start // 8, (end + 7) // 8
+
+            block = int.from_bytes(data[first:last], "big") >> (8 * last - end) & ((1 << size) - 1)
+
+            # The CRC of a single block stream is the CRC of the block, it follows the block magic
+            crc = (block >> (size - 80)) & 0xffffffff
+
+            stream = (((int.from_bytes(b"BZh9", "big") << size | block) << 48 | BZ2_EOS_MAGIC) << 32) | crc
+            bits = 32 + size + 80
+
+            yield bz2.decompress((stream << (-bits % 8)).to_bytes((bits + 7) // 8, "big"))
+
+
+class ThreadedReader(io.RawIOBase):
+    """
+    Raw binary stream of the decompressed data of f, read READ_SIZE bytes at a time by a thread up to READ_AHEAD
+    blocks ahead of the consumer so decompression overlaps with parsing.
+    """
+
+    def __init__(self, f, size=READ_SIZE, read_ahead=READ_AHEAD):
+        self._f = f
+        self._size = size
+        self._queue = queue.Queue(read_ahead)
+        self._stopped = threading.Event()
+        self._data = memoryview(b"")
+        self._eof = False
+
+        self._thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self._thread.start()
+
+    def _read_ahead(self):
+        try:
+            while True:
+                data = self._f.read(self._size)
+
+                if not self._put(data) or not data:
+                    return
+
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self._data:
+            if self._eof:
+                return 0
+
+            item = self._queue.get()
+
+            if isinstance(item, Exception):
+                self._eof = True
+                raise item
+
+            if not item:
+                self._eof = True
+                return 0
+
+            self._data = memoryview(item)
+
+        n = min(len(b), len(self._data))
+        b[:n] = self._data[:n]
+        self._data = self._data[n:]
+
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stopped.set()
+            self._thread.join()
+            self._f.close()
+
+        super().close()
+
+
+class PipeReader(io.RawIOBase):
+    """
+    Raw binary stream of the output of command (e.g. pigz -dc fname), an OSError is raised at the end of the
+    output if the command failed.
+    """
+
+    def __init__(self, command):
+        self.command = command
+
+        # A file instead of a pipe, a command writing more warnings than a pipe buffers would block before its
+        # output is read to the end
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=self._stderr)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._process.stdout.readinto(b)
+
+        if not n and self._process.wait():
+            self._stderr.seek(0)
+            error = self._stderr.read().decode(errors="replace").strip()
+            raise OSError(f"'{' '.join(self.command)}' failed with exit status {self._process.returncode}: {error}")
+
+        return n
+
+    def close(self):
+        if not self.closed:
+            if self._process.poll() is None:
+                # Closed before the end of the output
+                self._process.kill()
+
+            self._process.wait()
+            self._process.stdout.close()
+            self._stderr.close()
+
+        super().close()
+
+
+def set_backend(backend):
+    """
+    Select the decompression backend of open_compressed() for this process and its worker processes.
+    """
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown decompression backend '{backend}', expected one of {', '.join(BACKENDS)}")
+
+    os.environ["SNPTK_DECOMPRESS"] = backend
+
+
+def get_backend():
+    return os.environ.get("SNPTK_DECOMPRESS") or DEFAULT_BACKEND
+
+
+def codec(fname):
+    """
+    Return "bz2" or "gzip" by the magic number of fname.
+    """
+
+    with open(fname, "rb") as f:
+        return "bz2" if f.read(3) == b"BZh" else "gzip"
+
+
+def external_tool(codec, parallel_only=False):
+    """
+    Return the command of the first installed external decompressor of codec (see EXTERNAL_TOOLS) or None.
+    """
+
+    for command in EXTERNAL_TOOLS[codec]:
+        if parallel_only and command[0] not in PARALLEL_TOOLS:
+            continue
+
+        if shutil.which(command[0]):
+            return command
+
+    return None
+
+
+def open_compressed(fname, mode="rb", encoding="utf-8", backend=None):
+    """
+    Open a gzip or bz2 file for reading as a binary ("rb") or text ("rt") stream decompressed by backend
+    (default: get_backend(), see BACKENDS).
+    """
+
+    backend = backend or get_backend()
+    file_codec = codec(fname)
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown decompression backend '{backend}', expected one of {', '.join(BACKENDS)}")
+
+    command = None
+
+    if backend == "external":
+        command = external_tool(file_codec)
+    elif backend == "auto":
+        command = external_tool(file_codec, parallel_only=True)
+
+    if command:
+        raw = PipeReader(command + [fname])
+    elif backend == "stdlib" or backend == "auto" and (os.cpu_count() or 1) == 1:
+        raw = None
+        f = gzip.open(fname, "rb") if file_codec == "gzip" else bz2.open(fname, "rb")
+    else:
+        raw = ThreadedReader(gzip.open(fname, "rb") if file_codec == "gzip" else bz2.open(fname, "rb"))
+
+    if raw is not None:
+        f = io.BufferedReader(raw, READ_SIZE)
+
+    if mode == "rb":
+        return f
+
+    if mode == "rt":
+        return io.TextIOWrapper(f, encoding=encoding)
+
+    f.close()
+    raise ValueError(f"Invalid mode '{mode}', expected 'rb' or 'rt'")
+
+
+@contextlib.contextmanager
+def open_blocks(source):
+    """
+    Open a gzipped file or a Chunk of a BGZF file for reading blocks of complete lines (bytes), for
+    parsers working on many lines at once instead of paying Python overhead per line.
+    """
+
+    if isinstance(source, Chunk):
+        yield read_chunk_blocks(source)
+    else:
+        with open_compressed(source, "rb") as f:
+            yield read_blocks(f)
+
+
+@contextlib.contextmanager
+def open_text(source):
+    """
+    Open a gzipped file or a Chunk of a BGZF file for reading lines of text.
+    """
+
+    if isinstance(source, Chunk):
+        yield (line.decode("utf-8") for line in read_chunk(source))
+    else:
+        with open_compressed(source, "rt") as f:
+            yield f
+
+
+def write_bgzf(f_in, f_out, level=6):
+    """
+    Compress the binary stream f_in into BGZF blocks written to the binary stream f_out.
+    """
+
+    while True:
+        data = f_in.read(BGZF_BLOCK_SIZE)
+
+        if not data:
+            break
+
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        cdata = compressor.compress(data) + compressor.flush()
+
+        f_out.write(BGZF_HEADER.pack(b"\x1f\x8b\x08\x04", 0, b"\x00\xff", 6, b"BC", 2, BGZF_HEADER.size + len(cdata) + 8 - 1))
+        f_out.write(cdata)
+        f_out.write(struct.pack("<II", zlib.crc32(data), len(data)))
+
+    f_out.write(BGZF_EOF)
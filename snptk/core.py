@@ -1,18 +1,127 @@
 #!/usr/bin/env python3
 
-import gzip
+import contextlib
+import itertools
+import marshal
+import operator
+import struct
 import sys
 import os
+import shutil
 import subprocess
+import tempfile
 
+from array import array
 from concurrent.futures import ProcessPoolExecutor
 
+import snptk.bim
+import snptk.compress
+import snptk.keys
+import snptk.metrics
+
 from snptk.util import debug
 
-def execute_load(load_func, fname, *args, merge_method="update"):
+# dbSNP chromosome names to Plink chromosome codes
+PLINK_CHROMOSOMES = {str(n): str(n) for n in range(1, 23)}
+PLINK_CHROMOSOMES.update({"X": "23", "Y": "24", "PAR": "25", "M": "26", "MT": "26"})
+
+PLINK_CHROMOSOME_CODES = {name: int(code) for name, code in PLINK_CHROMOSOMES.items()}
+
+# Whitespace of bytes.split() other than the newline between lines
+WHITESPACE = [b"\t", b" ", b"\r", b"\x0b", b"\x0c"]
+
+class WorkerPool:
+    """
+    Bounded process pool shared by several execute_load() calls of a subcommand. The processes are only
+    started when the first load actually runs in parallel.
+    """
+
+    def __init__(self, jobs=None):
+        self.jobs = jobs or os.cpu_count() or 1
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            debug(f"Starting worker pool with {self.jobs} processes...")
+            self._executor = ProcessPoolExecutor(self.jobs)
+
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def source_size(source):
+    if isinstance(source, snptk.compress.Chunk):
+        return source.end - source.start
+
+    return os.path.getsize(source)
+
+
+def load_sources(fname):
+    """
+    Return the files/BGZF chunks of fname (a file or directory of split-files) in the order their entries are
+    merged, see snptk.compress.split().
+    """
+
+    if os.path.isdir(fname):
+        return [source for f in sorted(os.listdir(fname)) for source in snptk.compress.split(os.path.join(fname, f))]
+
+    return snptk.compress.split(fname)
+
+
+def set_spool_dir(spool_dir):
     """
-    Accepts a load_* function pointer, fname, and arguments and executes using a ProcessPoolExecutor()
-    if the fname is a directory, otherwise call the function_pointer directly.
+    Write the intermediate results of parallel loads under spool_dir for this process and its worker processes.
+    """
+
+    os.environ["SNPTK_SPOOL_DIR"] = os.path.abspath(spool_dir)
+
+
+def get_spool_dir():
+    return os.environ.get("SNPTK_SPOOL_DIR") or None
+
+
+def spool_parent(size):
+    """
+    Return the directory for the intermediate results of a parallel load of size bytes of sources: SNPTK_SPOOL_DIR
+    if set, /dev/shm if it has room for size bytes (it is small in containers, e.g. 64M in Docker), otherwise the
+    system temp directory.
+    """
+
+    spool_dir = get_spool_dir()
+
+    if spool_dir:
+        return spool_dir
+
+    try:
+        st = os.statvfs("/dev/shm")
+    except OSError:
+        st = None
+
+    if st is not None and st.f_bavail * st.f_frsize >= size:
+        return "/dev/shm"
+
+    return tempfile.gettempdir()
+
+
+def execute_load(load_func, fname, *args, merge_method="update", pool=None):
+    """
+    Accepts a load_* function pointer, fname, and arguments and executes using a WorkerPool (pool or a
+    temporary one) if the fname is a directory or a BGZF file large enough to be split into chunks
+    (see snptk.compress.split()), otherwise call the function_pointer directly.
+
+    Files/chunks are submitted largest first so the longest job does not start last, results are merged
+    in (sorted) directory/file order.
 
     The result will be either a dictionary with strings as keys or a list.
     The code performs a simple merge of strings but uses extend to merge lists.
@@ -23,69 +132,280 @@ def execute_load(load_func, fname, *args, merge_method="update"):
     else:
         result = {}
 
-    if os.path.isdir(fname):
-        jobs = []
-        fnames = [os.path.join(fname, f) for f in os.listdir(fname)]
+    sources = load_sources(fname)
 
-        with ProcessPoolExecutor(len(fnames)) as p:
-            for fname in fnames:
-                if args:
-                    jobs.append(p.submit(load_func, fname, *args))
-                else:
-                    jobs.append(p.submit(load_func, fname))
+    if merge_method not in ("update", "set", "extend"):
+        raise ValueError(f"Unknown merge method '{merge_method}'")
 
-            for job in jobs:
-                if merge_method == "update" or merge_method == "set":
-                    result.update(job.result())
+    if len(sources) > 1:
+        debug(f"Loading '{fname}' as {len(sources)} files/chunks...")
 
-                elif merge_method == "extend":
-                    for k, v in job.result().items():
-                        result.setdefault(k, []).extend(v)
-                else:
-                    raise ValueError(f"Unknown merge method '{merge_method}'")
+        with contextlib.ExitStack() as stack:
+            if pool is None:
+                pool = stack.enter_context(WorkerPool(min(len(sources), os.cpu_count() or 1)))
+
+            spool_dir = tempfile.mkdtemp(prefix="snptk-load-", dir=spool_parent(sum(map(source_size, sources))))
+            stack.callback(shutil.rmtree, spool_dir)
+
+            # Publish filter sets once instead of pickling them with every job
+            args = tuple(SharedSet.publish(arg, spool_dir) if isinstance(arg, (set, frozenset)) else arg for arg in args)
+
+            jobs = {}
+
+            for source in sorted(sources, key=source_size, reverse=True):
+                jobs[source] = pool.executor.submit(snptk.metrics.worker, load_segment, str(source), load_func, source, args, spool_dir, merge_method)
+
+            for source in sources:
+                segment_fname, worker_metrics = jobs.pop(source).result()
+                snptk.metrics.add_worker(worker_metrics)
+                merge_segment(result, segment_fname, merge_method)
 
     else:
-        if args:
-            result = load_func(fname, *args)
-        else:
-            result = load_func(fname)
+        result = load_func(sources[0], *args)
+
+    # Do not keep the filter sets of this load alive through derived() in the calling process
+    _derived.clear()
 
     return result
 
 
+class SharedSet:
+    """
+    Handle to a set of keys (see snptk.keys) written once to a spool file. Only the file name is pickled to
+    workers, each worker process reads the file into a set the first time and keeps it for the following jobs.
+    """
+
+    # Per process cache {fname: set}, holds only the most recently loaded set
+    _loaded = {}
+
+    def __init__(self, fname):
+        self.fname = fname
+
+    @classmethod
+    def publish(cls, values, spool_dir):
+        fd, fname = tempfile.mkstemp(prefix="set-", dir=spool_dir)
+
+        with os.fdopen(fd, "wb") as f:
+            write_columns(f, [array("q", filter(is_int64, values))], {value for value in values if not is_int64(value)})
+
+        return cls(fname)
+
+    def load(self):
+        values = SharedSet._loaded.get(self.fname)
+
+        if values is None:
+            SharedSet._loaded.clear()
+
+            with open(self.fname, "rb") as f:
+                (members,), rest = read_columns(f, 1)
+
+            values = SharedSet._loaded[self.fname] = set(members)
+            values.update(rest)
+
+        return values
+
+
+def is_int64(key):
+    return type(key) is int and -2**63 <= key < 2**63
+
+
+def write_columns(f, columns, rest):
+    """
+    Write array('q') columns as raw machine values behind their lengths, followed by the marshalled rest (the
+    entries which do not fit into the columns, e.g. str or tuple keys, see snptk.keys).
+    """
+
+    f.write(struct.pack(f"<{len(columns)}q", *map(len, columns)))
+
+    for column in columns:
+        column.tofile(f)
+
+    marshal.dump(rest, f)
+
+
+def read_columns(f, n):
+    """
+    Read n columns and the rest written by write_columns().
+    """
+
+    columns = []
+
+    for length in struct.unpack(f"<{n}q", f.read(8 * n)):
+        column = array("q")
+        column.fromfile(f, length)
+        columns.append(column)
+
+    return columns, marshal.load(f)
+
+
+def load_segment(load_func, source, args, spool_dir, merge_method):
+    """
+    Worker side of execute_load(): run load_func and write its result (a dict or set of keys, see snptk.keys)
+    to a segment file in spool_dir instead of pickling it back to the parent. Return the segment file name.
+
+    Int keys and values are written as columns (keys and values for update, keys, value counts and all values
+    for extend, the members for set) so the parent merges them without deserializing an object per entry.
+    """
+
+    result = load_func(source, *[arg.load() if isinstance(arg, SharedSet) else arg for arg in args])
+
+    if merge_method == "set":
+        columns = [array("q", filter(is_int64, result))]
+        rest = {k for k in result if not is_int64(k)}
+
+    else:
+        columns = [array("q"), array("q")] + ([array("q")] if merge_method == "extend" else [])
+        rest = {}
+
+        for k, v in result.items():
+            if merge_method == "update" and is_int64(k) and is_int64(v):
+                columns[0].append(k)
+                columns[1].append(v)
+
+            elif merge_method == "extend" and is_int64(k) and all(map(is_int64, v)):
+                columns[0].append(k)
+                columns[1].append(len(v))
+                columns[2].extend(v)
+
+            else:
+                rest[k] = v
+
+    fd, segment_fname = tempfile.mkstemp(prefix="segment-", dir=spool_dir)
+
+    with os.fdopen(fd, "wb") as f:
+        write_columns(f, columns, rest)
+
+    return segment_fname
+
+
+def merge_segment(result, segment_fname, merge_method):
+    """
+    Parent side of execute_load(): merge a segment written by load_segment() into result with the update,
+    extend or set semantics and remove it.
+    """
+
+    with open(segment_fname, "rb") as f:
+        columns, rest = read_columns(f, {"set": 1, "update": 2, "extend": 3}[merge_method])
+
+    os.unlink(segment_fname)
+
+    # The keys of the columns and the rest are disjoint, the order they are merged in does not matter
+    if merge_method == "set":
+        result.update(columns[0], rest)
+
+    elif merge_method == "update":
+        result.update(zip(*columns))
+        result.update(rest)
+
+    elif merge_method == "extend":
+        values = iter(columns[2])
+
+        for k, v in itertools.chain(((k, list(itertools.islice(values, n))) for k, n in zip(*columns[:2])), rest.items()):
+            if k in result:
+                result[k].extend(v)
+            else:
+                result[k] = v
+
+
 def update_snp_id(snp_id, refsnp_merged):
     """
-    Pass SNP Id and using RsMerge return the merged SNP Id or the same if unchanged  if the SNP has been removed by NCBI.
+    Pass SNP Id (str or key) and using RsMerge ({rsid: merged_rsid} ints) return the key of the merged SNP Id or
+    the same if unchanged (see snptk.keys).
+
+    A merge chain running into a cycle can not be resolved: the cycle is reported once (see
+    warn_merge_cycle()) and the SNP Id is returned unmerged, as by a refsnp-merged index.
 
     Old RSMerge logic from UM example script: https://genome.sph.umich.edu/wiki/LiftRsNumber.py
     """
 
-    if snp_id.startswith("rs"):
-        snp_id = snp_id[2:]
+    if isinstance(snp_id, str):
+        if snp_id.startswith("rs"):
+            snp_id = snp_id[2:]
 
-    if not snp_id.isdigit():
-        return snp_id
+        if not snp_id.isdigit():
+            return snp_id
 
-    # snp has no merge history
-    if snp_id not in refsnp_merged:
-        return "rs" + snp_id
+        # An rsid with leading zeros has no merge history
+        snp_id = snptk.keys.rsid_key("rs" + snp_id)
+
+        if not isinstance(snp_id, int):
+            return snp_id
+
+    original = snp_id
+    path = {}
 
     while snp_id in refsnp_merged:
+        if snp_id in path:
+            warn_merge_cycle(list(path)[path[snp_id]:])
+            return original
+
+        path[snp_id] = len(path)
         snp_id = refsnp_merged[snp_id]
 
-    return "rs" + snp_id
+    return snp_id
+
+
+def merge_cycle_str(cycle):
+    """
+    Return "rs1->rs2->rs1" for the merge cycle [1, 2].
+    """
+
+    return "->".join("rs" + str(rsid) for rsid in cycle + cycle[:1])
+
+
+# Merge cycles reported by warn_merge_cycle() in this process (frozensets of their rsids)
+_reported_cycles = set()
+
+def warn_merge_cycle(cycle):
+    """
+    Warn once per process that the rsids in or leading into the merge cycle (list of rsids) are not merged.
+    """
+
+    key = frozenset(cycle)
+
+    if key not in _reported_cycles:
+        _reported_cycles.add(key)
+        print(f"Warning: merge cycle {merge_cycle_str(cycle)} in refsnp_merged, rsids in or leading into it are not merged", file=sys.stderr)
+
+
+def warn_unknown_chromosomes(fname, skipped):
+    """
+    Warn that skipped dbSNP entries of fname were ignored for a chromosome not in PLINK_CHROMOSOMES. The dbSNP
+    loaders, index builds and out-of-core joins all skip these entries, so the same input maps the same either way.
+    """
+
+    if skipped:
+        print(f"Warning: skipped {skipped} entries of dbSNP file '{fname}' with a chromosome not in {', '.join(PLINK_CHROMOSOMES)}", file=sys.stderr)
 
 
 def load_refsnp_merged(fname):
+    """
+    Read in refsnp-merged (rsid merged_rsid per line) and return {rsid: merged_rsid} (ints).
+
+    A block of lines holding two fields each is split at once and zipped into the dict, other blocks are
+    parsed line by line.
+    """
+
     refsnp_merged = {}
 
     debug(f"Loading refsnp_merged file '{fname}'...")
 
-    with gzip.open(fname, "rt", encoding="utf-8") as f:
-        for line in f:
-            fields = line.strip().split()
-            rsid, merged_rsid = fields[0], fields[1]
-            refsnp_merged[rsid] = merged_rsid
+    with snptk.compress.open_blocks(fname) as blocks:
+        for data in blocks:
+            data = data.decode("utf-8")
+            fields = data.split()
+
+            n_lines = data.count("\n") + (not data.endswith("\n"))
+            snptk.metrics.count("lines", n_lines)
+
+            if len(fields) == 2 * n_lines:
+                refsnp_merged.update(zip(map(int, fields[0::2]), map(int, fields[1::2])))
+                continue
+
+            for line in data.splitlines():
+                fields = line.strip().split()
+                rsid, merged_rsid = fields[0], fields[1]
+                refsnp_merged[int(rsid)] = int(merged_rsid)
 
     debug(f"Complete loading refsnp_merged file '{fname}'...")
 
@@ -94,63 +414,64 @@ def load_refsnp_merged(fname):
 
 def load_bim(fname, offset=0):
     """
-    Read in file with Plink BIM format (https://www.cog-genomics.org/plink2/formats#bim) and return labeled entries as a list.
+    Read in file with Plink BIM format (https://www.cog-genomics.org/plink2/formats#bim) and return labeled entries
+    as a columnar snptk.bim.Bim (a sequence of row dict views).
     """
 
-    entries = []
-
-    with open(fname) as f:
-        for line in f:
-            fields = line.strip().split()
-
-            if len(fields) != 6:
-                print(f"Invalid BIM format - len(fields)={len(fields)} but expected 6 fields={fields}", file=sys.stderr)
-                sys.exit(1)
-
-            entries.append({
-                "chromosome": fields[0],
-                "snp_id": fields[1],
-                "distance": fields[2],
-                "position": str(int(fields[3]) + offset),
-                "allele_1": fields[4],
-                "allele_2": fields[5]})
-
-    return entries
+    return snptk.bim.load_bim(fname, offset)
 
 
 def load_dbsnp_by_snp_id(fname, snp_ids, offset=0):
     """
-    Read in NCBI dbSNP and return subset of entries keyed by SNP Id. E.g.:
+    Read in NCBI dbSNP and return subset of entries keyed by SNP Id, both as keys (see snptk.keys). E.g.:
+
+        db = {123: coordinate_key(1, 1900500),
+              456: coordinate_key(2, 3434343),
+              789: ALT_ONLY}
 
-        db = {"rs123": "1:1900500",
-              "rs456": "2:3434343"}"
+    The file is scanned in blocks of bytes and the snp_id field of all lines of a block is tested against
+    snp_ids at once (see dbsnp_column()), only matching lines are decoded and parsed.
     """
 
     db = {}
 
-    plink_map = {str(n):str(n) for n in range(1, 23)}
-    plink_map.update({"X": "23", "Y": "24", "PAR": "25", "M": "26", "MT": "26"})
+    rsids = derived(snp_ids, rsid_bytes)
+
+    n_lines = candidates = false_positives = skipped = 0
 
     debug(f"Loading dbSNP file '{fname}'...")
 
-    with gzip.open(fname, "rt", encoding="utf-8") as f:
-        for line in f:
-            fields = line.strip().split()
+    with snptk.compress.open_blocks(fname) as blocks:
+        for data in blocks:
+            lines = data.split(b"\n")
+            n_lines += len(lines) - (not lines[-1])
+            hits = map(rsids.__contains__, dbsnp_column(data, lines, 0))
 
-            fields_len = len(fields)
+            for line in itertools.compress(lines, hits):
+                candidates += 1
 
-            if fields_len < 3 or fields[2] == "":
-                continue
+                fields = line.decode("utf-8").split()
+
+                fields_len = len(fields)
 
-            snp_id = "rs" + fields[0]
+                if fields_len < 3 or fields[2] == "":
+                    continue
 
-            if snp_id in snp_ids:
-                if fields[1] == 'AltOnly':
-                    db[snp_id] = ['AltOnly']
+                rsid = int(fields[0])
+
+                if rsid not in snp_ids:
+                    false_positives += 1
+                elif fields[1] == 'AltOnly':
+                    db[rsid] = snptk.keys.ALT_ONLY
+                elif fields[1] not in PLINK_CHROMOSOME_CODES:
+                    skipped += 1
                 else:
-                    chromosome = plink_map[fields[1]]
-                    position = str(int(fields[2]) + offset)
-                    db[snp_id] = chromosome + ':' + position
+                    chromosome = PLINK_CHROMOSOME_CODES[fields[1]]
+                    position = int(fields[2]) + offset
+                    db[rsid] = snptk.keys.coordinate_key(chromosome, position)
+
+    count_prefilter(fname, n_lines, candidates, false_positives)
+    warn_unknown_chromosomes(fname, skipped)
 
     debug(f"Completed loading dbSNP file '{fname}'...")
 
@@ -159,53 +480,150 @@ def load_dbsnp_by_snp_id(fname, snp_ids, offset=0):
 
 def load_dbsnp_by_coordinate(fname, coordinates, offset=0):
     """
-    Read in NCBI dbSNP and return subset of entries keyed by coordinate. E.g.:
+    Read in NCBI dbSNP and return subset of entries keyed by coordinate, both as keys (see snptk.keys). E.g.:
+
+        db = {coordinate_key(1, 1900500): [123],
+              coordinate_key(3, 2900500): [456, 789], ...}
 
-        db = {"1:1900500": ["rs123"],
-              "3:2900500": ["rs456", "rs789"], ...}
+    The file is scanned in blocks of bytes and the position field of all lines of a block is tested against
+    the positions of coordinates at once (see dbsnp_column()), only matching lines are decoded and parsed. The
+    position alone also passes the lines of the same position on other chromosomes, which are counted as false
+    positives of the prefilter.
     """
 
     db = {}
 
-    plink_map = {str(n):str(n) for n in range(1, 23)}
-    plink_map.update({"X": "23", "Y": "24", "PAR": "25", "M": "26", "MT": "26"})
+    positions = derived((coordinates, offset), dbsnp_positions)
+
+    n_lines = candidates = false_positives = skipped = 0
 
     debug(f"Loading dbSNP file '{fname}'...")
 
-    with gzip.open(fname, "rt", encoding="utf-8") as f:
-        for line in f:
-            fields = line.strip().split()
+    with snptk.compress.open_blocks(fname) as blocks:
+        for data in blocks:
+            lines = data.split(b"\n")
+            n_lines += len(lines) - (not lines[-1])
+            hits = map(positions.__contains__, dbsnp_column(data, lines, 2))
 
-            fields_len = len(fields)
+            for line in itertools.compress(lines, hits):
+                candidates += 1
 
-            if fields_len < 3 or fields[2] == "":
-                continue
+                fields = line.decode("utf-8").split()
 
-            snp_id = "rs" + fields[0]
-            chromosome = plink_map[fields[1]]
-            position = str(int(fields[2]) + offset)
+                fields_len = len(fields)
 
-            k = chromosome + ":" + position
+                rsid = int(fields[0])
+                chromosome = PLINK_CHROMOSOME_CODES.get(fields[1])
 
-            if k in coordinates:
-                if fields_len >= 4:
-                    db.setdefault(k, []).append(snp_id)
-                else:
-                    if fields[1] == "AltOnly":
-                        db[k] = ["AltOnly"]
+                if chromosome is None:
+                    skipped += 1
+                    false_positives += 1
+                    continue
+
+                position = int(fields[2]) + offset
+
+                k = snptk.keys.coordinate_key(chromosome, position)
+
+                if k in coordinates:
+                    if fields_len >= 4:
+                        db.setdefault(k, []).append(rsid)
                     else:
-                        debug("len(fields) < 4 and not AltOnly: " + str(fields))
+                        debug("len(fields) < 4 and not AltOnly: %s", fields)
+                else:
+                    false_positives += 1
+
+    count_prefilter(fname, n_lines, candidates, false_positives)
+    warn_unknown_chromosomes(fname, skipped)
 
     return db
 
 
+def count_prefilter(fname, lines, candidates, false_positives):
+    """
+    Count the lines of a dbSNP load, those passed by the prefilter and the passed ones which did not match the
+    query after parsing (see snptk.metrics.PREFILTER_COUNTERS).
+    """
+
+    snptk.metrics.count("lines", lines)
+
+    for name, n in zip(snptk.metrics.PREFILTER_COUNTERS, (lines, candidates, false_positives)):
+        snptk.metrics.count(name, n)
+
+    debug(f"Prefilter of '{fname}' passed {candidates} of {lines} lines, {false_positives} false positives (rate {snptk.metrics.false_positive_rate(lines, candidates, false_positives)})")
+
+
+def dbsnp_column(data, lines, n):
+    """
+    Return field n (bytes, b"" if missing) of all lines (data.split(b"\\n")) of a block of dbSNP data, the same as
+    line.split()[n].
+
+    The first field is cut with bytes.partition() mapped over the lines, so no Python code runs per line. Empty
+    fields behind it (e.g. the position and orientation of AltOnly and NotOn rows) do not matter there, other
+    whitespace than single tabs (or spaces) is first normalized with bytes.replace() over the whole block. A later
+    field is taken from one bytes.split() per line, which is faster than partitioning a line n + 1 times.
+    """
+
+    if n > 0:
+        return [fields[n] if len(fields) > n else b"" for fields in map(bytes.split, lines)]
+
+    sep = b"\t" if b"\t" in data else b" "
+
+    if any(ws in data for ws in WHITESPACE if ws != sep) or b"\n" + sep in data or data.startswith(sep):
+        for ws in WHITESPACE:
+            if ws != sep:
+                data = data.replace(ws, sep)
+
+        # Each pass halves the runs of separators
+        while sep + sep in data:
+            data = data.replace(sep + sep, sep)
+
+        lines = data.replace(b"\n" + sep, b"\n").lstrip(sep).split(b"\n")
+
+    return map(operator.itemgetter(0), map(bytes.partition, lines, itertools.repeat(sep)))
+
+
+def rsid_bytes(snp_ids):
+    """
+    Return the dbSNP snp_id fields (bytes without 'rs') for the SNP Id keys in snp_ids.
+    """
+
+    return set(str(snp_id).encode() for snp_id in snp_ids if isinstance(snp_id, int))
+
+
+def dbsnp_positions(coordinates_offset):
+    """
+    Return the dbSNP position fields (bytes) of (coordinate keys, offset).
+    """
+
+    coordinates, offset = coordinates_offset
+
+    return set(str((k & snptk.keys.POSITION_MASK) - offset).encode() for k in coordinates if isinstance(k, int))
+
+
+# {func: (source, value)} of the most recent derived() call per function, cleared by execute_load() in the parent
+_derived = {}
+
+def derived(source, func):
+    """
+    Return func(source), cached for the same source object so a worker running several jobs with the same
+    (shared) filter converts it only once.
+    """
+
+    cached = _derived.get(func)
+
+    if cached is None or cached[0] is not source and cached[0] != source:
+        cached = _derived[func] = (source, func(source))
+
+    return cached[1]
+
+
 def load_include_file(fname):
     unmappable_snps = set()
 
     if fname != None:
-        with gzip.open(fname, "rt") as f:
+        with snptk.compress.open_compressed(fname, "rt") as f:
             for line in f:
-                unmappable_snps.add("rs" + line.strip())
+                unmappable_snps.add(snptk.keys.rsid_key("rs" + line.strip()))
 
     return unmappable_snps
 
@@ -218,7 +636,8 @@ def cmd(commands, dryrun=False):
         print(command, file=sys.stderr)
         print(file=sys.stderr)
         if not dryrun:
-            subprocess.run(command, shell=True, check=True)
+            with snptk.metrics.stage(key):
+                subprocess.run(command, shell=True, check=True)
 
 
 def ensure_dir(path, name="directory"):
@@ -0,0 +1,103 @@
+import heapq
+import marshal
+import os
+import tempfile
+
+from snptk.util import debug
+
+DEFAULT_BUFFER_RECORDS = 5_000_000
+
+SPILL_BLOCK_RECORDS = 65536
+
+def sort(records, key=None, buffer_records=DEFAULT_BUFFER_RECORDS, tmp_dir=None):
+    """
+    Sort an iterable of records (tuples of ints/strings) which may not fit in memory.
+
+    Up to buffer_records are sorted in memory at a time and spilled to a temporary run file,
+    the runs are then merged back lazily. The sort is stable: records with equal keys are
+    returned in their input order.
+    """
+
+    with Sorter(key, buffer_records, tmp_dir) as sorter:
+        sorter.extend(records)
+        yield from sorter
+
+
+class Sorter:
+    """
+    Records added one at a time (or extend()ed) and iterated in sorted order, see sort(). Iterating again
+    repeats the merge of the runs, which are deleted by close().
+    """
+
+    def __init__(self, key=None, buffer_records=DEFAULT_BUFFER_RECORDS, tmp_dir=None):
+        self.key = key
+        self.buffer_records = buffer_records
+        self.tmp_dir = tmp_dir
+        self.count = 0
+
+        self._runs = []
+        self._buffer = []
+
+    def add(self, record):
+        self._buffer.append(record)
+        self.count += 1
+
+        if len(self._buffer) >= self.buffer_records:
+            self._flush()
+
+    def extend(self, records):
+        for record in records:
+            self.add(record)
+
+    def _flush(self):
+        self._buffer.sort(key=self.key)
+        self._runs.append(_spill(self._buffer, self.tmp_dir))
+        self._buffer = []
+
+    def __iter__(self):
+        if not self._runs:
+            self._buffer.sort(key=self.key)
+            return iter(self._buffer)
+
+        if self._buffer:
+            self._flush()
+
+        debug(f"Merging {len(self._runs)} sorted runs...")
+
+        return heapq.merge(*[_read_run(run) for run in self._runs], key=self.key)
+
+    def close(self):
+        for run in self._runs:
+            os.unlink(run)
+
+        self._runs = []
+        self._buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _spill(records, tmp_dir):
+    fd, fname = tempfile.mkstemp(prefix="snptk-sort-", suffix=".run", dir=tmp_dir)
+
+    with os.fdopen(fd, "wb") as f:
+        for n in range(0, len(records), SPILL_BLOCK_RECORDS):
+            marshal.dump(records[n:n + SPILL_BLOCK_RECORDS], f)
+
+    debug(f"Spilled {len(records)} sorted records to '{fname}'", level=2)
+
+    return fname
+
+
+def _read_run(fname):
+    with open(fname, "rb") as f:
+        while True:
+            try:
+                block = marshal.load(f)
+            except EOFError:
+                return
+
+            yield from block
@@ -0,0 +1,561 @@
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+from array import array
+from bisect import bisect_left
+from operator import itemgetter
+
+import snptk.compress
+import snptk.core
+import snptk.extsort
+import snptk.keys
+import snptk.metrics
+
+from snptk.core import PLINK_CHROMOSOMES
+from snptk.util import debug
+
+RS_ID_MAGIC = b"SNPTKRS1"
+
+COORDINATE_MAGIC = b"SNPTKCO1"
+
+REFSNP_MERGED_MAGIC = b"SNPTKRM1"
+
+HEADER = struct.Struct("<8sQ")
+
+# Plink chromosome codes 1-26 (0 is unused)
+CHROMOSOME_CODES = 27
+
+OFFSETS = struct.Struct(f"<{CHROMOSOME_CODES + 1}Q")
+
+RS_ID_COLUMNS = (("rsid", "q"), ("position", "I"), ("chromosome", "B"), ("flags", "B"))
+
+COORDINATE_COLUMNS = (("rsid", "q"), ("position", "I"))
+
+REFSNP_MERGED_COLUMNS = (("rsid", "q"), ("merged_into", "q"))
+
+FLAG_ALT_ONLY = 1
+FLAG_NO_ORIENTATION = 2
+
+def index_type(fname):
+    """
+    Return the magic of a snptk index file or None if fname is not an index (e.g. a gzip file or directory).
+    """
+
+    if not os.path.isfile(fname):
+        return None
+
+    with open(fname, "rb") as f:
+        magic = f.read(len(RS_ID_MAGIC))
+
+    if magic in (RS_ID_MAGIC, COORDINATE_MAGIC, REFSNP_MERGED_MAGIC):
+        return magic
+
+    return None
+
+
+def is_rs_id_index(fname):
+    return index_type(fname) == RS_ID_MAGIC
+
+
+def is_coordinate_index(fname):
+    return index_type(fname) == COORDINATE_MAGIC
+
+
+def is_refsnp_merged_index(fname):
+    return index_type(fname) == REFSNP_MERGED_MAGIC
+
+
+def dbsnp_fnames(fname):
+    """
+    Return the SNPChrPosOnRef file (or BGZF Chunk) itself or the sorted split-files if fname is a directory.
+    """
+
+    if not isinstance(fname, snptk.compress.Chunk) and os.path.isdir(fname):
+        return [os.path.join(fname, f) for f in sorted(os.listdir(fname))]
+
+    return [fname]
+
+
+def read_dbsnp(fname):
+    """
+    Yield (rsid, chromosome_code, position, flags) for each usable SNPChrPosOnRef line of a file or split directory.
+
+    Positions are stored as found in dbSNP (no offset applied), entries with an AltOnly chromosome
+    carry FLAG_ALT_ONLY and chromosome code 0, entries without an orientation column carry FLAG_NO_ORIENTATION.
+    """
+
+    skipped = 0
+
+    for source in dbsnp_fnames(fname):
+        debug(f"Reading dbSNP file '{source}'...")
+
+        n = 0
+
+        with snptk.compress.open_text(source) as f:
+            for n, line in enumerate(f, 1):
+                fields = line.split()
+
+                if len(fields) < 3:
+                    continue
+
+                if fields[1] == "AltOnly":
+                    yield int(fields[0]), 0, 0, FLAG_ALT_ONLY | FLAG_NO_ORIENTATION
+                    continue
+
+                chromosome = PLINK_CHROMOSOMES.get(fields[1])
+
+                if chromosome is None:
+                    skipped += 1
+                    continue
+
+                yield int(fields[0]), int(chromosome), int(fields[2]), 0 if len(fields) >= 4 else FLAG_NO_ORIENTATION
+
+        snptk.metrics.count("lines", n)
+
+    snptk.core.warn_unknown_chromosomes(fname, skipped)
+
+
+def build_rs_id_index(dbsnp_fname, output_fname, buffer_records=snptk.extsort.DEFAULT_BUFFER_RECORDS, tmp_dir=None):
+    """
+    Convert an NCBI SNPChrPosOnRef file (or directory w/ split-files) into a binary index sorted by rsid.
+
+    Layout (little-endian): header (magic, count), int64 rsid[count], uint32 position[count],
+    uint8 chromosome[count], uint8 flags[count].
+
+    If an rsid occurs more than once, the last entry wins, as in load_dbsnp_by_snp_id().
+    """
+
+    with ColumnWriter(RS_ID_COLUMNS, tmp_dir) as writer:
+        records = ((rsid, position, chromosome, flags) for rsid, chromosome, position, flags in read_dbsnp(dbsnp_fname))
+        previous = None
+
+        for record in snptk.extsort.sort(records, key=itemgetter(0), buffer_records=buffer_records, tmp_dir=writer.tmp_dir):
+            if previous is not None and previous[0] != record[0]:
+                writer.append(previous)
+
+            previous = record
+
+        if previous is not None:
+            writer.append(previous)
+
+        writer.write(output_fname, HEADER.pack(RS_ID_MAGIC, writer.count))
+
+    debug(f"Wrote {writer.count} entries to rsid index '{output_fname}'")
+
+    return writer.count
+
+
+def build_coordinate_index(dbsnp_fname, output_fname, buffer_records=snptk.extsort.DEFAULT_BUFFER_RECORDS, tmp_dir=None):
+    """
+    Convert an NCBI SNPChrPosOnRef file (or directory w/ split-files) into a binary index of positions sorted per chromosome.
+
+    Layout (little-endian): header (magic, count), uint64 chromosome_offsets[CHROMOSOME_CODES + 1],
+    int64 rsid[count], uint32 position[count]. Rows of chromosome code c are [offsets[c], offsets[c + 1]).
+
+    All entries of a multi-mapping position are kept in file order, as in load_dbsnp_by_coordinate(),
+    which also ignores entries without an orientation (i.e. AltOnly).
+    """
+
+    records = ((chromosome, position, rsid) for rsid, chromosome, position, flags in read_dbsnp(dbsnp_fname) if not flags)
+
+    offsets = [0] * (CHROMOSOME_CODES + 1)
+
+    with ColumnWriter(COORDINATE_COLUMNS, tmp_dir) as writer:
+        for chromosome, position, rsid in snptk.extsort.sort(records, key=itemgetter(0, 1), buffer_records=buffer_records, tmp_dir=writer.tmp_dir):
+            writer.append((rsid, position))
+            offsets[chromosome + 1] = writer.count
+
+        for code in range(1, CHROMOSOME_CODES + 1):
+            offsets[code] = max(offsets[code], offsets[code - 1])
+
+        writer.write(output_fname, HEADER.pack(COORDINATE_MAGIC, writer.count) + OFFSETS.pack(*offsets))
+
+    debug(f"Wrote {writer.count} entries to coordinate index '{output_fname}'")
+
+    return writer.count
+
+
+def build_refsnp_merged_index(refsnp_merged_fname, output_fname, tmp_dir=None, pool=None):
+    """
+    Compile a refsnp-merged tsv file (or directory w/ split-files) into a binary table mapping each merged
+    rsid directly to the final rsid of its merge chain.
+
+    Layout (little-endian): header (magic, count), int64 rsid[count] (sorted), int64 merged_into[count].
+
+    Chains ending in a cycle can not be resolved, they are reported and left out of the table.
+    """
+
+    refsnp_merged = snptk.core.execute_load(snptk.core.load_refsnp_merged, refsnp_merged_fname, merge_method="update", pool=pool)
+
+    resolved, cycles = resolve_refsnp_merged({int(k): int(v) for k, v in refsnp_merged.items()})
+
+    del refsnp_merged
+
+    if cycles:
+        print(f"Warning: {len(cycles)} merge cycles in '{refsnp_merged_fname}', rsids in or leading into a cycle are not merged: " +
+              ", ".join(map(snptk.core.merge_cycle_str, cycles[:10])) +
+              (", ..." if len(cycles) > 10 else ""), file=sys.stderr)
+
+        for cycle in cycles:
+            debug("Merge cycle: " + snptk.core.merge_cycle_str(cycle), level=2)
+
+    with ColumnWriter(REFSNP_MERGED_COLUMNS, tmp_dir) as writer:
+        for rsid in sorted(resolved):
+            if resolved[rsid] is not None:
+                writer.append((rsid, resolved[rsid]))
+
+        writer.write(output_fname, HEADER.pack(REFSNP_MERGED_MAGIC, writer.count))
+
+    debug(f"Wrote {writer.count} entries to refsnp-merged index '{output_fname}'")
+
+    return writer.count
+
+
+def resolve_refsnp_merged(refsnp_merged):
+    """
+    Resolve every merge chain of refsnp_merged (int -> int) to its final rsid with path compression.
+
+    Return (resolved, cycles) where resolved maps each merged rsid to its final rsid, or None if the chain runs
+    into a cycle, and cycles is a list of the cycles found (each a list of rsids).
+    """
+
+    resolved = {}
+    cycles = []
+
+    for rsid in refsnp_merged:
+        if rsid in resolved:
+            continue
+
+        path = []
+        on_path = {}
+
+        while rsid in refsnp_merged and rsid not in resolved and rsid not in on_path:
+            on_path[rsid] = len(path)
+            path.append(rsid)
+            rsid = refsnp_merged[rsid]
+
+        if rsid in on_path:
+            cycles.append(path[on_path[rsid]:])
+            final = None
+        elif rsid in resolved:
+            final = resolved[rsid]
+        else:
+            final = rsid
+
+        for merged in path:
+            resolved[merged] = final
+
+    return resolved, cycles
+
+
+class ColumnWriter:
+    """
+    Accumulate rows into per-column temporary files and assemble them, after a header, into one index file.
+    """
+
+    def __init__(self, columns, tmp_dir=None):
+        self.tmp_dir = tempfile.mkdtemp(prefix="snptk-index-", dir=tmp_dir)
+        self.count = 0
+
+        self._columns = [array(typecode) for name, typecode in columns]
+        self._files = [open(os.path.join(self.tmp_dir, name), "wb") for name, typecode in columns]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for f in self._files:
+            f.close()
+
+        shutil.rmtree(self.tmp_dir)
+
+    def append(self, row):
+        for column, value in zip(self._columns, row):
+            column.append(value)
+
+        self.count += 1
+
+        if len(self._columns[0]) >= 65536:
+            self._flush()
+
+    def _flush(self):
+        for column, f in zip(self._columns, self._files):
+            column.tofile(f)
+            del column[:]
+
+    def write(self, fname, header):
+        """
+        Write the index to fname through a temporary file renamed into place, so readers of fname (e.g. other
+        jobs sharing it) never see a partial index.
+        """
+
+        self._flush()
+
+        tmp_fname = f"{fname}.{os.getpid()}.tmp"
+
+        try:
+            with open(tmp_fname, "wb") as f:
+                f.write(header)
+
+                for column_file in self._files:
+                    column_file.close()
+
+                    with open(column_file.name, "rb") as f_column:
+                        shutil.copyfileobj(f_column, f)
+
+            os.replace(tmp_fname, fname)
+
+        except BaseException:
+            if os.path.exists(tmp_fname):
+                os.unlink(tmp_fname)
+            raise
+
+
+class MappedIndex:
+    """
+    Base class for read-only, memory-mapped index files: maps the file, checks the magic and exposes column views.
+    """
+
+    magic = None
+
+    def __init__(self, fname):
+        self.fname = fname
+
+        with open(fname, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._view = memoryview(self._mmap)
+        self._views = []
+
+        try:
+            magic, self.count = HEADER.unpack_from(self._mmap)
+        except struct.error:
+            self.close()
+            raise
+
+        if magic != self.magic:
+            self.close()
+            raise ValueError(f"'{fname}' is not a {type(self).__name__} file")
+
+    def _columns(self, offset, columns):
+        """
+        Return memoryviews for consecutive columns of self.count items starting at byte offset.
+        """
+
+        views = []
+
+        for name, typecode in columns:
+            size = array(typecode).itemsize * self.count
+
+            if offset + size > len(self._mmap):
+                self.close()
+                raise ValueError(f"index '{self.fname}' is truncated or corrupt (size={len(self._mmap)})")
+
+            views.append(self._view[offset:offset + size].cast(typecode))
+            offset += size
+
+        if offset != len(self._mmap):
+            self.close()
+            raise ValueError(f"index '{self.fname}' is corrupt (size={len(self._mmap)} expected={offset})")
+
+        self._views.extend(views)
+
+        return views
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for view in self._views + [self._view]:
+            view.release()
+
+        self._mmap.close()
+
+
+class RsIdIndex(MappedIndex):
+    """
+    Memory-mapped view of an index written by build_rs_id_index().
+    """
+
+    magic = RS_ID_MAGIC
+
+    def __init__(self, fname):
+        super().__init__(fname)
+
+        self.rsids, self.positions, self.chromosomes, self.flags = self._columns(HEADER.size, RS_ID_COLUMNS)
+
+    def find(self, rsids):
+        """
+        Yield (rsid, row) for each rsid (int) present in the index using one sorted pass of binary searches.
+        """
+
+        lo, n = 0, len(self.rsids)
+
+        for rsid in sorted(set(rsids)):
+            lo = bisect_left(self.rsids, rsid, lo)
+
+            if lo == n:
+                return
+
+            if self.rsids[lo] == rsid:
+                yield rsid, lo
+
+    def lookup(self, snp_ids, offset=0):
+        """
+        Return the subset of entries keyed by SNP Id in the same form as snptk.core.load_dbsnp_by_snp_id().
+        """
+
+        db = {}
+
+        for rsid, row in self.find(snp_id for snp_id in snp_ids if isinstance(snp_id, int)):
+            if self.flags[row] & FLAG_ALT_ONLY:
+                db[rsid] = snptk.keys.ALT_ONLY
+            else:
+                db[rsid] = snptk.keys.coordinate_key(self.chromosomes[row], self.positions[row] + offset)
+
+        return db
+
+
+class CoordinateIndex(MappedIndex):
+    """
+    Memory-mapped view of an index written by build_coordinate_index().
+    """
+
+    magic = COORDINATE_MAGIC
+
+    def __init__(self, fname):
+        super().__init__(fname)
+
+        self.offsets = OFFSETS.unpack_from(self._mmap, HEADER.size)
+        self.rsids, self.positions = self._columns(HEADER.size + OFFSETS.size, COORDINATE_COLUMNS)
+
+    def find(self, chromosome, positions):
+        """
+        Yield (position, rows) for each position (int, as in dbSNP) present on chromosome (Plink code) using one
+        sorted pass of binary searches. rows is the range of index rows at that position.
+        """
+
+        lo, hi = self.offsets[chromosome], self.offsets[chromosome + 1]
+
+        for position in sorted(set(positions)):
+            lo = bisect_left(self.positions, position, lo, hi)
+
+            if lo == hi:
+                return
+
+            end = lo
+
+            while end < hi and self.positions[end] == position:
+                end += 1
+
+            if end > lo:
+                yield position, range(lo, end)
+
+    def lookup(self, coordinates, offset=0):
+        """
+        Return the subset of entries keyed by coordinate in the same form as snptk.core.load_dbsnp_by_coordinate().
+        """
+
+        by_chromosome = {}
+
+        for k in coordinates:
+            if not isinstance(k, int):
+                continue
+
+            chromosome, position = snptk.keys.unpack_coordinate(k)
+
+            if 0 < chromosome < CHROMOSOME_CODES:
+                by_chromosome.setdefault(chromosome, {})[position - offset] = k
+
+        db = {}
+
+        for chromosome, keys in by_chromosome.items():
+            for position, rows in self.find(chromosome, keys):
+                db[keys[position]] = [self.rsids[row] for row in rows]
+
+        return db
+
+
+class RefSnpMergedIndex(MappedIndex):
+    """
+    Memory-mapped view of a table written by build_refsnp_merged_index().
+    """
+
+    magic = REFSNP_MERGED_MAGIC
+
+    def __init__(self, fname):
+        super().__init__(fname)
+
+        self.rsids, self.merged_into = self._columns(HEADER.size, REFSNP_MERGED_COLUMNS)
+
+    def update_snp_ids(self, snp_ids):
+        """
+        Return the list of updated SNP Id keys for snp_ids (str or keys, same order) with the semantics of
+        snptk.core.update_snp_id(), resolving all of them in one sorted pass of binary searches.
+        """
+
+        keys = []
+
+        for snp_id in snp_ids:
+            if isinstance(snp_id, str):
+                if snp_id.startswith("rs"):
+                    snp_id = snp_id[2:]
+
+                if snp_id.isdigit():
+                    snp_id = snptk.keys.rsid_key("rs" + snp_id)
+
+            keys.append(snp_id)
+
+        merged_into = {}
+        lo, n = 0, len(self.rsids)
+
+        for rsid in sorted(set(k for k in keys if isinstance(k, int))):
+            lo = bisect_left(self.rsids, rsid, lo)
+
+            if lo == n:
+                break
+
+            if self.rsids[lo] == rsid:
+                merged_into[rsid] = self.merged_into[lo]
+
+        return [merged_into.get(k, k) for k in keys]
+
+
+def load_dbsnp_by_snp_id(fname, snp_ids, offset=0):
+    """
+    Drop-in replacement for snptk.core.load_dbsnp_by_snp_id() reading from an rsid index.
+    """
+
+    debug(f"Loading dbSNP rsid index '{fname}'...")
+
+    with RsIdIndex(fname) as index:
+        db = index.lookup(snp_ids, offset)
+
+    debug(f"Completed loading dbSNP rsid index '{fname}'...")
+
+    return db
+
+
+def load_dbsnp_by_coordinate(fname, coordinates, offset=0):
+    """
+    Drop-in replacement for snptk.core.load_dbsnp_by_coordinate() reading from a coordinate index.
+    """
+
+    debug(f"Loading dbSNP coordinate index '{fname}'...")
+
+    with CoordinateIndex(fname) as index:
+        db = index.lookup(coordinates, offset)
+
+    debug(f"Completed loading dbSNP coordinate index '{fname}'...")
+
+    return db
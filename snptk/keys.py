@@ -0,0 +1,106 @@
+# Variant keys used internally by the loaders and the mapping logic instead of strings:
+#
+# - SNP Ids "rs<digits>" are the int of their digits, any other SNP Id (which can not be in dbSNP, e.g. exm123 or
+#   rs0123) stays a str
+# - coordinates are packed into one int: Plink chromosome code << 32 | position. A coordinate which can not be
+#   packed (e.g. chromosome X in a BIM or a negative position) is a (chromosome, position) tuple instead
+#
+# Ints hash and compare faster and take about half the memory of the strings, and an int never equals a str or
+# tuple so unpacked keys never match dbSNP keys, just as their strings did not. Keys are converted back to
+# strings only when the map files are written.
+
+CHROMOSOME_SHIFT = 32
+
+POSITION_MASK = (1 << CHROMOSOME_SHIFT) - 1
+
+# dbSNP value (instead of a coordinate key) of an AltOnly entry, as the ['AltOnly'] of the string form
+ALT_ONLY = ["AltOnly"]
+
+def rsid_key(snp_id):
+    """
+    Return the key of a SNP Id: the int of "rs<digits>" or the SNP Id itself.
+    """
+
+    digits = snp_id[2:]
+
+    if snp_id.startswith("rs") and digits.isdigit() and not digits.startswith("0"):
+        return int(digits)
+
+    return snp_id
+
+
+def rsid_str(key):
+    """
+    Return the SNP Id of a key from rsid_key().
+    """
+
+    if isinstance(key, int):
+        return "rs" + str(key)
+
+    return key
+
+
+def is_rsid(key):
+    """
+    Return True for the key of a SNP Id starting with "rs" (which the string logic tested with startswith("rs")).
+    """
+
+    return isinstance(key, int) or key.startswith("rs")
+
+
+def chromosome_code(chromosome):
+    """
+    Return a Plink chromosome code as int or, if it is not a plain number (e.g. X or 01), the str itself.
+    """
+
+    if chromosome.isdigit() and (chromosome == "0" or not chromosome.startswith("0")):
+        return int(chromosome)
+
+    return chromosome
+
+
+def coordinate_key(chromosome, position):
+    """
+    Return the key of a coordinate (chromosome code or name, int position).
+    """
+
+    code = chromosome_code(chromosome) if isinstance(chromosome, str) else chromosome
+
+    if isinstance(code, int) and 0 <= position <= POSITION_MASK:
+        return code << CHROMOSOME_SHIFT | position
+
+    return (code, position)
+
+
+def parse_coordinate(coordinate):
+    """
+    Return the key of a "chromosome:position" string or None if the position is not a number.
+    """
+
+    chromosome, _, position = coordinate.partition(":")
+
+    if not position.lstrip("-").isdigit():
+        return None
+
+    return coordinate_key(chromosome, int(position))
+
+
+def unpack_coordinate(key):
+    """
+    Return (chromosome code, position) of a coordinate key.
+    """
+
+    if isinstance(key, int):
+        return key >> CHROMOSOME_SHIFT, key & POSITION_MASK
+
+    return key
+
+
+def coordinate_str(key):
+    """
+    Return the "chromosome:position" string of a coordinate key.
+    """
+
+    chromosome, position = unpack_coordinate(key)
+
+    return str(chromosome) + ":" + str(position)
@@ -0,0 +1,247 @@
+import contextlib
+import cProfile
+import json
+import os
+import resource
+import socket
+import sys
+import time
+
+from collections import Counter
+
+# Per process event counters (e.g. lines read by the loaders), cheap enough to update whether or not metrics
+# are recorded
+counters = Counter()
+
+# Counters of the dbSNP loaders' line prefilter (see snptk.core.count_prefilter()): lines tested, lines passed
+# and passed lines not matching the query after all
+PREFILTER_COUNTERS = ("prefilter_lines", "prefilter_candidates", "prefilter_false_positives")
+
+# Recorder of the running subcommand, None unless --profile/--metrics-json/--profile-dir was given
+_recorder = None
+
+def count(name, n=1):
+    counters[name] += n
+
+
+def false_positive_rate(lines, candidates, false_positives):
+    """
+    Return the share of the lines not matching the query which passed the prefilter anyway, None without any.
+    """
+
+    negatives = lines - (candidates - false_positives)
+
+    return round(false_positives / negatives, 6) if negatives > 0 else None
+
+
+def add_prefilter_rate(record):
+    if record.get("prefilter_lines"):
+        record["prefilter_false_positive_rate"] = false_positive_rate(*(record[name] for name in PREFILTER_COUNTERS))
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """
+    Return the peak resident set size in MiB of this process (RUSAGE_SELF) or of its largest waited-for
+    child process (RUSAGE_CHILDREN).
+    """
+
+    maxrss = resource.getrusage(who).ru_maxrss
+
+    # bytes on macOS, KiB elsewhere
+    return maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def snapshot():
+    """
+    Return (wall, cpu, children cpu, lines, *prefilter counters) seconds/counts to compute deltas from.
+    """
+
+    t = os.times()
+
+    return (time.perf_counter(), t.user + t.system, t.children_user + t.children_system, counters["lines"]) + tuple(counters[name] for name in PREFILTER_COUNTERS)
+
+
+def deltas(started):
+    wall, cpu, children_cpu, lines, *prefilter = (b - a for a, b in zip(started, snapshot()))
+
+    record = {
+        "wall_s": round(wall, 6),
+        "cpu_s": round(cpu, 6),
+        "children_cpu_s": round(children_cpu, 6),
+        "lines": lines,
+        "lines_per_s": round(lines / wall, 1) if wall > 0 else None}
+
+    # Only stages which loaded dbSNP through the prefilter report it
+    if prefilter[0]:
+        record.update(zip(PREFILTER_COUNTERS, prefilter))
+        add_prefilter_rate(record)
+
+    return record
+
+
+def worker(func, label, *args):
+    """
+    Run func(*args) in a worker process and return (result, metrics of the job) for add_worker() in the parent.
+    """
+
+    started = snapshot()
+
+    result = func(*args)
+
+    record = {"source": label, "pid": os.getpid()}
+    record.update(deltas(started))
+    record["peak_rss_mb"] = round(peak_rss_mb(), 1)
+
+    return result, record
+
+
+def add_worker_lines(record, workers):
+    """
+    Add the lines read (and prefilter counters) by workers to those of the parent in record.
+    """
+
+    if workers:
+        record["lines"] += sum(w["lines"] for w in workers)
+        record["lines_per_s"] = round(record["lines"] / record["wall_s"], 1) if record["wall_s"] > 0 else None
+
+        if any(w.get("prefilter_lines") for w in workers):
+            for name in PREFILTER_COUNTERS:
+                record[name] = record.get(name, 0) + sum(w.get(name, 0) for w in workers)
+
+            add_prefilter_rate(record)
+
+
+def add_worker(record):
+    """
+    Attach the metrics of a worker job (see worker()) to the current stage.
+    """
+
+    if _recorder is not None and _recorder.current is not None:
+        _recorder.current.setdefault("workers", []).append(record)
+
+
+class Recorder:
+    """
+    Collects the stages of a subcommand run and writes them as JSON and/or a table on stderr.
+    """
+
+    def __init__(self, command, argv=None, profile_dir=None):
+        self.command = command
+        self.argv = argv if argv is not None else sys.argv
+        self.profile_dir = profile_dir
+        self.stages = []
+        self.current = None
+
+        self._started = snapshot()
+        self._started_at = time.strftime("%FT%TZ", time.gmtime())
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.current is not None:
+            # Nested stages are accounted to the enclosing one
+            yield
+            return
+
+        record = self.current = {"name": name}
+        profiler = cProfile.Profile() if self.profile_dir else None
+        started = snapshot()
+
+        try:
+            if profiler:
+                profiler.enable()
+
+            yield
+
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self.profile_dir, f"{len(self.stages):02d}-{name.replace(' ', '_')}.prof"))
+
+            record.update(deltas(started))
+            add_worker_lines(record, record.get("workers", []))
+            record["peak_rss_mb"] = round(peak_rss_mb(), 1)
+            record["children_peak_rss_mb"] = round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1)
+
+            self.stages.append(record)
+            self.current = None
+
+    def summary(self):
+        workers = [w for stage in self.stages for w in stage.get("workers", [])]
+
+        metrics = {
+            "command": self.command,
+            "argv": self.argv,
+            "hostname": socket.gethostname(),
+            "started": self._started_at,
+            "stages": self.stages}
+
+        metrics.update(deltas(self._started))
+        add_worker_lines(metrics, workers)
+
+        metrics["peak_rss_mb"] = round(peak_rss_mb(), 1)
+        metrics["children_peak_rss_mb"] = round(max([peak_rss_mb(resource.RUSAGE_CHILDREN)] + [w["peak_rss_mb"] for w in workers]), 1)
+
+        return metrics
+
+    def write_json(self, fname):
+        with open(fname, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+            print(file=f)
+
+    def print_table(self, f=sys.stderr):
+        metrics = self.summary()
+
+        print(f"{'stage':<32} {'wall (s)':>10} {'cpu (s)':>10} {'child cpu (s)':>14} {'peak rss (MiB)':>15} {'lines/s':>12} {'workers':>8}", file=f)
+
+        total = dict(metrics, name="total", workers=[w for stage in metrics["stages"] for w in stage.get("workers", [])])
+
+        for stage in metrics["stages"] + [total]:
+            lines_per_s = f"{stage['lines_per_s']:.0f}" if stage["lines"] and stage["lines_per_s"] else "-"
+
+            print(f"{stage['name']:<32} {stage['wall_s']:>10.3f} {stage['cpu_s']:>10.3f} {stage['children_cpu_s']:>14.3f} " +
+                  f"{stage['peak_rss_mb']:>15.1f} {lines_per_s:>12} {len(stage.get('workers', [])):>8}", file=f)
+
+
+@contextlib.contextmanager
+def recording(command, profile=False, metrics_json=None, profile_dir=None):
+    """
+    Record the stages of a subcommand run if profile (table on stderr), metrics_json (JSON file) or profile_dir
+    (cProfile output per stage) is set, otherwise stage() stays a no-op.
+    """
+
+    global _recorder
+
+    if not (profile or metrics_json or profile_dir):
+        yield None
+        return
+
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+    _recorder = Recorder(command, profile_dir=profile_dir)
+
+    try:
+        yield _recorder
+
+    finally:
+        recorder, _recorder = _recorder, None
+
+        if metrics_json:
+            recorder.write_json(metrics_json)
+
+        if profile:
+            recorder.print_table()
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Account the enclosed block as stage name of the running subcommand (see recording()).
+    """
+
+    if _recorder is None:
+        yield
+        return
+
+    with _recorder.stage(name):
+        yield
@@ -0,0 +1,352 @@
+import itertools
+import os
+
+from operator import itemgetter
+
+import snptk.bim
+import snptk.compress
+import snptk.core
+import snptk.extsort
+import snptk.index
+import snptk.keys
+import snptk.metrics
+
+from snptk.core import PLINK_CHROMOSOMES
+from snptk.util import debug, debug_enabled, debug_tallies, tally
+
+# Rough memory of a buffered sort record (a tuple of an int and a few short strings)
+RECORD_BYTES = 300
+
+# Sort buffers filled at the same time (the BIM join, the map entries and two while resolving merges or
+# joining dbSNP), the memory budget is split between them
+CONCURRENT_SORTS = 4
+
+# Map files in the order of their file numbers in the output records
+MAP_FILES = ["deleted_snps.txt", "updated_snps.txt", "coord_update.txt", "chr_update.txt"]
+
+DELETED, UPDATED, COORD_UPDATE, CHR_UPDATE = range(len(MAP_FILES))
+
+first_field = itemgetter(0)
+
+def buffer_records(max_memory):
+    """
+    Return the records each sort may buffer in memory to stay within about max_memory bytes.
+    """
+
+    return max(1000, max_memory // (RECORD_BYTES * CONCURRENT_SORTS))
+
+
+class SortedLookup:
+    """
+    Look up ascending keys in records sorted by their first field, the last record of a key wins (as when the
+    records are loaded into a dict in input order).
+    """
+
+    def __init__(self, records):
+        self._groups = itertools.groupby(records, key=first_field)
+        self._key = None
+        self._record = None
+        self._exhausted = False
+
+    def get(self, key):
+        while not self._exhausted and (self._key is None or self._key < key):
+            try:
+                self._key, group = next(self._groups)
+            except StopIteration:
+                self._exhausted = True
+                break
+
+            for self._record in group:
+                pass
+
+        return self._record if self._key == key else None
+
+
+def read_pairs(fname):
+    """
+    Yield the first two fields of each line of a refsnp-merged file or directory of split-files in load order.
+    """
+
+    for source in snptk.core.load_sources(fname):
+        with snptk.compress.open_blocks(source) as blocks:
+            for data in blocks:
+                lines = data.decode("utf-8").splitlines()
+                snptk.metrics.count("lines", len(lines))
+
+                for line in lines:
+                    fields = line.split()
+                    yield fields[0], fields[1]
+
+
+def read_dbsnp(fname):
+    """
+    Yield ("rs" + rsid, chromosome, position) of the dbSNP entries with a position (as kept by
+    snptk.core.load_dbsnp_by_snp_id()) of a SNPChrPosOnRef file or directory of split-files in load order.
+
+    Entries with a chromosome not in PLINK_CHROMOSOMES are skipped with a warning, as by the loader.
+    """
+
+    skipped = 0
+
+    for source in snptk.core.load_sources(fname):
+        with snptk.compress.open_blocks(source) as blocks:
+            for data in blocks:
+                lines = data.decode("utf-8").splitlines()
+                snptk.metrics.count("lines", len(lines))
+
+                for line in lines:
+                    fields = line.split()
+
+                    if len(fields) < 3:
+                        continue
+
+                    if fields[1] == "AltOnly" or fields[1] in PLINK_CHROMOSOMES:
+                        yield "rs" + fields[0], fields[1], fields[2]
+                    else:
+                        skipped += 1
+
+    snptk.core.warn_unknown_chromosomes(fname, skipped)
+
+
+def resolve_snp_ids(bim_records, refsnp_merged_fname, join, sort_args):
+    """
+    Add (snp_id_new, i, snp_id, coordinate) of each BIM entry (i, snp_id, coordinate) to the join Sorter with
+    the semantics of snptk.core.update_snp_id().
+
+    Merge chains are followed one link per round: the SNP Ids still being merged are sorted and merge-joined with
+    refsnp-merged sorted by the merged SNP Id, until no SNP Id moves any more. A chain running into a cycle is
+    reported and its SNP Id left unmerged.
+    """
+
+    if snptk.index.is_refsnp_merged_index(refsnp_merged_fname):
+        with snptk.index.RefSnpMergedIndex(refsnp_merged_fname) as refsnp_merged:
+            for batch in iter(lambda: list(itertools.islice(bim_records, sort_args["buffer_records"])), []):
+                snp_ids_new = map(snptk.keys.rsid_str, refsnp_merged.update_snp_ids([snp_id for _, snp_id, _ in batch]))
+
+                for (i, snp_id, coordinate), snp_id_new in zip(batch, snp_ids_new):
+                    join.add((snp_id_new, i, snp_id, coordinate))
+        return
+
+    with snptk.extsort.Sorter(first_field, **sort_args) as refsnp_merged:
+        refsnp_merged.extend(read_pairs(refsnp_merged_fname))
+
+        debug(f"Sorted {refsnp_merged.count} refsnp_merged entries...")
+
+        pending = snptk.extsort.Sorter(first_field, **sort_args)
+
+        for i, snp_id, coordinate in bim_records:
+            digits = snp_id[2:] if snp_id.startswith("rs") else snp_id
+
+            if digits.isdigit():
+                pending.add((digits, i, snp_id, coordinate, ()))
+            else:
+                join.add((digits, i, snp_id, coordinate))
+
+        rounds = 0
+
+        while pending.count:
+            rounds += 1
+            merged = snptk.extsort.Sorter(first_field, **sort_args)
+            lookup = SortedLookup(refsnp_merged)
+
+            with pending:
+                try:
+                    for digits, i, snp_id, coordinate, seen in pending:
+                        entry = lookup.get(digits)
+
+                        if entry is None:
+                            join.add(("rs" + digits, i, snp_id, coordinate))
+                            continue
+
+                        seen += (digits,)
+
+                        if entry[1] in seen:
+                            snptk.core.warn_merge_cycle([int(rsid) for rsid in seen[seen.index(entry[1]):]])
+                            join.add(("rs" + seen[0], i, snp_id, coordinate))
+                            continue
+
+                        merged.add((entry[1], i, snp_id, coordinate, seen))
+                except BaseException:
+                    merged.close()
+                    raise
+
+            pending = merged
+
+        debug(f"Resolved refsnp_merged chains in {rounds} rounds...")
+
+
+def map_group(snp_id_new, variants, in_original, coordinate, unmappable, output, debugging):
+    """
+    Apply the rules of snptk.app.map_using_rs_id_logic() to the BIM entries variants [(snp_id_new, i, snp_id,
+    coordinate)] (ascending i) sharing snp_id_new, adding (i, map file number, entry) to output.
+
+    in_original is True if snp_id_new is the (original) SNP Id of any BIM entry, coordinate the dbSNP entry of
+    snp_id_new or None and unmappable True if snp_id_new is in the include file.
+    """
+
+    already_updated = False
+
+    for _, i, snp_id, original_coord in variants:
+        # If the snp has been updated (merged)
+        if snp_id_new != snp_id:
+            if in_original:
+                if debugging:
+                    tally("MERGED_INTO_ORIGINAL", "%s was merged into %s which is already present", snp_id, snp_id_new)
+
+                output.add((i, DELETED, snp_id))
+
+            elif coordinate is not None or unmappable:
+                # If snp already being updated avoids duplicate snps
+                if already_updated:
+                    output.add((i, DELETED, snp_id))
+                    continue
+
+                output.add((i, UPDATED, snp_id + "\t" + snp_id_new))
+                already_updated = True
+
+                if coordinate is None:
+                    if debugging:
+                        tally("MERGED_MULTI_POSITION", "%s was updated to %s but cannot be updated by chr:position due to having multiple positions inside of GRCh37 VCF file", snp_id, snp_id_new)
+
+                    continue
+
+                if debugging:
+                    tally("MERGED", "%s original_coord=%s updated_coord=%s", snp_id_new, original_coord, coordinate, level=2)
+
+                new_chromosome, new_position = coordinate.split(":")
+                original_chromosome, original_position = original_coord.split(":")
+
+                if new_position != original_position:
+                    output.add((i, COORD_UPDATE, snp_id_new + "\t" + new_position))
+
+                if new_chromosome != original_chromosome:
+                    output.add((i, CHR_UPDATE, snp_id_new + "\t" + new_chromosome))
+
+            else:
+                if debugging:
+                    tally("MERGED_NOT_IN_DBSNP", "%s was merged into %s which is not in dbSNP", snp_id, snp_id_new)
+
+                output.add((i, DELETED, snp_id))
+
+        # If snp_id was not merged and is the same as snp_id_new (no change)
+        elif coordinate is not None:
+            if debugging:
+                tally("MAPPED", "%s original_coord=%s updated_coord=%s", snp_id, original_coord, coordinate, level=2)
+
+            new_chromosome, new_position = coordinate.split(":")
+            original_chromosome, original_position = original_coord.split(":")
+
+            if new_position != original_position:
+                output.add((i, COORD_UPDATE, snp_id + "\t" + new_position))
+
+            if new_chromosome != original_chromosome:
+                output.add((i, CHR_UPDATE, snp_id + "\t" + new_chromosome))
+
+        elif unmappable:
+            if debugging:
+                tally("MULTI_POSITION", "%s cannot be updated due to having multiple positions inside of GRCh37 VCF file", snp_id)
+
+        # If snp_id is not in dbsnp it has been deleted
+        else:
+            if debugging:
+                tally("NOT_IN_DBSNP", "%s", snp_id)
+
+            output.add((i, DELETED, snp_id))
+
+
+def groups(join):
+    """
+    Yield (snp_id_new, BIM entries merged into or keeping snp_id_new in BIM order, True if snp_id_new is an
+    original SNP Id) of the join Sorter.
+    """
+
+    for snp_id_new, records in itertools.groupby(join, key=first_field):
+        records = list(records)
+        variants = sorted((record for record in records if len(record) == 4), key=itemgetter(1))
+
+        if variants:
+            yield snp_id_new, variants, len(variants) < len(records)
+
+
+def dbsnp_coordinates(dbsnp_fname, dbsnp_offset, snp_groups, sort_args):
+    """
+    Yield snp_groups (see groups()) each followed by the dbSNP "chromosome:position" of its snp_id_new or None.
+    An rsid index is queried in batches, otherwise dbSNP is sorted by SNP Id and merge-joined.
+    """
+
+    if snptk.index.is_rs_id_index(dbsnp_fname):
+        with snptk.index.RsIdIndex(dbsnp_fname) as index:
+            for batch in iter(lambda: list(itertools.islice(snp_groups, sort_args["buffer_records"])), []):
+                dbsnp = index.lookup([snptk.keys.rsid_key(group[0]) for group in batch], dbsnp_offset)
+
+                for group in batch:
+                    coordinate = dbsnp.get(snptk.keys.rsid_key(group[0]))
+
+                    if coordinate is None or coordinate == snptk.keys.ALT_ONLY:
+                        yield group + (coordinate,)
+                    else:
+                        yield group + (snptk.keys.coordinate_str(coordinate),)
+        return
+
+    with snptk.extsort.Sorter(first_field, **sort_args) as dbsnp:
+        dbsnp.extend(read_dbsnp(dbsnp_fname))
+
+        debug(f"Sorted {dbsnp.count} dbSNP entries...")
+
+        lookup = SortedLookup(dbsnp)
+
+        for group in snp_groups:
+            entry = lookup.get(group[0])
+
+            if entry is None:
+                yield group + (None,)
+            elif entry[1] == "AltOnly":
+                yield group + (["AltOnly"],)
+            else:
+                yield group + (PLINK_CHROMOSOMES[entry[1]] + ":" + str(int(entry[2]) + dbsnp_offset),)
+
+
+def map_using_rs_id(bim_fname, bim_offset, dbsnp_fname, dbsnp_offset, refsnp_merged_fname, unmappable_snps, output_map_dir, max_memory, tmp_dir=None):
+    """
+    Write the same map files as snptk.app.map_using_rs_id() within about max_memory bytes: the BIM SNP Ids,
+    merge-resolved SNP Ids and dbSNP entries are sorted by SNP Id into spill files under tmp_dir and joined in
+    streaming merges, the resulting map entries are sorted back to BIM order.
+
+    The records are sorted by their SNP Id strings (an rsid key sorts differently from a non-rs SNP Id), only
+    unmappable_snps and the answers of indexes are keys (see snptk.keys).
+    """
+
+    sort_args = {"buffer_records": buffer_records(max_memory), "tmp_dir": tmp_dir}
+
+    debug(f"Mapping out of core with {sort_args['buffer_records']} records per sort buffer...")
+
+    debugging = debug_enabled()
+
+    with snptk.extsort.Sorter(first_field, **sort_args) as join, snptk.extsort.Sorter(first_field, **sort_args) as output:
+        with snptk.metrics.stage("update_snp_ids"):
+            def bim_records():
+                for i, (chromosome, snp_id, _, position, _, _) in enumerate(snptk.bim.read_bim(bim_fname, bim_offset)):
+                    snptk.metrics.count("lines")
+
+                    # Marks snp_id as an original SNP Id
+                    join.add((snp_id,))
+
+                    yield i, snp_id, chromosome + ":" + str(position)
+
+            resolve_snp_ids(bim_records(), refsnp_merged_fname, join, sort_args)
+
+        with snptk.metrics.stage("map_using_rs_id_logic"):
+            for snp_id_new, variants, in_original, coordinate in dbsnp_coordinates(dbsnp_fname, dbsnp_offset, groups(join), sort_args):
+                map_group(snp_id_new, variants, in_original, coordinate, snptk.keys.rsid_key(snp_id_new) in unmappable_snps, output, debugging)
+
+            debug_tallies("map_using_rs_id_logic")
+
+        with snptk.metrics.stage("write_map"):
+            files = [open(os.path.join(output_map_dir, fname), "w") for fname in MAP_FILES]
+
+            try:
+                for _, n, entry in output:
+                    print(entry, file=files[n])
+            finally:
+                for f in files:
+                    f.close()
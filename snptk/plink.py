@@ -0,0 +1,402 @@
+import mmap
+import os
+import shutil
+import sys
+
+import snptk.bim
+
+from snptk.util import debug
+
+# Magic number and variant-major mode of a Plink BED (https://www.cog-genomics.org/plink2/formats#bed)
+BED_MAGIC = b"\x6c\x1b\x01"
+
+# Plink codes of non-numeric chromosome names
+CHROMOSOME_CODES = {"X": 23, "Y": 24, "XY": 25, "MT": 26, "M": 26}
+
+# Maximum number of BED bytes handed to a single write()
+WRITE_SIZE = 64 * 1024 * 1024
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+    # Python < 3.10
+    def popcount(x):
+        return bin(x).count("1")
+
+
+class Bed:
+    """
+    Memory-mapped variant-major Plink BED with n_variants rows of ceil(n_samples / 4) bytes.
+    """
+
+    def __init__(self, fname, n_variants, n_samples):
+        self.fname = fname
+        self.n_variants = n_variants
+        self.n_samples = n_samples
+        self.row_size = (n_samples + 3) // 4
+
+        with open(fname, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(BED_MAGIC)] != BED_MAGIC:
+            self.close()
+            raise ValueError(f"'{fname}' is not a variant-major Plink BED file")
+
+        expected = len(BED_MAGIC) + n_variants * self.row_size
+
+        if len(self._mmap) != expected:
+            size = len(self._mmap)
+            self.close()
+            raise ValueError(f"'{fname}' has {size} bytes but expected {expected} for {n_variants} variants and {n_samples} samples")
+
+        self._view = memoryview(self._mmap)
+        self._low_bits = int.from_bytes(b"\x55" * self.row_size, "little")
+
+    def rows(self, start, end):
+        """
+        Return the bytes of variants [start, end) without copying them.
+        """
+
+        offset = len(BED_MAGIC)
+
+        return self._view[offset + start * self.row_size:offset + end * self.row_size]
+
+    def row(self, i):
+        return self.rows(i, i + 1)
+
+    def genotype_counts(self, i):
+        """
+        Return (missing genotypes, allele 1 count) of variant i. The row is read as one integer and its 2-bit
+        genotypes (00 homozygous allele 1, 01 missing, 10 heterozygous, 11 homozygous allele 2) are counted with
+        bit masks and popcounts, only the bytes of the row are read.
+        """
+
+        x = int.from_bytes(self.row(i), "little")
+
+        low = x & self._low_bits
+        high = (x >> 1) & self._low_bits
+
+        homozygous_2 = popcount(low & high)
+        heterozygous = popcount(high) - homozygous_2
+        missing = popcount(low) - homozygous_2
+
+        # Padding genotypes of the last byte are 00 and not counted as samples
+        homozygous_1 = self.n_samples - missing - heterozygous - homozygous_2
+
+        return missing, 2 * homozygous_1 + heterozygous
+
+    def call_rate(self, i, counts=None):
+        """
+        Return the call rate of variant i, from its genotype_counts() if already counted.
+        """
+
+        if not self.n_samples:
+            return 0.0
+
+        return 1 - (counts or self.genotype_counts(i))[0] / self.n_samples
+
+    def maf(self, i, counts=None):
+        """
+        Return the minor allele frequency of variant i, from its genotype_counts() if already counted.
+        """
+
+        missing, allele_1 = counts or self.genotype_counts(i)
+        alleles = 2 * (self.n_samples - missing)
+
+        if not alleles:
+            return 0.0
+
+        return min(allele_1, alleles - allele_1) / alleles
+
+    def write(self, fname, indices):
+        """
+        Write a BED holding the variants indices (in this order) to fname, ascending runs of indices are copied
+        with as few write() calls as possible.
+        """
+
+        rows_per_write = max(1, WRITE_SIZE // max(1, self.row_size))
+
+        with open(fname, "wb") as f:
+            f.write(BED_MAGIC)
+
+            for start, end in runs(indices):
+                for i in range(start, end, rows_per_write):
+                    f.write(self.rows(i, min(end, i + rows_per_write)))
+
+    def close(self):
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+            self._view = None
+
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def runs(indices):
+    """
+    Yield [start, end) of the runs of consecutive ascending integers in indices.
+    """
+
+    start = end = None
+
+    for i in indices:
+        if i == end:
+            end += 1
+            continue
+
+        if start is not None:
+            yield start, end
+
+        start, end = i, i + 1
+
+    if start is not None:
+        yield start, end
+
+
+def best_called(bed, group, use_maf=False):
+    """
+    Return the variant of group with the highest call rate (then the highest MAF if use_maf), the first on ties.
+    """
+
+    def key(i):
+        counts = bed.genotype_counts(i)
+
+        return bed.call_rate(i, counts), bed.maf(i, counts) if use_maf else 0.0, -i
+
+    return max(group, key=key)
+
+
+def count_samples(fam_fname):
+    with open(fam_fname, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def chromosome_code(chromosome):
+    """
+    Return the Plink sort key of a chromosome name, numeric codes first and other contigs by name.
+    """
+
+    if chromosome.isdigit():
+        return (int(chromosome), "")
+
+    if chromosome.upper() in CHROMOSOME_CODES:
+        return (CHROMOSOME_CODES[chromosome.upper()], "")
+
+    return (sys.maxsize, chromosome)
+
+
+def plink_chromosome(chromosome):
+    """
+    Return the chromosome name as plink --make-bed writes it: the code of X/Y/XY/MT (see CHROMOSOME_CODES) and numbers
+    without a "chr" prefix or leading zeros, other contigs unchanged.
+    """
+
+    name = chromosome[3:] if chromosome[:3].lower() == "chr" and len(chromosome) > 3 else chromosome
+
+    if name.isdigit():
+        return str(int(name))
+
+    if name.upper() in CHROMOSOME_CODES:
+        return str(CHROMOSOME_CODES[name.upper()])
+
+    return chromosome
+
+
+def is_sorted(chromosomes, positions):
+    """
+    Return True if every chromosome is contiguous and positions ascend within each chromosome, i.e. Plink
+    --make-bed would keep the variant order.
+    """
+
+    seen = set()
+    previous_chromosome = previous_position = None
+
+    for chromosome, position in zip(chromosomes, positions):
+        if chromosome != previous_chromosome:
+            if chromosome in seen:
+                return False
+
+            seen.add(chromosome)
+            previous_chromosome = chromosome
+
+        elif position < previous_position:
+            return False
+
+        previous_position = position
+
+    return True
+
+
+def load_ids(fname):
+    """
+    Read in a Plink --exclude/--extract file (one variant id per line).
+    """
+
+    with open(fname) as f:
+        return set(line.split()[0] for line in f if line.strip())
+
+
+def load_updates(fname):
+    """
+    Read in a Plink --update-name/--update-map/--update-chr file (variant id and new value per line).
+    """
+
+    updates = {}
+
+    with open(fname) as f:
+        for line in f:
+            fields = line.split()
+
+            if fields:
+                updates[fields[0]] = fields[1]
+
+    return updates
+
+
+def rewrite(input_prefix, output_prefix, exclude=(), names=None, positions=None, chromosomes=None):
+    """
+    Write the Plink fileset input_prefix.{bed,bim,fam} to output_prefix.{bed,bim,fam} with the variants in
+    exclude dropped, renamed by names {id: new id} and moved by positions/chromosomes {new id: position/chromosome}.
+
+    The result equals running plink --exclude, --update-name, --update-map and --update-chr one after the
+    other, but the BED is streamed from a memory map once and no intermediate fileset is written. As plink
+    --make-bed, chromosome names are written as codes (see plink_chromosome()) and variants are sorted by
+    chromosome and position if the updates break the order.
+
+    Returns the number of variants written.
+    """
+
+    names = names or {}
+    positions = positions or {}
+    chromosomes = chromosomes or {}
+
+    if os.path.abspath(input_prefix) == os.path.abspath(output_prefix):
+        raise ValueError(f"output prefix '{output_prefix}' must differ from the input prefix")
+
+    bim = snptk.bim.load_bim(input_prefix + ".bim")
+    n_samples = count_samples(input_prefix + ".fam")
+
+    debug(f"Rewriting '{input_prefix}' ({len(bim)} variants, {n_samples} samples) to '{output_prefix}'...")
+
+    indices = []
+    output_chromosomes = []
+    output_snp_ids = []
+    output_positions = []
+
+    for i, snp_id in enumerate(bim.snp_ids()):
+        if snp_id in exclude:
+            continue
+
+        snp_id = names.get(snp_id, snp_id)
+
+        indices.append(i)
+        output_snp_ids.append(snp_id)
+        output_chromosomes.append(plink_chromosome(chromosomes.get(snp_id, bim.chromosomes[i])))
+        output_positions.append(int(positions[snp_id]) if snp_id in positions else bim.positions[i])
+
+    order = range(len(indices))
+
+    if not is_sorted(output_chromosomes, output_positions):
+        debug(f"Variants of '{output_prefix}' are unsorted after the update, sorting by chromosome and position...")
+        order = sorted(order, key=lambda n: (chromosome_code(output_chromosomes[n]), output_positions[n]))
+
+    with Bed(input_prefix + ".bed", len(bim), n_samples) as bed:
+        bed.write(output_prefix + ".bed", (indices[n] for n in order))
+
+    with open(output_prefix + ".bim", "w") as f:
+        for n in order:
+            i = indices[n]
+            print(output_chromosomes[n], output_snp_ids[n], bim.distances[i], output_positions[n], bim.alleles_1[i], bim.alleles_2[i], sep="\t", file=f)
+
+    shutil.copyfile(input_prefix + ".fam", output_prefix + ".fam")
+
+    debug(f"Completed rewriting '{input_prefix}' to '{output_prefix}' ({len(indices)} variants)...")
+
+    return len(indices)
+
+
+def duplicate_groups(bim):
+    """
+    Return the groups (ascending row indices) of duplicate variants of a snptk.bim.Bim: variants are duplicates
+    if they share chromosome, position and alleles (in either order) or the SNP Id (other than '.'), transitively.
+    """
+
+    parents = {}
+
+    def find(i):
+        while parents.get(i, i) != i:
+            i = parents[i]
+        return i
+
+    first_by_key = {}
+
+    for i, snp_id in enumerate(bim.snp_ids()):
+        alleles = (bim.alleles_1[i], bim.alleles_2[i])
+
+        keys = [(bim.chromosomes[i], bim.positions[i], min(alleles), max(alleles))]
+
+        if snp_id != ".":
+            keys.append(snp_id)
+
+        for key in keys:
+            first = first_by_key.setdefault(key, i)
+
+            if first != i:
+                root, other = find(first), find(i)
+
+                if root != other:
+                    parents[max(root, other)] = min(root, other)
+
+    groups = {}
+
+    for i in parents:
+        root = find(i)
+        groups.setdefault(root, [root]).append(i)
+
+    return sorted(sorted(group) for group in groups.values())
+
+
+def remove_duplicates(input_prefix, output_prefix, keep=None):
+    """
+    Write input_prefix.{bed,bim,fam} to output_prefix.{bed,bim,fam} without duplicate variants (see duplicate_groups())
+    in a single pass over the BED, FAM IDs are kept as they are.
+
+    keep(bed, group) returns the row index to keep of a duplicate group, by default the first one is kept.
+
+    Returns the BIM rows of the removed variants.
+    """
+
+    if os.path.abspath(input_prefix) == os.path.abspath(output_prefix):
+        raise ValueError(f"output prefix '{output_prefix}' must differ from the input prefix")
+
+    bim = snptk.bim.load_bim(input_prefix + ".bim")
+    n_samples = count_samples(input_prefix + ".fam")
+
+    groups = duplicate_groups(bim)
+
+    debug(f"Found {len(groups)} groups of duplicate variants in '{input_prefix}'...")
+
+    with Bed(input_prefix + ".bed", len(bim), n_samples) as bed:
+        removed = set()
+
+        for group in groups:
+            kept = keep(bed, group) if keep else group[0]
+            removed.update(i for i in group if i != kept)
+
+        bed.write(output_prefix + ".bed", (i for i in range(len(bim)) if i not in removed))
+
+    with open(output_prefix + ".bim", "w") as f:
+        for i, row in enumerate(bim):
+            if i not in removed:
+                print(*row.values(), sep="\t", file=f)
+
+    shutil.copyfile(input_prefix + ".fam", output_prefix + ".fam")
+
+    debug(f"Completed removing {len(removed)} duplicate variants of '{input_prefix}'...")
+
+    return [bim[i] for i in sorted(removed)]
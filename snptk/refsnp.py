@@ -0,0 +1,101 @@
+import json
+
+# RefSNP JSON documents (https://api.ncbi.nlm.nih.gov/variation/v0/) carry megabytes of frequency, clinical and
+# submission data per line while the converters need a few fields, so these are located by key and only their
+# values are decoded with raw_decode(). Documents the fast path can not handle are decoded whole.
+
+DECODER = json.JSONDecoder()
+
+# Errors of the fast path on documents it can not handle
+FAST_PATH_ERRORS = (ValueError, KeyError, IndexError, TypeError)
+
+def value_offset(doc, key, start=0):
+    """
+    Return the offset of the value of the first "key" in the JSON text doc after start.
+    """
+
+    i = doc.index('"' + key + '"', start) + len(key) + 2
+
+    while doc[i] in " \t":
+        i += 1
+
+    if doc[i] != ":":
+        raise ValueError(f"'{key}' is not an object key")
+
+    i += 1
+
+    while doc[i] in " \t":
+        i += 1
+
+    return i
+
+
+def first_value(doc, key, start=0):
+    """
+    Decode only the value of the first "key" in the JSON text doc after start.
+    """
+
+    return DECODER.raw_decode(doc, value_offset(doc, key, start))[0]
+
+
+def first_item(doc, key, start=0):
+    """
+    Decode only the first item of the list value of the first "key" in the JSON text doc, None if the list is empty.
+    """
+
+    i = value_offset(doc, key, start)
+
+    if doc[i] != "[":
+        raise ValueError(f"'{key}' is not a list")
+
+    i += 1
+
+    while doc[i] in " \t":
+        i += 1
+
+    if doc[i] == "]":
+        return None
+
+    return DECODER.raw_decode(doc, i)[0]
+
+
+def dbsnp_fields(doc):
+    """
+    Return (refsnp_id, position or None, first assembly annotation of the first allele annotation or None) of a
+    RefSNP JSON document.
+    """
+
+    try:
+        refsnp_id = first_value(doc, "refsnp_id")
+        movement = first_item(doc, "present_obs_movements")
+
+        # The first assembly_annotation is the one of allele_annotations[0]
+        annotation = first_item(doc, "assembly_annotation", doc.index('"allele_annotations"'))
+
+        position = str(movement["allele_in_cur_release"]["position"]) if movement else None
+
+    except FAST_PATH_ERRORS:
+        d = json.loads(doc)
+
+        refsnp_id = d["refsnp_id"]
+        position = str(d["present_obs_movements"][0]["allele_in_cur_release"]["position"]) if d["present_obs_movements"] else None
+
+        assembly_annotation = d["primary_snapshot_data"]["allele_annotations"][0]["assembly_annotation"]
+        annotation = assembly_annotation[0] if assembly_annotation else None
+
+    return refsnp_id, position, annotation
+
+
+def merged_fields(doc):
+    """
+    Return (refsnp_id, RS Id it was merged into or None) of a refsnp-merged JSON document.
+    """
+
+    try:
+        return first_value(doc, "refsnp_id"), first_item(doc, "merged_into", doc.index('"merged_snapshot_data"'))
+
+    except FAST_PATH_ERRORS:
+        d = json.loads(doc)
+        merged_into = d.get("merged_snapshot_data", {}).get("merged_into", [])
+
+        return d["refsnp_id"], merged_into[0] if merged_into else None
@@ -1,12 +1,118 @@
+import logging
+import logging.handlers
 import os
 import socket
 import time
 import sys
 
-def debug(message, level=1):
-    debug_level = int(os.environ.get("DEBUG", 0))
+from collections import Counter
 
-    if debug_level >= level:
-        timestamp = time.strftime("%F %H:%M:%S", time.gmtime(time.time()))
-        node = socket.gethostname()
-        print(f"{timestamp} {node} DEBUG({level}): {message}", file=sys.stderr)
+# Rotate the log file (--log-file/SNPTK_LOG_FILE) at this size, keeping LOG_BACKUPS old files
+LOG_MAX_BYTES = 256 * 1024 * 1024
+LOG_BACKUPS = 4
+
+# Messages logged in full per reason by tally() before only counting (DEBUG_SAMPLE)
+SAMPLE_SIZE = 10
+
+# Resolved once by configure() instead of on every debug() call
+_level = 0
+_sample_size = SAMPLE_SIZE
+
+_logger = logging.getLogger("snptk")
+_logger.propagate = False
+
+# Per reason counts of tally() since the last debug_tallies()
+tallies = Counter()
+
+def configure(level=None, log_file=None, sample_size=None):
+    """
+    Resolve the debug level (default: DEBUG environment variable) and the destination of debug messages,
+    stderr or a rotating log_file (default: SNPTK_LOG_FILE environment variable).
+    """
+
+    global _level, _sample_size
+
+    _level = int(level if level is not None else os.environ.get("DEBUG") or 0)
+    _sample_size = int(sample_size if sample_size is not None else os.environ.get("DEBUG_SAMPLE") or SAMPLE_SIZE)
+
+    if log_file is None:
+        log_file = os.environ.get("SNPTK_LOG_FILE")
+
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+        handler.close()
+
+    if log_file:
+        # Worker processes started by spawn reconfigure from the environment
+        os.environ["SNPTK_LOG_FILE"] = log_file
+        handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+    else:
+        os.environ.pop("SNPTK_LOG_FILE", None)
+        handler = logging.StreamHandler(sys.stderr)
+
+    formatter = logging.Formatter(f"%(asctime)s {socket.gethostname()} %(message)s", "%F %H:%M:%S")
+    formatter.converter = time.gmtime
+
+    handler.setFormatter(formatter)
+
+    _logger.addHandler(handler)
+    _logger.setLevel(logging.DEBUG if _level else logging.CRITICAL)
+
+
+def parse_memory(size):
+    """
+    Return the bytes of a memory size given as e.g. 512M, 4G or 4096 (MiB).
+    """
+
+    units = {"K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+    size = size.strip().upper().rstrip("B")
+
+    if size[-1:] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+
+    return int(float(size) * units["M"])
+
+
+def debug_enabled(level=1):
+    """
+    Return True if messages of level are logged, hot loops check this once and skip building messages.
+    """
+
+    return _level >= level
+
+
+def debug(message, *args, level=1):
+    """
+    Log message at level, formatted with message % args only if the level is enabled.
+    """
+
+    if _level >= level:
+        _logger.debug(f"DEBUG({level}): {message % args if args else message}")
+
+
+def tally(reason, message=None, *args, level=1):
+    """
+    Count an event of reason (e.g. one variant without a match) and log the first DEBUG_SAMPLE messages of each
+    reason at level, see debug_tallies() for the totals.
+    """
+
+    tallies[reason] += 1
+
+    if message is not None and _level >= level and tallies[reason] <= _sample_size:
+        _logger.debug(f"DEBUG({level}): {reason}: {message % args if args else message}")
+
+
+def debug_tallies(context, level=1):
+    """
+    Log the per reason counts of tally() under context and reset them.
+    """
+
+    if tallies and _level >= level:
+        counts = ", ".join(f"{reason}={n}" for reason, n in tallies.most_common())
+        _logger.debug(f"DEBUG({level}): {context}: {counts}")
+
+    tallies.clear()
+
+
+configure()
@@ -0,0 +1,48 @@
+import gzip
+import os
+import subprocess
+import sys
+
+from os.path import abspath, dirname, join
+
+BASE = abspath(join(dirname(__file__), '..'))
+
+def test_data(path):
+    return join(abspath(dirname(__file__)), 'data', path)
+
+def write_gz(fname, rows):
+    """
+    Write rows (lists of fields joined by tabs, or lines) to the gzip file fname and return fname.
+    """
+
+    with gzip.open(fname, "wt") as f:
+        for row in rows:
+            print(row if isinstance(row, str) else "\t".join(row), file=f)
+
+    return fname
+
+def read_maps(map_dir):
+    """
+    Return {file name: content} of the map files written to map_dir.
+    """
+
+    maps = {}
+
+    for fname in sorted(os.listdir(map_dir)):
+        with open(join(map_dir, fname)) as f:
+            maps[fname] = f.read()
+
+    return maps
+
+def run_script(name, *args):
+    """
+    Run bin/name with args in a Python process importing snptk from this tree, raise AssertionError with its
+    stderr if it fails.
+    """
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [BASE, os.environ.get("PYTHONPATH")])))
+
+    result = subprocess.run([sys.executable, join(BASE, "bin", name)] + list(args), env=env, capture_output=True, text=True)
+
+    if result.returncode:
+        raise AssertionError(f"bin/{name} failed with exit status {result.returncode}:\n{result.stderr}")
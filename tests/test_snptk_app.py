@@ -5,15 +5,49 @@ from os.path import abspath, basename, dirname, join
 
 import snptk.app
 
-BASE = abspath(join(dirname(__file__), '..'))
+from snptk.keys import parse_coordinate, rsid_key
+from tests.helpers import test_data
 
-def test_data(path):
-    return join(abspath(dirname(__file__)), 'data', path)
+BASE = abspath(join(dirname(__file__), '..'))
 
 UpdateLogicOutput = namedtuple("UpdateLogicOutput", ["snps_del", "snps_up", "coords_up", "chroms_up"])
 
 UpdateLogic_map_using_coord_Output = namedtuple("UpdateLogicOutput", ["snps_del", "snps_up", "multi_snps"])
 
+def string_lines(output):
+    """
+    Return the map file lines of an expected output of strings (lists of SNP Ids joined by commas).
+    """
+
+    return type(output)(*[
+        ["\t".join(c if isinstance(c, str) else ",".join(c) for c in entry) if isinstance(entry, tuple) else entry for entry in entries]
+        for entries in output])
+
+def map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps):
+    """
+    Run snptk.app.map_using_rs_id_logic() on the keys of strings and return the map file lines of the result.
+    """
+
+    output = snptk.app.map_using_rs_id_logic(
+        [(rsid_key(snp_id), parse_coordinate(coordinate), rsid_key(snp_id_new)) for snp_id, coordinate, snp_id_new in snp_map],
+        {rsid_key(snp_id): parse_coordinate(coordinate) for snp_id, coordinate in dbsnp.items()},
+        set(map(rsid_key, unmappable_snps)))
+
+    return UpdateLogicOutput(*[snptk.app.format_map(entries, formats) for entries, formats in zip(output, snptk.app.RS_ID_MAP_FORMATS)])
+
+def map_using_coord_logic(bim_entries, snps, dbsnp, *args):
+    """
+    Run snptk.app.map_using_coord_logic() on the keys of strings and return the map file lines of the result.
+    """
+
+    output = snptk.app.map_using_coord_logic(
+        bim_entries,
+        set(map(rsid_key, snps)),
+        {parse_coordinate(coordinate): list(map(rsid_key, snp_ids)) for coordinate, snp_ids in dbsnp.items()},
+        *args)
+
+    return UpdateLogic_map_using_coord_Output(*[snptk.app.format_map(entries, formats) for entries, formats in zip(output, snptk.app.COORD_MAP_FORMATS)])
+
 class TestSnpTkAppUpdateLogicUpdateSnpIdAndPosition(unittest.TestCase):
 
     #-----------------------------------------------------------------------------------
@@ -28,7 +62,7 @@ class TestSnpTkAppUpdateLogicUpdateSnpIdAndPosition(unittest.TestCase):
         expected = UpdateLogicOutput(
                 snps_del=[], snps_up=[('rs123', 'rs456')], coords_up=[], chroms_up=[])
 
-        self.assertEqual(snptk.app.map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), expected)
+        self.assertEqual(map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), string_lines(expected))
 
     def test_snp_up_chrom_up(self):
         snp_map = [('rs123', '6:123', 'rs456')]
@@ -38,7 +72,7 @@ class TestSnpTkAppUpdateLogicUpdateSnpIdAndPosition(unittest.TestCase):
         expected = UpdateLogicOutput(
                 snps_del=[], snps_up=[('rs123', 'rs456')], coords_up=[], chroms_up=[('rs456', '7')])
 
-        self.assertEqual(snptk.app.map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), expected)
+        self.assertEqual(map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), string_lines(expected))
 
     def test_no_merge_no_dbsnp(self):
         snp_map = [('rs123', '6:123', 'rs123')]
@@ -48,7 +82,7 @@ class TestSnpTkAppUpdateLogicUpdateSnpIdAndPosition(unittest.TestCase):
         expected = UpdateLogicOutput(
                 snps_del=['rs123'], snps_up=[], coords_up=[], chroms_up=[])
 
-        self.assertEqual(snptk.app.map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), expected)
+        self.assertEqual(map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), string_lines(expected))
 
     def test_no_merge_history_but_in_dbsnp(self):
         snp_map = [('rs123', '6:123', 'rs123')]
@@ -58,7 +92,7 @@ class TestSnpTkAppUpdateLogicUpdateSnpIdAndPosition(unittest.TestCase):
         expected = UpdateLogicOutput(
                 snps_del=[], snps_up=[], coords_up=[('rs123', '456')], chroms_up=[('rs123', '7')])
 
-        self.assertEqual(snptk.app.map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), expected)
+        self.assertEqual(map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), string_lines(expected))
 
     def test_snp_up_but_up_snp_already_present(self):
         snp_map = [('rs123', '6:123', 'rs456'),
@@ -72,7 +106,7 @@ class TestSnpTkAppUpdateLogicUpdateSnpIdAndPosition(unittest.TestCase):
         expected = UpdateLogicOutput(
                 snps_del=['rs123'], snps_up=[], coords_up=[], chroms_up=[])
 
-        self.assertEqual(snptk.app.map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), expected)
+        self.assertEqual(map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), string_lines(expected))
 
     def test_snp_merged_but_merged_was_already_present_and_update_position(self):
         snp_map = [('rs123', '6:123', 'rs456'),
@@ -86,7 +120,7 @@ class TestSnpTkAppUpdateLogicUpdateSnpIdAndPosition(unittest.TestCase):
         expected = UpdateLogicOutput(
                 snps_del=['rs123'], snps_up=[], coords_up=[('rs456', '1000')], chroms_up=[])
 
-        self.assertEqual(snptk.app.map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), expected)
+        self.assertEqual(map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), string_lines(expected))
 
     def test_include_file_no_merge(self):
         snp_map = [('rs456', '6:123', 'rs456')]
@@ -98,7 +132,7 @@ class TestSnpTkAppUpdateLogicUpdateSnpIdAndPosition(unittest.TestCase):
         expected = UpdateLogicOutput(
                 snps_del=[], snps_up=[], coords_up=[], chroms_up=[])
 
-        self.assertEqual(snptk.app.map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), expected)
+        self.assertEqual(map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), string_lines(expected))
 
     def test_include_file_merge(self):
         snp_map = [('rs456', '6:123', 'rs789')]
@@ -110,7 +144,7 @@ class TestSnpTkAppUpdateLogicUpdateSnpIdAndPosition(unittest.TestCase):
         expected = UpdateLogicOutput(
                 snps_del=[], snps_up=[('rs456', 'rs789')], coords_up=[], chroms_up=[])
 
-        self.assertEqual(snptk.app.map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), expected)
+        self.assertEqual(map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), string_lines(expected))
 
     def test_test(self):
         snp_map = [('rs123', '6:222', 'rs789'),
@@ -125,7 +159,7 @@ class TestSnpTkAppUpdateLogicUpdateSnpIdAndPosition(unittest.TestCase):
         expected = UpdateLogicOutput(
                 snps_del=['rs456'], snps_up=[('rs123', 'rs789')], coords_up=[('rs789', '333')], chroms_up=[])
 
-        self.assertEqual(snptk.app.map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), expected)
+        self.assertEqual(map_using_rs_id_logic(snp_map, dbsnp, unmappable_snps), string_lines(expected))
 
 class TestSnpTkAppUpdateLogicSnpIdFromCoord(unittest.TestCase):
     def setUp(self):
@@ -156,7 +190,7 @@ class TestSnpTkAppUpdateLogicSnpIdFromCoord(unittest.TestCase):
         expected = UpdateLogic_map_using_coord_Output(
                 snps_del=['rs123'], snps_up=[], multi_snps=[] )
 
-        self.assertEqual(snptk.app.map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), expected)
+        self.assertEqual(map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), string_lines(expected))
 
     def test_not_in_dbsnp_keep_unmapped_rsids(self):
         snps = ['rs123']
@@ -167,7 +201,7 @@ class TestSnpTkAppUpdateLogicSnpIdFromCoord(unittest.TestCase):
         expected = UpdateLogic_map_using_coord_Output(
                 snps_del=[], snps_up=[], multi_snps=[] )
 
-        self.assertEqual(snptk.app.map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), expected)
+        self.assertEqual(map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), string_lines(expected))
 
     def test_update_snp(self):
         """
@@ -183,7 +217,7 @@ class TestSnpTkAppUpdateLogicSnpIdFromCoord(unittest.TestCase):
         expected = UpdateLogic_map_using_coord_Output(
                 snps_del=[], snps_up=[('rs123', 'rs456')], multi_snps=[] )
 
-        self.assertEqual(snptk.app.map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), expected)
+        self.assertEqual(map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), string_lines(expected))
 
     def test_no_update(self):
         snps = ['rs123']
@@ -194,7 +228,7 @@ class TestSnpTkAppUpdateLogicSnpIdFromCoord(unittest.TestCase):
         expected = UpdateLogic_map_using_coord_Output(
                 snps_del=[], snps_up=[], multi_snps=[] )
 
-        self.assertEqual(snptk.app.map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), expected)
+        self.assertEqual(map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), string_lines(expected))
 
     def test_multi_snp_unmapped_rsids_false(self):
         snps = ['rs123']
@@ -205,7 +239,7 @@ class TestSnpTkAppUpdateLogicSnpIdFromCoord(unittest.TestCase):
         expected = UpdateLogic_map_using_coord_Output(
                 snps_del=['rs123'], snps_up=[], multi_snps=[] )
 
-        self.assertEqual(snptk.app.map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), expected)
+        self.assertEqual(map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), string_lines(expected))
 
     def test_unmapped_rsids(self):
         snps = ['rs123']
@@ -216,7 +250,7 @@ class TestSnpTkAppUpdateLogicSnpIdFromCoord(unittest.TestCase):
         expected = UpdateLogic_map_using_coord_Output(
                 snps_del=[], snps_up=[], multi_snps=[] )
 
-        self.assertEqual(snptk.app.map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), expected)
+        self.assertEqual(map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), string_lines(expected))
 
     def test_keep_multi_no_update(self):
         snps = ['rs123']
@@ -227,7 +261,7 @@ class TestSnpTkAppUpdateLogicSnpIdFromCoord(unittest.TestCase):
         expected = UpdateLogic_map_using_coord_Output(
                 snps_del=[], snps_up=[], multi_snps=[('6:123', ['rs123', 'rs456'])] )
 
-        self.assertEqual(snptk.app.map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), expected)
+        self.assertEqual(map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), string_lines(expected))
 
     def test_keep_multi_update(self):
         snps = ['rs123']
@@ -238,7 +272,7 @@ class TestSnpTkAppUpdateLogicSnpIdFromCoord(unittest.TestCase):
         expected = UpdateLogic_map_using_coord_Output(
                 snps_del=[], snps_up=[('rs123', 'rs456')], multi_snps=[('6:123', ['rs456', 'rs789'])] )
 
-        self.assertEqual(snptk.app.map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), expected)
+        self.assertEqual(map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), string_lines(expected))
 
     def test_keep_multi_no_update_snp_already_in_bim(self):
         snps = ['rs123', 'rs456']
@@ -249,7 +283,7 @@ class TestSnpTkAppUpdateLogicSnpIdFromCoord(unittest.TestCase):
         expected = UpdateLogic_map_using_coord_Output(
                 snps_del=[], snps_up=[], multi_snps=[('6:123', ['rs456', 'rs789'])] )
 
-        self.assertEqual(snptk.app.map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), expected)
+        self.assertEqual(map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids), string_lines(expected))
 
     def test_no_rs_keep_unmapped(self):
         snps = ['rs123']
@@ -260,7 +294,7 @@ class TestSnpTkAppUpdateLogicSnpIdFromCoord(unittest.TestCase):
         expected = UpdateLogic_map_using_coord_Output(
                 snps_del=['123'], snps_up=[], multi_snps=[] )
 
-        self.assertEqual(snptk.app.map_using_coord_logic(self.bim_entries_no_rs, snps, dbsnp, keep_multi, keep_unmapped_rsids), expected)
+        self.assertEqual(map_using_coord_logic(self.bim_entries_no_rs, snps, dbsnp, keep_multi, keep_unmapped_rsids), string_lines(expected))
 
     def test_skip_rs_ids(self):
         snps = ['rs123']
@@ -272,5 +306,5 @@ class TestSnpTkAppUpdateLogicSnpIdFromCoord(unittest.TestCase):
         expected = UpdateLogic_map_using_coord_Output(
                 snps_del=[], snps_up=[], multi_snps=[] )
 
-        self.assertEqual(snptk.app.map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids, skip_rs_ids), expected)
+        self.assertEqual(map_using_coord_logic(self.bim_entries, snps, dbsnp, keep_multi, keep_unmapped_rsids, skip_rs_ids), string_lines(expected))
 
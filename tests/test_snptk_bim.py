@@ -0,0 +1,36 @@
+import unittest
+
+from os.path import abspath, dirname, join
+
+import snptk.bim
+
+class TestSnpTkBim(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = abspath(dirname(__file__))
+
+    def test_columns(self):
+        bim = snptk.bim.load_bim(join(self.test_dir, 'data/example.bim'), offset=1)
+
+        self.assertEqual(len(bim), 2)
+        self.assertEqual(list(bim.snp_ids()), ['rs123', 'rs123'])
+        self.assertEqual(list(bim.coordinates()), ['3:23445', '4:23445'])
+        self.assertEqual(list(bim.positions), [23445, 23445])
+        self.assertEqual(bim.chromosomes.values, ['3', '4'])
+
+    def test_row_view(self):
+        bim = snptk.bim.load_bim(join(self.test_dir, 'data/example.bim'))
+
+        row = bim[-1]
+
+        self.assertEqual(row['snp_id'], 'rs123')
+        self.assertEqual(row['position'], '23444')
+        self.assertEqual("\t".join(row.values()), "4\trs123\t0\t23444\tA\tC")
+        self.assertEqual(dict(row), {'chromosome': '4', 'snp_id': 'rs123', 'distance': '0', 'position': '23444', 'allele_1': 'A', 'allele_2': 'C'})
+
+        with self.assertRaises(KeyError):
+            row['strand']
+
+    def test_from_entries(self):
+        entries = [{'chromosome': '6', 'snp_id': 'rs123', 'distance': '0', 'position': '123', 'allele_1': 'A', 'allele_2': 'T'}]
+
+        self.assertEqual(snptk.bim.Bim.from_entries(entries), entries)
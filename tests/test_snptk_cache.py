@@ -0,0 +1,227 @@
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from os.path import join
+
+import snptk.cache
+import snptk.compress
+import snptk.core
+import snptk.metrics
+
+from snptk.keys import coordinate_key
+from tests.helpers import write_gz
+
+def load_refsnp_merged(fname):
+    misses = snptk.metrics.counters["cache_misses"]
+
+    result = snptk.cache.cached(snptk.core.load_refsnp_merged)(fname)
+
+    return result, snptk.metrics.counters["cache_misses"] - misses
+
+def hold_lock(fname, locked, release):
+    with snptk.cache.locked(fname, exclusive=False):
+        locked.set()
+        release.wait(10)
+
+class TestSnpTkCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = join(self.tmp_dir, "cache")
+
+        self.rows = [[str(rsid), str(rsid % 3 + 1), str(1000 + rsid % 7), "0"] for rsid in range(1, 3000)]
+        self.rows += [["5", "2", "2222", "0"], ["7", "AltOnly"], ["8", "1", "1000"]]
+
+        self.dbsnp = join(self.tmp_dir, "dbsnp.gz")
+        write_gz(self.dbsnp, self.rows)
+
+        self.dbsnp_dir = join(self.tmp_dir, "dbsnp")
+        os.mkdir(self.dbsnp_dir)
+
+        write_gz(join(self.dbsnp_dir, "00.gz"), self.rows[:1000])
+        write_gz(join(self.dbsnp_dir, "01.gz"), self.rows[1000:])
+
+        self.refsnp_merged = join(self.tmp_dir, "refsnp-merged.gz")
+        write_gz(self.refsnp_merged, [["1", "2"], ["3", "4"], ["1", "5"]])
+
+        self.snp_ids = set(range(0, 3100, 7)) | {5, 7, 8, "exm1"}
+        self.coordinates = {coordinate_key(chromosome, position) for chromosome in (1, 2, 3) for position in range(1000, 1010)} | {coordinate_key(2, 2223), ("X", 1000)}
+
+        snptk.cache.configure(self.cache_dir)
+
+    def tearDown(self):
+        snptk.cache.configure(None)
+        shutil.rmtree(self.tmp_dir)
+
+    def load(self, load_func, fname, *args, merge_method="update"):
+        return snptk.core.execute_load(snptk.cache.cached(load_func), fname, *args, merge_method=merge_method)
+
+    def hits(self):
+        return snptk.metrics.counters["cache_hits"]
+
+    def test_disabled(self):
+        snptk.cache.configure(None)
+
+        self.assertIs(snptk.cache.cached(snptk.core.load_dbsnp_by_snp_id), snptk.core.load_dbsnp_by_snp_id)
+
+    def test_matches_loaders(self):
+        cases = [
+            (snptk.core.load_dbsnp_by_snp_id, (self.snp_ids, 1), "update"),
+            (snptk.core.load_dbsnp_by_coordinate, (self.coordinates, 1), "extend"),
+            (snptk.core.load_refsnp_merged, (), "update")]
+
+        for load_func, args, merge_method in cases:
+            fname = self.refsnp_merged if load_func == snptk.core.load_refsnp_merged else self.dbsnp
+
+            expected = snptk.core.execute_load(load_func, fname, *args, merge_method=merge_method)
+
+            self.assertTrue(expected)
+
+            hits = self.hits()
+
+            # Miss (builds the entry), then a hit
+            self.assertEqual(self.load(load_func, fname, *args, merge_method=merge_method), expected)
+            self.assertEqual(self.hits(), hits)
+
+            self.assertEqual(self.load(load_func, fname, *args, merge_method=merge_method), expected)
+            self.assertEqual(self.hits(), hits + 1)
+
+    def test_split_files(self):
+        for load_func, args, merge_method in [
+                (snptk.core.load_dbsnp_by_snp_id, (self.snp_ids, 1), "update"),
+                (snptk.core.load_dbsnp_by_coordinate, (self.coordinates, 1), "extend")]:
+
+            expected = snptk.core.execute_load(load_func, self.dbsnp_dir, *args, merge_method=merge_method)
+
+            # Worker processes build one entry per split-file, then answer from them
+            for _ in range(2):
+                self.assertEqual(self.load(load_func, self.dbsnp_dir, *args, merge_method=merge_method), expected)
+
+        self.assertEqual(len(list(snptk.cache.entries(self.cache_dir))), 4)
+
+    def test_chunks(self):
+        bgzf = join(self.tmp_dir, "dbsnp.bgz")
+
+        with open(bgzf, "wb") as f:
+            snptk.compress.write_bgzf(io.BytesIO("".join("\t".join(row) + "\n" for row in self.rows).encode()), f)
+
+        chunks = snptk.compress.split(bgzf, 5000)
+        self.assertGreater(len(chunks), 1)
+
+        loader = snptk.cache.cached(snptk.core.load_dbsnp_by_snp_id)
+
+        for chunk in chunks:
+            self.assertEqual(loader(chunk, self.snp_ids, 1), snptk.core.load_dbsnp_by_snp_id(chunk, self.snp_ids, 1))
+
+        self.assertEqual(len(list(snptk.cache.entries(self.cache_dir))), len(chunks))
+
+    def test_changed_source_misses(self):
+        self.load(snptk.core.load_refsnp_merged, self.refsnp_merged)
+
+        write_gz(self.refsnp_merged, [["1", "6"]])
+        os.utime(self.refsnp_merged, ns=(0, 0))
+
+        self.assertEqual(self.load(snptk.core.load_refsnp_merged, self.refsnp_merged), {1: 6})
+        self.assertEqual(len(list(snptk.cache.entries(self.cache_dir))), 2)
+
+    def test_evict_least_recently_used(self):
+        self.load(snptk.core.load_refsnp_merged, self.refsnp_merged)
+        self.load(snptk.core.load_dbsnp_by_snp_id, self.dbsnp, self.snp_ids)
+
+        refsnp_merged, dbsnp = sorted(snptk.cache.entries(self.cache_dir), key=lambda entry: entry.stat().st_size)
+
+        os.utime(refsnp_merged.path, ns=(0, 0))
+        os.utime(dbsnp.path, ns=(1, 1))
+
+        self.assertEqual(snptk.cache.evict(self.cache_dir, dbsnp.stat().st_size + refsnp_merged.stat().st_size), 0)
+        self.assertEqual(snptk.cache.evict(self.cache_dir, dbsnp.stat().st_size), 1)
+        self.assertEqual([entry.path for entry in snptk.cache.entries(self.cache_dir)], [dbsnp.path])
+
+        self.assertEqual(snptk.cache.evict(self.cache_dir, 0, keep=dbsnp.path), 0)
+        self.assertEqual(snptk.cache.evict(self.cache_dir, 0), 1)
+
+    def test_concurrent_loads_build_once(self):
+        with multiprocessing.Pool(4) as pool:
+            results = pool.map(load_refsnp_merged, [self.refsnp_merged] * 8)
+
+        self.assertEqual([result for result, _ in results], [{1: 5, 3: 4}] * 8)
+        self.assertEqual(sum(misses for _, misses in results), 1)
+
+    def test_corrupt_and_partial_entries_are_rebuilt(self):
+        expected = snptk.core.load_dbsnp_by_snp_id(self.dbsnp, self.snp_ids, 1)
+
+        self.load(snptk.core.load_dbsnp_by_snp_id, self.dbsnp, self.snp_ids, 1)
+
+        fname, = [entry.path for entry in snptk.cache.entries(self.cache_dir)]
+
+        # A truncated entry (e.g. copied or written by a crashed build without rename) and a dead builder's output
+        os.truncate(fname, os.path.getsize(fname) // 2)
+
+        with open(fname + ".otherhost.1234.tmp", "wb") as f:
+            f.write(b"partial")
+
+        misses = snptk.metrics.counters["cache_misses"]
+
+        self.assertEqual(self.load(snptk.core.load_dbsnp_by_snp_id, self.dbsnp, self.snp_ids, 1), expected)
+        self.assertEqual(snptk.metrics.counters["cache_misses"], misses + 1)
+
+        self.assertEqual(sorted(os.listdir(os.path.dirname(fname))), sorted([os.path.basename(fname), os.path.basename(fname) + ".lock"]))
+
+    def test_short_entries_are_rebuilt(self):
+        for load_func, args in [(snptk.core.load_dbsnp_by_snp_id, (self.snp_ids, 1)), (snptk.core.load_refsnp_merged, ())]:
+            fname = self.refsnp_merged if load_func == snptk.core.load_refsnp_merged else self.dbsnp
+
+            expected = load_func(fname, *args)
+
+            self.load(load_func, fname, *args)
+
+            entry = snptk.cache.entry_fname(self.cache_dir, load_func, fname)
+
+            # Shorter than the header of an index
+            with open(entry, "wb") as f:
+                f.write(b"\x00\x01")
+
+            self.assertEqual(self.load(load_func, fname, *args), expected)
+            self.assertGreater(os.path.getsize(entry), 2)
+
+    def test_evict_removes_lock_files(self):
+        self.load(snptk.core.load_refsnp_merged, self.refsnp_merged)
+
+        fname, = [entry.path for entry in snptk.cache.entries(self.cache_dir)]
+
+        self.assertTrue(os.path.exists(fname + ".lock"))
+        self.assertEqual(snptk.cache.evict(self.cache_dir, 0), 1)
+        self.assertEqual(os.listdir(os.path.dirname(fname)), [])
+
+        # A lock file removed while waiting for it is not the one locked
+        with snptk.cache.locked(fname):
+            os.unlink(fname + ".lock")
+
+        with snptk.cache.locked(fname):
+            self.assertTrue(os.path.exists(fname + ".lock"))
+
+    def test_evict_skips_locked_entries(self):
+        self.load(snptk.core.load_refsnp_merged, self.refsnp_merged)
+
+        fname, = [entry.path for entry in snptk.cache.entries(self.cache_dir)]
+
+        # POSIX locks do not conflict within a process, the reader has to be another one
+        locked, release = multiprocessing.Event(), multiprocessing.Event()
+        reader = multiprocessing.Process(target=hold_lock, args=(fname, locked, release))
+        reader.start()
+
+        try:
+            self.assertTrue(locked.wait(10))
+            self.assertEqual(snptk.cache.evict(self.cache_dir, 0), 0)
+        finally:
+            release.set()
+            reader.join()
+
+        self.assertEqual(snptk.cache.evict(self.cache_dir, 0), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
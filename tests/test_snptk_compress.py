@@ -0,0 +1,130 @@
+import bz2
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from os.path import join
+
+import snptk.compress
+import snptk.core
+
+from snptk.keys import parse_coordinate
+
+class TestSnpTkCompress(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+        self.lines = [f"{n}\t{n % 22 + 1}\t{n * 7}\t0\n".encode() for n in range(1, 50000)]
+
+        self.bgzf = join(self.tmp_dir, "dbsnp.bgz")
+
+        with open(self.bgzf, "wb") as f:
+            snptk.compress.write_bgzf(io.BytesIO(b"".join(self.lines)), f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write_bgzf_is_gzip(self):
+        self.assertTrue(snptk.compress.is_bgzf(self.bgzf))
+
+        with gzip.open(self.bgzf, "rb") as f:
+            self.assertEqual(f.readlines(), self.lines)
+
+    def test_chunks_yield_every_line_once(self):
+        for chunk_size in (1, 5000, 20000):
+            chunks = snptk.compress.split(self.bgzf, chunk_size)
+
+            self.assertGreater(len(chunks), 1)
+            self.assertEqual([line for chunk in chunks for line in snptk.compress.read_chunk(chunk)], self.lines)
+
+    def test_chunk_boundary_at_line_start(self):
+        # 16 byte lines fill each 65280 byte BGZF block exactly
+        lines = [f"{n:015}\n".encode() for n in range(20000)]
+
+        with open(self.bgzf, "wb") as f:
+            snptk.compress.write_bgzf(io.BytesIO(b"".join(lines)), f)
+
+        chunks = snptk.compress.split(self.bgzf, 1)
+
+        self.assertEqual([line for chunk in chunks for line in snptk.compress.read_chunk(chunk)], lines)
+
+    def test_plain_gzip_is_not_split(self):
+        fname = join(self.tmp_dir, "dbsnp.gz")
+
+        with gzip.open(fname, "wb") as f:
+            f.writelines(self.lines)
+
+        self.assertFalse(snptk.compress.is_bgzf(fname))
+        self.assertEqual(snptk.compress.split(fname, 1), [fname])
+
+    def test_execute_load_chunks(self):
+        coordinates = set(map(parse_coordinate, ["2:8", "1:155", "13:701", "16:349994", "3:99"]))
+
+        expected = snptk.core.load_dbsnp_by_coordinate(self.bgzf, coordinates, 1)
+
+        chunk_size, snptk.compress.DEFAULT_CHUNK_SIZE = snptk.compress.DEFAULT_CHUNK_SIZE, 5000
+
+        try:
+            result = snptk.core.execute_load(snptk.core.load_dbsnp_by_coordinate, self.bgzf, coordinates, 1, merge_method="extend")
+        finally:
+            snptk.compress.DEFAULT_CHUNK_SIZE = chunk_size
+
+        self.assertEqual(result, expected)
+        self.assertEqual(len(result), 4)
+
+    def test_backends(self):
+        fname_bz2 = join(self.tmp_dir, "dbsnp.bz2")
+
+        with bz2.open(fname_bz2, "wb") as f:
+            f.writelines(self.lines)
+
+        for fname in (self.bgzf, fname_bz2):
+            for backend in snptk.compress.BACKENDS:
+                with snptk.compress.open_compressed(fname, "rb", backend=backend) as f:
+                    self.assertEqual(f.readlines(), self.lines)
+
+                with snptk.compress.open_compressed(fname, "rt", backend=backend) as f:
+                    self.assertEqual(next(f), self.lines[0].decode())
+
+    def test_backend_errors(self):
+        fname = join(self.tmp_dir, "truncated.gz")
+
+        with open(self.bgzf, "rb") as f_in, open(fname, "wb") as f_out:
+            f_out.write(f_in.read(5000))
+
+        for backend in ("external", "threaded", "stdlib"):
+            with self.assertRaises((OSError, EOFError)):
+                with snptk.compress.open_compressed(fname, "rb", backend=backend) as f:
+                    f.read()
+
+        with self.assertRaises(ValueError):
+            snptk.compress.open_compressed(fname, backend="zstd")
+
+    def test_pipe_reader_stderr(self):
+        # More warnings than a pipe buffers before any output
+        command = ["python3", "-c", "import sys; sys.stderr.write('w' * 1000000); print('out'); sys.exit(3)"]
+
+        with snptk.compress.PipeReader(command) as f:
+            self.assertEqual(f.read(3), b"out")
+
+            with self.assertRaisesRegex(OSError, "exit status 3: w+$"):
+                f.read()
+
+    def test_bz2_blocks(self):
+        fname = join(self.tmp_dir, "dbsnp.bz2")
+        data = b"".join(self.lines)
+
+        # Two streams of several blocks (100k blocks at level 1)
+        with open(fname, "wb") as f:
+            f.write(bz2.compress(data[:300000], 1))
+            f.write(bz2.compress(data[300000:], 1))
+
+        blocks = snptk.compress.bz2_blocks(fname)
+
+        self.assertGreater(len(blocks), 2)
+        self.assertEqual(b"".join(snptk.compress.read_bz2_blocks(fname, blocks)), data)
+        self.assertEqual(b"".join(b"".join(snptk.compress.read_bz2_blocks(fname, [block])) for block in reversed(blocks)),
+                         b"".join(reversed(list(snptk.compress.read_bz2_blocks(fname, blocks)))))
@@ -1,9 +1,15 @@
+import os
+import shutil
+import tempfile
 import unittest
 
 from os.path import abspath, basename, dirname, join
 
 import snptk.core
 
+from snptk.keys import ALT_ONLY, coordinate_key
+from tests.helpers import write_gz
+
 class TestSnpTkCore(unittest.TestCase):
     def setUp(self):
         self.test_dir = abspath(dirname(__file__))
@@ -40,15 +46,126 @@ class TestSnpTkCore(unittest.TestCase):
 
     def test_update_snp_id_new_logic_rsmerge_only_one_merge(self):
         snpid =  'rs123'
-        rsmerge = {'123': '456'}
+        rsmerge = {123: 456}
 
-        self.assertEqual(snptk.core.update_snp_id(snpid, rsmerge), 'rs456')
+        self.assertEqual(snptk.core.update_snp_id(snpid, rsmerge), 456)
 
     def test_update_snp_id_new_logic_rsmerge_only_mutiple_merges(self):
         snpid =  'rs123'
-        rsmerge = {'123': '456',
-                   '456': '789',
-                   '789': '000'
+        rsmerge = {123: 456,
+                   456: 789,
+                   789: 0
                 }
 
-        self.assertEqual(snptk.core.update_snp_id(snpid, rsmerge), 'rs000')
+        self.assertEqual(snptk.core.update_snp_id(snpid, rsmerge), 0)
+
+    def test_update_snp_id_keys(self):
+        rsmerge = {123: 456}
+
+        self.assertEqual(snptk.core.update_snp_id(123, rsmerge), 456)
+        self.assertEqual(snptk.core.update_snp_id('123', rsmerge), 456)
+        self.assertEqual(snptk.core.update_snp_id('rs0123', rsmerge), 'rs0123')
+        self.assertEqual(snptk.core.update_snp_id('exm123', rsmerge), 'exm123')
+
+class TestSnpTkCoreExecuteLoad(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+        # 01.gz is the largest split-file and submitted first, but merged in directory order
+        for fname, rows in (("00.gz", ["1\t2"]), ("01.gz", ["1\t3", "5\t6"] * 1000), ("02.gz", ["1\t4"])):
+            write_gz(join(self.tmp_dir, fname), rows)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_execute_load_shared_pool(self):
+        with snptk.core.WorkerPool(2) as pool:
+            for _ in range(2):
+                result = snptk.core.execute_load(snptk.core.load_refsnp_merged, self.tmp_dir, merge_method="update", pool=pool)
+
+                self.assertEqual(result, {1: 4, 5: 6})
+
+    def test_spool_parent(self):
+        self.assertEqual(snptk.core.spool_parent(2**62), tempfile.gettempdir())
+
+        if os.path.isdir("/dev/shm"):
+            self.assertEqual(snptk.core.spool_parent(0), "/dev/shm")
+
+        snptk.core.set_spool_dir(self.tmp_dir)
+
+        try:
+            self.assertEqual(snptk.core.spool_parent(2**62), self.tmp_dir)
+            self.assertEqual(snptk.core.execute_load(snptk.core.load_refsnp_merged, self.tmp_dir, merge_method="update"), {1: 4, 5: 6})
+        finally:
+            del os.environ["SNPTK_SPOOL_DIR"]
+
+    def test_segment_merge_methods(self):
+        def roundtrip(partials, merge_method):
+            result = set() if merge_method == "set" else {}
+
+            for partial in partials:
+                snptk.core.merge_segment(result, snptk.core.load_segment(lambda source: partial, None, (), self.tmp_dir, merge_method), merge_method)
+
+            return result
+
+        self.assertEqual(
+            roundtrip([{1: coordinate_key(1, 2), 2: ALT_ONLY, "exm1": ("X", 5)}, {}, {1: coordinate_key(3, 4)}], "update"),
+            {1: coordinate_key(3, 4), 2: ALT_ONLY, "exm1": ("X", 5)})
+
+        self.assertEqual(
+            roundtrip([{coordinate_key(1, 2): [1, 2], ("X", 1): [5]}, {coordinate_key(1, 2): [3], coordinate_key(1, 3): [4, "exm1"]}], "extend"),
+            {coordinate_key(1, 2): [1, 2, 3], coordinate_key(1, 3): [4, "exm1"], ("X", 1): [5]})
+
+        self.assertEqual(roundtrip([{1, 2}, set(), {3, "exm1", 2**64}], "set"), {1, 2, 3, "exm1", 2**64})
+
+    def test_shared_set(self):
+        shared = snptk.core.SharedSet.publish({1, "exm1", coordinate_key(1, 2), ("X", 2)}, self.tmp_dir)
+
+        self.assertEqual(shared.load(), {1, "exm1", coordinate_key(1, 2), ("X", 2)})
+        self.assertIs(shared.load(), shared.load())
+        self.assertEqual(snptk.core.SharedSet.publish(set(), self.tmp_dir).load(), set())
+
+class TestSnpTkCoreLoadDbSnp(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.dbsnp = join(self.tmp_dir, "dbsnp.gz")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_dbsnp_separators(self):
+        for rows in (
+                ["456\t2\t3434343\t0", "123\t1\t1900500\t0", "790\tAltOnly\t55", "5\tMT\t20\t1", "6\tM\t20\t0"],
+                ["456 2 3434343 0", "123 1 1900500 0", "790 AltOnly 55", "5 MT 20 1", "6 M 20 0"],
+                ["456  2 3434343\t0", "", " 123 1\t1900500 0", "790 AltOnly\t55", "5\tMT 20 1", "6 M  20 0"],
+                ["456\t2\t3434343\t0", "789\tAltOnly\t\t", "123\t1\t1900500\t0", "790\tAltOnly\t55", "5\tMT\t20\t1", "6\tM\t20\t0"]):
+            fname = write_gz(self.dbsnp, rows)
+
+            self.assertEqual(
+                snptk.core.load_dbsnp_by_snp_id(fname, {123, 790, 5, 77, "exm5"}, 1),
+                {123: coordinate_key(1, 1900501), 790: ALT_ONLY, 5: coordinate_key(26, 21)})
+
+            self.assertEqual(
+                snptk.core.load_dbsnp_by_coordinate(fname, {coordinate_key(1, 1900501), coordinate_key(26, 21), coordinate_key(2, 3434343), ("X", 21)}, 1),
+                {coordinate_key(1, 1900501): [123], coordinate_key(26, 21): [5, 6]})
+
+    def test_execute_load_releases_filter_sets(self):
+        fname = write_gz(self.dbsnp, ["123\t1\t1900500\t0"])
+        snp_ids = {123}
+
+        self.assertEqual(snptk.core.execute_load(snptk.core.load_dbsnp_by_snp_id, fname, snp_ids, 1), {123: coordinate_key(1, 1900501)})
+        self.assertEqual(snptk.core._derived, {})
+
+    def test_dbsnp_column(self):
+        for data in (
+                b"456\t2\t3434343\t0\n789\tAltOnly\t\t\n5\tNotOn\t\t0\n123\t1\t1900500\t0\n",
+                b"456 2 3434343 0\n789 AltOnly  \n\n 5\t1 \t 20\r\n  \n6 M 20 0",
+                b"456\t2\t3434343\t0\n123\t1\t1900500\t0"):
+            lines = data.split(b"\n")
+
+            for n in range(5):
+                self.assertEqual(list(snptk.core.dbsnp_column(data, lines, n)), [fields[n] if len(fields) > n else b"" for fields in map(bytes.split, lines)])
+
+    def test_load_refsnp_merged(self):
+        for rows in (["1\t2", "3\t4"], ["1 2", " 3  4 5"]):
+            self.assertEqual(snptk.core.load_refsnp_merged(write_gz(self.dbsnp, rows)), {1: 2, 3: 4})
@@ -0,0 +1,186 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from os.path import join
+
+import snptk.app
+import snptk.core
+import snptk.index
+
+from snptk.keys import ALT_ONLY, coordinate_key, parse_coordinate
+from tests.helpers import read_maps, write_gz
+
+class TestSnpTkRsIdIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+        self.dbsnp = join(self.tmp_dir, "dbsnp.gz")
+
+        write_gz(self.dbsnp, [
+            ["456", "2", "3434343", "0"],
+            ["123", "1", "1900500", "0"],
+            ["789", "AltOnly", "", ""],
+            ["790", "AltOnly", "55"],
+            ["999", "X", "100", "1"],
+            ["123", "1", "1900600", "0"]])
+
+        self.index = join(self.tmp_dir, "dbsnp.idx")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_build_and_lookup_matches_loader(self):
+        snp_ids = {123, 456, 790, 999, 111, "chr1:123", "rs0123"}
+
+        snptk.index.build_rs_id_index(self.dbsnp, self.index, buffer_records=2, tmp_dir=self.tmp_dir)
+
+        self.assertTrue(snptk.index.is_rs_id_index(self.index))
+        self.assertFalse(snptk.index.is_rs_id_index(self.dbsnp))
+
+        expected = snptk.core.load_dbsnp_by_snp_id(self.dbsnp, snp_ids, 1)
+
+        self.assertEqual(snptk.index.load_dbsnp_by_snp_id(self.index, snp_ids, 1), expected)
+        self.assertEqual(expected[123], coordinate_key(1, 1900601))
+        self.assertEqual(expected[790], ALT_ONLY)
+
+    def test_build_from_split_directory(self):
+        split_dir = join(self.tmp_dir, "split")
+        os.makedirs(split_dir)
+
+        write_gz(join(split_dir, "00"), [["123", "1", "10", "0"]])
+        write_gz(join(split_dir, "01"), [["5", "MT", "20", "0"]])
+
+        self.assertEqual(snptk.index.build_rs_id_index(split_dir, self.index), 2)
+        self.assertEqual(snptk.index.load_dbsnp_by_snp_id(self.index, {5, 123}), {5: coordinate_key(26, 20), 123: coordinate_key(1, 10)})
+
+    def test_unknown_chromosome_skipped_like_loader(self):
+        write_gz(self.dbsnp, [["123", "Un", "10", "0"], ["456", "2", "20", "0"]])
+
+        stderr = io.StringIO()
+
+        with contextlib.redirect_stderr(stderr):
+            expected = snptk.core.load_dbsnp_by_snp_id(self.dbsnp, {123, 456})
+            snptk.index.build_rs_id_index(self.dbsnp, self.index)
+
+        self.assertEqual(expected, {456: coordinate_key(2, 20)})
+        self.assertEqual(snptk.index.load_dbsnp_by_snp_id(self.index, {123, 456}), expected)
+        self.assertEqual(stderr.getvalue().count("Warning: skipped 1 entries"), 2)
+
+class TestSnpTkCoordinateIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+        self.dbsnp = join(self.tmp_dir, "dbsnp.gz")
+
+        write_gz(self.dbsnp, [
+            ["456", "2", "3434343", "0"],
+            ["123", "1", "1900500", "0"],
+            ["789", "1", "1900500", "1"],
+            ["791", "1", "77"],
+            ["999", "X", "100", "1"],
+            ["5", "MT", "20", "0"]])
+
+        self.index = join(self.tmp_dir, "dbsnp.idx")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_build_and_lookup_matches_loader(self):
+        coordinates = set(map(parse_coordinate, ["1:1900501", "2:3434344", "23:101", "26:21", "1:78", "1:5", "X:101", "0:101"]))
+
+        snptk.index.build_coordinate_index(self.dbsnp, self.index, buffer_records=3, tmp_dir=self.tmp_dir)
+
+        self.assertTrue(snptk.index.is_coordinate_index(self.index))
+
+        expected = snptk.core.load_dbsnp_by_coordinate(self.dbsnp, coordinates, 1)
+
+        self.assertEqual(snptk.index.load_dbsnp_by_coordinate(self.index, coordinates, 1), expected)
+        self.assertEqual(expected[coordinate_key(1, 1900501)], [123, 789])
+
+    def test_unknown_chromosome_skipped_like_loader(self):
+        write_gz(self.dbsnp, [["123", "Un", "10", "0"], ["456", "2", "10", "0"]])
+        coordinates = {coordinate_key(2, 10)}
+
+        stderr = io.StringIO()
+
+        with contextlib.redirect_stderr(stderr):
+            expected = snptk.core.load_dbsnp_by_coordinate(self.dbsnp, coordinates)
+            snptk.index.build_coordinate_index(self.dbsnp, self.index)
+
+        self.assertEqual(expected, {coordinate_key(2, 10): [456]})
+        self.assertEqual(snptk.index.load_dbsnp_by_coordinate(self.index, coordinates), expected)
+        self.assertEqual(stderr.getvalue().count("Warning: skipped 1 entries"), 2)
+
+class TestSnpTkRefSnpMergedIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+        self.refsnp_merged = join(self.tmp_dir, "refsnp-merged.gz")
+
+        write_gz(self.refsnp_merged, [
+            ["123", "456"],
+            ["456", "789"],
+            ["789", "1000"],
+            ["10", "11"],
+            ["11", "12"],
+            ["12", "10"],
+            ["9", "10"]])
+
+        self.index = join(self.tmp_dir, "refsnp-merged.idx")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_resolve_refsnp_merged(self):
+        resolved, cycles = snptk.index.resolve_refsnp_merged({123: 456, 456: 789, 789: 1000, 10: 11, 11: 12, 12: 10, 9: 10})
+
+        self.assertEqual(resolved, {123: 1000, 456: 1000, 789: 1000, 10: None, 11: None, 12: None, 9: None})
+        self.assertEqual(cycles, [[10, 11, 12]])
+
+    def test_update_snp_ids_matches_update_snp_id(self):
+        snp_ids = ["rs123", "456", "rs789", "rs1000", "rs0123", "exm-123", "rs77", "rs9", "rs10", "rs12"]
+
+        refsnp_merged = snptk.core.load_refsnp_merged(self.refsnp_merged)
+
+        expected = [snptk.core.update_snp_id(snp_id, refsnp_merged) for snp_id in snp_ids]
+
+        snptk.index.build_refsnp_merged_index(self.refsnp_merged, self.index)
+
+        with snptk.index.RefSnpMergedIndex(self.index) as index:
+            self.assertEqual(index.update_snp_ids(snp_ids), expected)
+            self.assertEqual(index.update_snp_ids(["rs9", "rs10"]), [9, 10])
+
+    def test_update_snp_id_cycle(self):
+        self.assertEqual(snptk.core.update_snp_id("rs10", {10: 11, 11: 10}), 10)
+        self.assertEqual(snptk.core.update_snp_id("rs9", {9: 10, 10: 11, 11: 10}), 9)
+
+    def test_merge_cycle_maps_like_gzip(self):
+        bim = join(self.tmp_dir, "input.bim")
+
+        with open(bim, "w") as f:
+            for i, snp_id in enumerate(["rs10", "rs9", "rs123", "rs12", "rs5"]):
+                print(f"1\t{snp_id}\t0\t{100 + i}\tA\tG", file=f)
+
+        dbsnp = join(self.tmp_dir, "dbsnp.gz")
+        write_gz(dbsnp, [["10", "1", "99", "0"], ["9", "2", "100", "0"], ["1000", "1", "102", "0"], ["5", "1", "103", "0"]])
+
+        snptk.index.build_refsnp_merged_index(self.refsnp_merged, self.index)
+
+        maps = []
+
+        for refsnp_merged in (self.refsnp_merged, self.index):
+            output_map_dir = join(self.tmp_dir, os.path.basename(refsnp_merged) + "-maps")
+
+            snptk.app.map_using_rs_id({
+                "bim_offset": 0, "dbsnp": dbsnp, "dbsnp_offset": 1, "include_file": None, "refsnp_merged": refsnp_merged,
+                "input_bim": bim, "output_map_dir": output_map_dir, "jobs": 1, "max_memory": None})
+
+            maps.append(read_maps(output_map_dir))
+
+        self.assertEqual(maps[0], maps[1])
+        self.assertEqual(maps[0]["updated_snps.txt"], "rs123\trs1000\n")
+        self.assertEqual(maps[0]["deleted_snps.txt"], "rs12\n")
@@ -0,0 +1,44 @@
+import unittest
+
+import snptk.keys
+
+from snptk.keys import coordinate_key, coordinate_str, parse_coordinate, rsid_key, rsid_str, unpack_coordinate
+
+class TestSnpTkKeys(unittest.TestCase):
+    def test_rsid_key(self):
+        self.assertEqual(rsid_key("rs123"), 123)
+
+        for snp_id in ("exm123", "rs0123", "rs", "rs12a", "123", "chr1:100"):
+            self.assertEqual(rsid_key(snp_id), snp_id)
+
+        for snp_id in ("rs123", "rs1", "exm123", "rs0123", "123"):
+            self.assertEqual(rsid_str(rsid_key(snp_id)), snp_id)
+
+    def test_is_rsid(self):
+        self.assertTrue(snptk.keys.is_rsid(123))
+        self.assertTrue(snptk.keys.is_rsid("rs0123"))
+        self.assertFalse(snptk.keys.is_rsid("123"))
+
+    def test_coordinate_key(self):
+        self.assertEqual(unpack_coordinate(coordinate_key("1", 100)), (1, 100))
+        self.assertEqual(unpack_coordinate(coordinate_key(26, 2**32 - 1)), (26, 2**32 - 1))
+
+        # Distinct from the packed keys of the same numbers
+        self.assertEqual(coordinate_key("X", 100), ("X", 100))
+        self.assertEqual(coordinate_key("01", 100), ("01", 100))
+        self.assertEqual(coordinate_key("1", -1), (1, -1))
+        self.assertEqual(coordinate_key("1", 2**32), (1, 2**32))
+
+        self.assertNotEqual(coordinate_key("23", 100), coordinate_key("X", 100))
+        self.assertNotEqual(coordinate_key("1", 0), coordinate_key("0", 1))
+
+    def test_parse_coordinate(self):
+        for coordinate in ("1:100", "0:0", "26:4294967295", "X:100", "1:-5", "1:4294967296"):
+            self.assertEqual(coordinate_str(parse_coordinate(coordinate)), coordinate)
+
+        self.assertIsNone(parse_coordinate("1:abc"))
+        self.assertIsNone(parse_coordinate("1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
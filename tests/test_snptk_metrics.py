@@ -0,0 +1,91 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from os.path import join
+
+import snptk.core
+import snptk.metrics
+
+from snptk.keys import coordinate_key
+
+class TestSnpTkMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+        self.dbsnp_dir = join(self.tmp_dir, "dbsnp")
+        os.makedirs(self.dbsnp_dir)
+
+        for n in range(2):
+            with gzip.open(join(self.dbsnp_dir, f"{n:02d}.gz"), "wt") as f:
+                for i in range(100):
+                    print(f"{n * 100 + i}\t1\t{i}\t0", file=f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_stage_without_recording(self):
+        with snptk.metrics.stage("noop"):
+            pass
+
+        self.assertIsNone(snptk.metrics._recorder)
+
+    def test_recording(self):
+        metrics_json = join(self.tmp_dir, "metrics.json")
+        profile_dir = join(self.tmp_dir, "profile")
+
+        with snptk.metrics.recording("test", metrics_json=metrics_json, profile_dir=profile_dir):
+            with snptk.metrics.stage("load dbsnp"):
+                with snptk.core.WorkerPool(2) as pool:
+                    dbsnp = snptk.core.execute_load(snptk.core.load_dbsnp_by_snp_id, self.dbsnp_dir, {1, 150}, pool=pool)
+
+            with snptk.metrics.stage("logic"):
+                with snptk.metrics.stage("nested"):
+                    pass
+
+        self.assertEqual(dbsnp, {1: coordinate_key(1, 1), 150: coordinate_key(1, 50)})
+
+        with open(metrics_json) as f:
+            metrics = json.load(f)
+
+        self.assertEqual(metrics["command"], "test")
+        self.assertEqual([stage["name"] for stage in metrics["stages"]], ["load dbsnp", "logic"])
+
+        load = metrics["stages"][0]
+
+        self.assertEqual(sorted(w["source"] for w in load["workers"]), [join(self.dbsnp_dir, "00.gz"), join(self.dbsnp_dir, "01.gz")])
+        self.assertEqual(load["lines"], 200)
+        self.assertEqual(metrics["lines"], 200)
+
+        for key in ("wall_s", "cpu_s", "children_cpu_s", "peak_rss_mb", "children_peak_rss_mb", "lines_per_s"):
+            self.assertIn(key, load)
+
+        self.assertEqual(sorted(os.listdir(profile_dir)), ["00-load_dbsnp.prof", "01-logic.prof"])
+        self.assertIsNone(snptk.metrics._recorder)
+
+    def test_prefilter_false_positives(self):
+        metrics_json = join(self.tmp_dir, "metrics.json")
+
+        # Position 5 of chromosome 1 passes the position prefilter for 2:5 in both files
+        with snptk.metrics.recording("test", metrics_json=metrics_json):
+            with snptk.metrics.stage("load_dbsnp"):
+                with snptk.core.WorkerPool(2) as pool:
+                    dbsnp = snptk.core.execute_load(snptk.core.load_dbsnp_by_coordinate, self.dbsnp_dir, {coordinate_key(2, 5), coordinate_key(1, 7)}, merge_method="extend", pool=pool)
+
+            with snptk.metrics.stage("logic"):
+                pass
+
+        self.assertEqual(dbsnp, {coordinate_key(1, 7): [7, 107]})
+
+        with open(metrics_json) as f:
+            load, logic = json.load(f)["stages"]
+
+        self.assertEqual(
+            {name: load[name] for name in snptk.metrics.PREFILTER_COUNTERS},
+            {"prefilter_lines": 200, "prefilter_candidates": 4, "prefilter_false_positives": 2})
+
+        self.assertAlmostEqual(load["prefilter_false_positive_rate"], 2 / 198, places=6)
+        self.assertNotIn("prefilter_lines", logic)
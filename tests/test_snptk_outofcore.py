@@ -0,0 +1,115 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from os.path import join
+
+import snptk.app
+import snptk.index
+import snptk.outofcore
+
+from tests.helpers import read_maps, write_gz
+
+class TestSnpTkOutOfCoreMapUsingRsId(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+        rng = random.Random(21)
+
+        # Enough entries to spill runs with the smallest sort buffers
+        n = 3000
+
+        bim = []
+
+        for i in range(n):
+            snp_id = rng.choice(["rs" + str(rng.randrange(1, n)), "rs" + str(rng.randrange(1, n)), "exm" + str(i), str(rng.randrange(1, n))])
+            bim.append([rng.choice(["1", "2", "23"]), snp_id, "0", str(rng.randrange(1, 1000)), "A", "G"])
+
+        # Acyclic merge chains: rsids only merge into higher rsids, some twice (last entry wins)
+        refsnp_merged = [[str(old), str(rng.randrange(old + 1, n + 100))] for old in rng.sample(range(1, n), n // 3)]
+        refsnp_merged += rng.sample(refsnp_merged, 20)
+
+        dbsnp = [[str(rsid), rng.choice(["1", "2", "X"]), str(rng.randrange(1, 1000))] for rsid in rng.sample(range(1, n + 100), n // 2)]
+        dbsnp += [[str(rsid), "1"] for rsid in rng.sample(range(1, n + 100), 50)]
+        dbsnp += [[str(rsid), "Un", str(rng.randrange(1, 1000))] for rsid in rng.sample(range(1, n + 100), 50)]
+
+        self.bim = join(self.tmp_dir, "input.bim")
+
+        with open(self.bim, "w") as f:
+            for row in bim:
+                print("\t".join(row), file=f)
+
+        self.refsnp_merged = join(self.tmp_dir, "refsnp-merged.gz")
+        write_gz(self.refsnp_merged, refsnp_merged)
+
+        self.dbsnp = join(self.tmp_dir, "dbsnp.gz")
+        write_gz(self.dbsnp, dbsnp)
+
+        self.include_file = join(self.tmp_dir, "include.gz")
+        write_gz(self.include_file, [[str(rsid)] for rsid in rng.sample(range(1, n + 100), 200)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def map_using_rs_id(self, name, dbsnp, refsnp_merged, max_memory=None):
+        output_map_dir = join(self.tmp_dir, name)
+
+        snptk.app.map_using_rs_id({
+            "bim_offset": 0,
+            "dbsnp": dbsnp,
+            "dbsnp_offset": 1,
+            "include_file": self.include_file,
+            "refsnp_merged": refsnp_merged,
+            "input_bim": self.bim,
+            "output_map_dir": output_map_dir,
+            "jobs": 1,
+            "max_memory": max_memory,
+            "tmp_dir": self.tmp_dir})
+
+        return read_maps(output_map_dir)
+
+    def test_matches_in_memory(self):
+        expected = self.map_using_rs_id("in_memory", self.dbsnp, self.refsnp_merged)
+
+        self.assertTrue(all(expected.values()))
+        self.assertEqual(self.map_using_rs_id("out_of_core", self.dbsnp, self.refsnp_merged, max_memory=1), expected)
+
+        # Only the output map directories are left, the sort runs are removed
+        self.assertEqual(sorted(f for f in os.listdir(self.tmp_dir) if f.endswith(".run")), [])
+
+    def test_matches_in_memory_with_indexes(self):
+        expected = self.map_using_rs_id("in_memory", self.dbsnp, self.refsnp_merged)
+
+        rs_id_index = join(self.tmp_dir, "dbsnp.idx")
+        refsnp_merged_index = join(self.tmp_dir, "refsnp-merged.idx")
+
+        snptk.index.build_rs_id_index(self.dbsnp, rs_id_index)
+        snptk.index.build_refsnp_merged_index(self.refsnp_merged, refsnp_merged_index)
+
+        self.assertEqual(self.map_using_rs_id("out_of_core", rs_id_index, refsnp_merged_index, max_memory=1), expected)
+
+    def test_merge_cycle(self):
+        write_gz(self.refsnp_merged, [["10", "11"], ["11", "12"], ["12", "10"], ["9", "10"], ["5", "6"]])
+
+        with open(self.bim, "w") as f:
+            for snp_id in ("rs10", "rs9", "rs12", "rs5"):
+                print(f"1\t{snp_id}\t0\t100\tA\tG", file=f)
+
+        expected = self.map_using_rs_id("in_memory", self.dbsnp, self.refsnp_merged)
+
+        self.assertEqual(self.map_using_rs_id("out_of_core", self.dbsnp, self.refsnp_merged, max_memory=1), expected)
+
+    def test_sorted_lookup(self):
+        lookup = snptk.outofcore.SortedLookup([("a", 1), ("b", 1), ("b", 2), ("d", 1)])
+
+        self.assertEqual(lookup.get("a"), ("a", 1))
+        self.assertEqual(lookup.get("b"), ("b", 2))
+        self.assertEqual(lookup.get("c"), None)
+        self.assertEqual(lookup.get("d"), ("d", 1))
+        self.assertEqual(lookup.get("e"), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,257 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from os.path import join
+
+import snptk.app
+import snptk.bim
+import snptk.plink
+
+BIM = [
+    ["1", "rs1", "0", "100", "A", "G"],
+    ["1", "rs2", "0", "200", "C", "T"],
+    ["1", "rs3", "0", "300", "A", "C"],
+    ["2", "rs4", "0", "100", "G", "T"],
+    ["2", "rs5", "0", "200", "A", "T"]]
+
+def write_fileset(prefix, bim, n_samples):
+    row_size = (n_samples + 3) // 4
+
+    with open(prefix + ".bim", "w") as f:
+        for row in bim:
+            print("\t".join(row), file=f)
+
+    with open(prefix + ".fam", "w") as f:
+        for n in range(n_samples):
+            print(f"F{n} I{n} 0 0 0 -9", file=f)
+
+    with open(prefix + ".bed", "wb") as f:
+        f.write(snptk.plink.BED_MAGIC)
+
+        for i in range(len(bim)):
+            f.write(bytes([i + 1]) * row_size)
+
+def encode(genotypes):
+    row = bytearray((len(genotypes) + 3) // 4)
+
+    for n, genotype in enumerate(genotypes):
+        row[n // 4] |= genotype << (2 * (n % 4))
+
+    return bytes(row)
+
+def read_fileset(prefix):
+    with open(prefix + ".bim") as f:
+        bim = [line.split() for line in f]
+
+    with open(prefix + ".bed", "rb") as f:
+        bed = f.read()
+
+    return bim, bed
+
+class TestSnpTkPlink(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.input_prefix = join(self.tmp_dir, "input")
+        self.output_prefix = join(self.tmp_dir, "output")
+
+        write_fileset(self.input_prefix, BIM, 5)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_runs(self):
+        self.assertEqual(list(snptk.plink.runs([0, 1, 2, 5, 6, 3])), [(0, 3), (5, 7), (3, 4)])
+        self.assertEqual(list(snptk.plink.runs([])), [])
+
+    def test_rewrite(self):
+        n = snptk.plink.rewrite(
+            self.input_prefix, self.output_prefix,
+            exclude={"rs2"}, names={"rs3": "rs33", "rs5": "rs55"}, positions={"rs33": "301"}, chromosomes={"rs1": "1"})
+
+        bim, bed = read_fileset(self.output_prefix)
+
+        self.assertEqual(n, 4)
+        self.assertEqual(bim, [BIM[0], ["1", "rs33", "0", "301", "A", "C"], BIM[3], ["2", "rs55", "0", "200", "A", "T"]])
+        self.assertEqual(bed, snptk.plink.BED_MAGIC + b"\x01\x01\x03\x03\x04\x04\x05\x05")
+
+        with open(self.input_prefix + ".fam") as f_in, open(self.output_prefix + ".fam") as f_out:
+            self.assertEqual(f_in.read(), f_out.read())
+
+    def test_rewrite_sorts_like_plink(self):
+        snptk.plink.rewrite(self.input_prefix, self.output_prefix, positions={"rs1": "250"}, chromosomes={"rs5": "1"})
+
+        bim, bed = read_fileset(self.output_prefix)
+
+        self.assertEqual([row[1] for row in bim], ["rs2", "rs5", "rs1", "rs3", "rs4"])
+        self.assertEqual(bed, snptk.plink.BED_MAGIC + b"\x02\x02\x05\x05\x01\x01\x03\x03\x04\x04")
+
+    def test_bed_size_mismatch(self):
+        write_fileset(self.input_prefix, BIM, 8)
+
+        with open(self.input_prefix + ".fam", "a") as f:
+            print("F8 I8 0 0 0 -9", file=f)
+
+        with self.assertRaises(ValueError):
+            snptk.plink.rewrite(self.input_prefix, self.output_prefix)
+
+    def test_update_from_map_native(self):
+        map_dir = join(self.tmp_dir, "map")
+        os.makedirs(map_dir)
+
+        for fname, rows in (
+                ("deleted_snps.txt", ["rs4"]),
+                ("updated_snps.txt", ["rs1\trs11"]),
+                ("coord_update.txt", ["rs11\t150"]),
+                ("chr_update.txt", ["rs5\t3"])):
+            with open(join(map_dir, fname), "w") as f:
+                print("\n".join(rows), file=f)
+
+        snptk.app.update_from_map({
+            "plink": "plink", "map_dir": map_dir, "input_prefix": self.input_prefix, "output_prefix": self.output_prefix,
+            "dry_run": False, "native": True})
+
+        bim, bed = read_fileset(self.output_prefix)
+
+        self.assertEqual(bim, [["1", "rs11", "0", "150", "A", "G"], BIM[1], BIM[2], ["3", "rs5", "0", "200", "A", "T"]])
+        self.assertEqual(bed, snptk.plink.BED_MAGIC + b"\x01\x01\x02\x02\x03\x03\x05\x05")
+
+    def test_plink_chromosome(self):
+        self.assertEqual([snptk.plink.plink_chromosome(c) for c in ["1", "01", "chr2", "X", "chrX", "y", "XY", "MT", "M", "0", "GL000192.1"]],
+                         ["1", "1", "2", "23", "23", "24", "25", "26", "26", "0", "GL000192.1"])
+
+    def write_sex_chromosome_maps(self):
+        bim = BIM[:3] + [["X", "rs4", "0", "100", "G", "T"], ["MT", "rs5", "0", "200", "A", "T"]]
+        write_fileset(self.input_prefix, bim, 5)
+
+        map_dir = join(self.tmp_dir, "map")
+        os.makedirs(map_dir)
+
+        for fname, rows in (
+                ("deleted_snps.txt", ["rs2"]),
+                ("updated_snps.txt", ["rs4\trs44"]),
+                ("coord_update.txt", ["rs44\t150"]),
+                ("chr_update.txt", ["rs1\tchr1"])):
+            with open(join(map_dir, fname), "w") as f:
+                print("\n".join(rows), file=f)
+
+        return map_dir
+
+    def test_update_from_map_native_chromosome_codes(self):
+        map_dir = self.write_sex_chromosome_maps()
+
+        snptk.app.update_from_map({
+            "plink": "plink", "map_dir": map_dir, "input_prefix": self.input_prefix, "output_prefix": self.output_prefix,
+            "dry_run": False, "native": True})
+
+        bim, bed = read_fileset(self.output_prefix)
+
+        self.assertEqual(bim, [BIM[0], BIM[2], ["23", "rs44", "0", "150", "G", "T"], ["26", "rs5", "0", "200", "A", "T"]])
+        self.assertEqual(bed, snptk.plink.BED_MAGIC + b"\x01\x01\x03\x03\x04\x04\x05\x05")
+
+    @unittest.skipUnless(shutil.which("plink"), "plink is not installed")
+    def test_update_from_map_native_matches_plink(self):
+        map_dir = self.write_sex_chromosome_maps()
+
+        results = []
+
+        for native in (False, True):
+            output_prefix = f"{self.output_prefix}-{native}"
+
+            snptk.app.update_from_map({
+                "plink": "plink", "map_dir": map_dir, "input_prefix": self.input_prefix, "output_prefix": output_prefix,
+                "dry_run": False, "native": native})
+
+            bim, _ = read_fileset(output_prefix)
+
+            # plink may swap the alleles (and their genotypes) to make allele 1 the minor one
+            results.append([(row[0], row[1], row[3]) for row in bim])
+
+        self.assertEqual(results[0], results[1])
+
+class TestSnpTkPlinkRemoveDuplicates(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.input_prefix = join(self.tmp_dir, "input")
+
+        self.bim = BIM + [
+            ["1", "rs6", "0", "100", "G", "A"],
+            ["2", "rs7", "0", "100", "G", "C"],
+            ["3", "rs3", "0", "500", "A", "C"],
+            ["3", "rs8", "0", "500", "C", "A"],
+            ["4", ".", "0", "1", "A", "C"],
+            ["4", ".", "0", "2", "A", "C"]]
+
+        write_fileset(self.input_prefix, self.bim, 6)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_duplicate_groups(self):
+        bim = snptk.bim.load_bim(self.input_prefix + ".bim")
+
+        self.assertEqual(snptk.plink.duplicate_groups(bim), [[0, 5], [2, 7, 8]])
+
+    def test_remove_duplicates_native(self):
+        output_dir = join(self.tmp_dir, "output")
+
+        snptk.app.remove_duplicates({
+            "plink": "plink", "bcftools": "bcftools", "dry_run": False, "native": True, "keep_best_called": False, "use_maf": False,
+            "input_prefix": self.input_prefix, "output_prefix": output_dir})
+
+        bim, bed = read_fileset(join(output_dir, "input"))
+
+        kept = [0, 1, 2, 3, 4, 6, 9, 10]
+
+        self.assertEqual(bim, [self.bim[i] for i in kept])
+        self.assertEqual(bed, snptk.plink.BED_MAGIC + b"".join(bytes([i + 1]) * 2 for i in kept))
+
+        with open(join(output_dir, "input_duplicates.txt")) as f:
+            self.assertEqual([line.split() for line in f], [self.bim[5], self.bim[7], self.bim[8]])
+
+    def test_genotype_counts(self):
+        rows = [
+            encode([0, 0, 0, 0, 0, 0, 0, 0, 0]),
+            encode([1, 1, 1, 1, 1, 1, 1, 1, 1]),
+            encode([0, 2, 3, 1, 2, 3, 3, 1, 0])]
+
+        with open(self.input_prefix + ".bed", "wb") as f:
+            f.write(snptk.plink.BED_MAGIC + b"".join(rows))
+
+        with snptk.plink.Bed(self.input_prefix + ".bed", 3, 9) as bed:
+            self.assertEqual([bed.genotype_counts(i) for i in range(3)], [(0, 18), (9, 0), (2, 6)])
+            self.assertEqual(bed.call_rate(2), 7 / 9)
+            self.assertEqual(bed.maf(2), 6 / 14)
+            self.assertEqual(bed.maf(1), 0.0)
+
+    def test_keep_best_called(self):
+        with open(self.input_prefix + ".bed", "wb") as f:
+            f.write(snptk.plink.BED_MAGIC)
+
+            for i in range(len(self.bim)):
+                f.write({
+                    0: encode([1, 1, 0, 0, 0, 0]),
+                    5: encode([1, 0, 0, 0, 0, 0]),
+                    2: encode([0, 0, 0, 0, 0, 0]),
+                    7: encode([2, 2, 0, 0, 0, 0]),
+                    8: encode([2, 0, 0, 0, 0, 0])}.get(i, encode([0] * 6)))
+
+        with snptk.plink.Bed(self.input_prefix + ".bed", len(self.bim), 6) as bed:
+            self.assertEqual(snptk.plink.best_called(bed, [0, 5]), 5)
+            self.assertEqual(snptk.plink.best_called(bed, [2, 7, 8]), 2)
+            self.assertEqual(snptk.plink.best_called(bed, [2, 7, 8], use_maf=True), 7)
+
+        output_prefix = join(self.tmp_dir, "output")
+
+        removed = snptk.plink.remove_duplicates(self.input_prefix, output_prefix, lambda bed, group: snptk.plink.best_called(bed, group, True))
+
+        self.assertEqual([row["snp_id"] for row in removed], ["rs1", "rs3", "rs8"])
+
+        # --use-maf implies --keep-best-called
+        snptk.app.remove_duplicates({
+            "plink": "plink", "bcftools": "bcftools", "dry_run": False, "native": False, "keep_best_called": False, "use_maf": True,
+            "input_prefix": self.input_prefix, "output_prefix": output_prefix})
+
+        with open(join(output_prefix, "input_duplicates.txt")) as f:
+            self.assertEqual([line.split()[1] for line in f], ["rs1", "rs3", "rs8"])
@@ -0,0 +1,28 @@
+import json
+import unittest
+
+import snptk.refsnp
+
+class TestSnpTkRefSnp(unittest.TestCase):
+    def test_dbsnp_fields(self):
+        annotation = {"seq_id": "NC_000001.11", "genes": [{"orientation": "minus"}]}
+
+        d = {
+            "refsnp_id": "123",
+            "present_obs_movements": [{"allele_in_cur_release": {"position": 456}}],
+            "primary_snapshot_data": {"allele_annotations": [
+                {"frequency": [{"observation": {"position": 1}}], "assembly_annotation": [annotation]},
+                {"assembly_annotation": []}]}}
+
+        for doc in (json.dumps(d), json.dumps(d, separators=(",", ":")), json.dumps(dict(reversed(list(d.items()))))):
+            self.assertEqual(snptk.refsnp.dbsnp_fields(doc), ("123", "456", annotation))
+
+        d["present_obs_movements"] = []
+        d["primary_snapshot_data"]["allele_annotations"][0]["assembly_annotation"] = []
+
+        self.assertEqual(snptk.refsnp.dbsnp_fields(json.dumps(d)), ("123", None, None))
+
+    def test_merged_fields(self):
+        self.assertEqual(snptk.refsnp.merged_fields('{"refsnp_id": "1", "merged_snapshot_data": {"merged_into": ["2", "3"]}}'), ("1", "2"))
+        self.assertEqual(snptk.refsnp.merged_fields('{"refsnp_id":"1","merged_snapshot_data":{"merged_into":[]}}'), ("1", None))
+        self.assertEqual(snptk.refsnp.merged_fields('{"refsnp_id": "1"}'), ("1", None))
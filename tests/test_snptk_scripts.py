@@ -0,0 +1,161 @@
+import bz2
+import gzip
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from os.path import join
+
+import snptk.compress
+
+from tests.helpers import run_script
+
+def read_gz(fname):
+    with gzip.open(fname, "rt") as f:
+        return f.read()
+
+def refsnp_doc(refsnp_id, position=None, orientations=None):
+    """
+    Return a RefSNP JSON document line, without assembly annotation if orientations is None.
+    """
+
+    annotations = [{"seq_id": "NC_000001.11", "genes": [{"orientation": o} for o in orientations]}] if orientations is not None else []
+
+    return json.dumps({
+        "refsnp_id": str(refsnp_id),
+        "present_obs_movements": [{"allele_in_cur_release": {"position": position}}] if position is not None else [],
+        "primary_snapshot_data": {"allele_annotations": [{"assembly_annotation": annotations}]}})
+
+class TestSnpTkParseJson(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+        self.fnames = []
+
+        for chromosome in ("1", "2", "X", "MT"):
+            fname = join(self.tmp_dir, f"refsnp-chr{chromosome}.json.bz2")
+
+            with bz2.open(fname, "wt") as f:
+                for n in range(300):
+                    rsid = 1000 * len(self.fnames) + n
+                    print(refsnp_doc(rsid, *[
+                        (100 + n, ["plus"]), (100 + n, ["minus", "plus"]), (100 + n, []), (100 + n, None), ()][n % 5]), file=f)
+
+            self.fnames.append(fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parallel_matches_serial(self):
+        outputs = []
+
+        for jobs in ("1", "3"):
+            outfile = join(self.tmp_dir, f"dbsnp-{jobs}")
+
+            run_script("snptk-parse-json.py", "--method", "dbsnp", "--outfile", outfile, "--jobs", jobs, *self.fnames)
+
+            outputs.append(read_gz(outfile + ".gz"))
+
+        self.assertEqual(outputs[0], outputs[1])
+
+        lines = outputs[0].splitlines()
+
+        # Every fifth document has no position
+        self.assertEqual(len(lines), 4 * 240)
+        self.assertEqual(lines[:4], ["0 1 100 0", "1 1 101 1", "2 1 102 -", "3 1 103 -"])
+        self.assertEqual(lines[-1], "3298 MT 398 -")
+
+class TestSnpTkExtractRefSnpMerged(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.refsnp_merged = join(self.tmp_dir, "refsnp-merged.json.bz2")
+
+        self.expected = []
+
+        # Level 1 compresses in blocks of 100k, enough lines for several tasks of the workers
+        with bz2.open(self.refsnp_merged, "wt", compresslevel=1) as f:
+            for rsid in range(1, 30000):
+                merged_into = [str(rsid * 7 + 1), str(rsid)] if rsid % 11 else []
+
+                print(json.dumps({"refsnp_id": str(rsid), "merged_snapshot_data": {"merged_into": merged_into}}), file=f)
+
+                if merged_into:
+                    self.expected.append(f"{rsid}\t{merged_into[0]}")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parallel_matches_serial(self):
+        self.assertGreater(len(snptk.compress.bz2_blocks(self.refsnp_merged)), 8)
+
+        for split in ("1", "3"):
+            outputs = []
+
+            for jobs in ("1", "4"):
+                output_path = join(self.tmp_dir, f"merged-{split}-{jobs}")
+
+                run_script("extract-refsnp-merged.py", "--split", split, "--jobs", jobs, self.refsnp_merged, output_path)
+
+                if split == "1":
+                    outputs.append([read_gz(output_path)])
+                else:
+                    outputs.append([read_gz(join(output_path, fname)) for fname in sorted(os.listdir(output_path))])
+
+            self.assertEqual(outputs[0], outputs[1])
+
+            # Round robin: entry n (from 1) goes to the split-file at index n % split
+            files = [output.splitlines() for output in outputs[0]]
+
+            self.assertEqual(files, [[line for n, line in enumerate(self.expected, 1) if n % len(files) == i] for i in range(len(files))])
+
+class TestSnpTkMapGrch37Chromosomes(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+        rng = random.Random(20)
+
+        self.grch37 = join(self.tmp_dir, "grch37.gz")
+        self.grch38 = join(self.tmp_dir, "grch38.gz")
+
+        # rsids 1-1500 in GRCh37 and 500-2000 in GRCh38, some of them more than once on either side
+        with gzip.open(self.grch37, "wt") as f:
+            for n in range(1800):
+                rsid = rng.randrange(1, 1500) if n % 6 == 0 else n % 1500 + 1
+                chromosome = "NT_113878.1" if n % 50 == 0 else f"NC_0000{rng.randrange(1, 23):02}.10"
+                print(f"rs{rsid} {chromosome} {rng.randrange(1, 10**8)}", file=f)
+
+        with gzip.open(self.grch38, "wt") as f:
+            for n in range(1700):
+                rsid = rng.randrange(500, 2000) if n % 5 == 0 else n % 1500 + 500
+                print(f"{rsid} {rng.choice(['1', '2', 'X'])} {rng.randrange(1, 10**8)} {rng.choice(['0', '1'])}", file=f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_external_sort_matches_dict_join(self):
+        outputs = []
+
+        for extra_args in ([], ["--external-sort", "--buffer-records", "100", "--tmp-dir", self.tmp_dir]):
+            outfile = join(self.tmp_dir, f"grch37-{len(extra_args)}")
+
+            run_script("snptk-map-grch37-chromosomes.py", "--grch37_dbsnp", self.grch37, "--grch38_dbsnp", self.grch38, "--outfile", outfile, *extra_args)
+
+            # The dict join writes the multi entries in set order
+            outputs.append((read_gz(outfile + ".gz").splitlines(), sorted(read_gz(outfile + "_multi_entries.gz").splitlines())))
+
+        self.assertEqual(outputs[0], outputs[1])
+
+        lines, multi_entries = outputs[0]
+        rsids = [line.split()[0] for line in lines]
+
+        self.assertTrue(lines and multi_entries)
+        self.assertEqual(len(rsids), len(set(rsids)))
+        self.assertTrue(set(rsids).isdisjoint(multi_entries))
+        self.assertTrue(all(500 <= int(rsid) < 2000 for rsid in rsids + multi_entries))
+
+
+if __name__ == "__main__":
+    unittest.main()
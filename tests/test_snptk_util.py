@@ -0,0 +1,75 @@
+import shutil
+import tempfile
+import unittest
+
+from os.path import join
+
+import snptk.app
+import snptk.util
+
+from snptk.keys import coordinate_key
+
+class TestSnpTkUtilDebug(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_file = join(self.tmp_dir, "snptk.log")
+
+        snptk.util.configure(level=1, log_file=self.log_file, sample_size=2)
+
+    def tearDown(self):
+        snptk.util.configure(level=0, log_file="", sample_size=snptk.util.SAMPLE_SIZE)
+        snptk.util.tallies.clear()
+
+        shutil.rmtree(self.tmp_dir)
+
+    def read_log(self):
+        with open(self.log_file) as f:
+            return [line.split(" ", 3)[3].rstrip("\n") for line in f]
+
+    def test_debug_levels(self):
+        snptk.util.debug("Loading %s...", "dbsnp.gz")
+        snptk.util.debug("Not logged %s", "at level 2", level=2)
+        snptk.util.debug("100%")
+
+        self.assertTrue(snptk.util.debug_enabled())
+        self.assertFalse(snptk.util.debug_enabled(2))
+        self.assertEqual(self.read_log(), ["DEBUG(1): Loading dbsnp.gz...", "DEBUG(1): 100%"])
+
+    def test_tally_samples_and_counts(self):
+        for i in range(5):
+            snptk.util.tally("NO_MATCH", "rs%d", i)
+
+        snptk.util.tally("MULTI", "rs%d", 9)
+        snptk.util.debug_tallies("test")
+
+        self.assertEqual(self.read_log(), [
+            "DEBUG(1): NO_MATCH: rs0", "DEBUG(1): NO_MATCH: rs1", "DEBUG(1): MULTI: rs9", "DEBUG(1): test: NO_MATCH=5, MULTI=1"])
+
+        self.assertFalse(snptk.util.tallies)
+
+    def test_map_using_coord_logic_tallies(self):
+        bim_entries = [
+            {"chromosome": "1", "snp_id": "rs1", "distance": "0", "position": "100", "allele_1": "A", "allele_2": "G"},
+            {"chromosome": "1", "snp_id": "rs2", "distance": "0", "position": "200", "allele_1": "A", "allele_2": "G"},
+            {"chromosome": "1", "snp_id": "rs3", "distance": "0", "position": "300", "allele_1": "A", "allele_2": "G"}]
+
+        dbsnp = {coordinate_key(1, 100): [10], coordinate_key(1, 200): [2]}
+
+        snptk.app.map_using_coord_logic(bim_entries, {1, 2, 3}, dbsnp)
+
+        self.assertEqual(self.read_log(), [
+            "DEBUG(1): REWROTE: Rewrote snp_id rs1 to rs10 for position 1:100",
+            "DEBUG(1): NO_MATCH: 1\trs3\t0\t300\tA\tG",
+            "DEBUG(1): map_using_coord_logic: REWROTE=1, NO_MATCH=1"])
+
+
+class TestSnpTkUtilParseMemory(unittest.TestCase):
+    def test_parse_memory(self):
+        self.assertEqual(snptk.util.parse_memory("512M"), 512 * 2**20)
+        self.assertEqual(snptk.util.parse_memory("4g"), 4 * 2**30)
+        self.assertEqual(snptk.util.parse_memory("1.5GB"), 3 * 2**29)
+        self.assertEqual(snptk.util.parse_memory("64K"), 64 * 2**10)
+        self.assertEqual(snptk.util.parse_memory("4096"), 4 * 2**30)
+
+        with self.assertRaises(ValueError):
+            snptk.util.parse_memory("lots")